@@ -0,0 +1,4 @@
+from flaskr import create_app
+from flaskr.asgi import create_asgi_app
+
+app = create_asgi_app(create_app())
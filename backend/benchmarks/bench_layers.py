@@ -0,0 +1,113 @@
+"""
+Microbenchmarks of the repository, serializer and decorator layers, in the
+pytest-benchmark style. The file is not collected by the functional test
+run, pass it explicitly:
+
+    python -m pytest benchmarks/bench_layers.py --benchmark-json=results.json
+
+BENCH_QUESTIONS (10000) and BENCH_CATEGORIES (20) size the seeded database.
+"""
+import pytest
+from flask import jsonify
+
+from benchmarks.common import vocabulary
+from decorators import json_response
+from models import db
+from schemas import QuestionCollectionSchema
+from serializers import compile_schema
+
+
+@pytest.fixture
+def repository(app_context):
+    return app_context.services.questions.question_repository
+
+
+@pytest.fixture
+def listing(app_context):
+    return app_context.services.questions.list(page=5, limit=10)
+
+
+@pytest.mark.benchmark(group="repository")
+def test_listing_page(benchmark, repository):
+    def run():
+        repository.page(repository.listing(), page=50, limit=10)
+        db.session.expunge_all()
+
+    benchmark(run)
+
+
+@pytest.mark.benchmark(group="repository")
+def test_listing_keyset(benchmark, repository):
+    def run():
+        repository.keyset(repository.listing(category_id=1), after_id=5000, limit=10)
+        db.session.expunge_all()
+
+    benchmark(run)
+
+
+@pytest.mark.benchmark(group="repository")
+def test_listing_count(benchmark, repository):
+    benchmark(repository.count, category_id=1)
+
+
+@pytest.mark.benchmark(group="repository")
+def test_search(benchmark, repository):
+    term = vocabulary()[0][:4]
+
+    def run():
+        repository.search(term).limit(10).all()
+        db.session.expunge_all()
+
+    benchmark(run)
+
+
+@pytest.mark.benchmark(group="repository")
+def test_quiz_sample(benchmark, repository):
+    exclude = list(range(1, 21))
+
+    def run():
+        repository.sample(5, category_id=1, exclude=exclude)
+        db.session.expunge_all()
+
+    benchmark(run)
+
+
+@pytest.mark.benchmark(group="repository")
+def test_id_index_load(benchmark, repository):
+    def run():
+        repository.id_index.invalidate()
+        repository.id_index.ids(db.session)
+
+    benchmark(run)
+
+
+@pytest.mark.benchmark(group="serializer")
+def test_marshmallow_dump(benchmark, listing):
+    schema = QuestionCollectionSchema()
+    benchmark(lambda: jsonify(schema.dump(listing)))
+
+
+@pytest.mark.benchmark(group="serializer")
+def test_compiled_dump(benchmark, listing):
+    serialize = compile_schema(QuestionCollectionSchema())
+    benchmark(lambda: json_response(serialize(listing)))
+
+
+@pytest.mark.benchmark(group="decorators")
+def test_get_questions_request(benchmark, app):
+    client = app.test_client()
+    benchmark(lambda: client.get("/api/questions?page=5"))
+
+
+@pytest.mark.benchmark(group="decorators")
+def test_get_questions_not_modified(benchmark, app):
+    client = app.test_client()
+    etag = client.get("/api/questions?page=5").headers["ETag"]
+    benchmark(lambda: client.get("/api/questions?page=5", headers={"If-None-Match": etag}))
+
+
+@pytest.mark.benchmark(group="decorators")
+def test_get_quiz_request(benchmark, app):
+    app.rate_limiter.rate = app.rate_limiter.burst = 10 ** 9
+    client = app.test_client()
+    benchmark(lambda: client.post("/api/quizzes", json={"quiz_category": 1}))
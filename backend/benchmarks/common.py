@@ -0,0 +1,112 @@
+import atexit
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+from flaskr import create_app, grading
+from models import setup_db, db, Question, QuestionCount, Category
+
+
+def make_app(database_path=None):
+    """
+    Build an app bound to a throwaway SQLite file, the same way the
+    functional tests do, so benchmarks never touch the real database.
+    The file is removed when the process exits.
+    """
+    if database_path is None:
+        handle, path = tempfile.mkstemp(suffix=".db", prefix="trivia_bench_")
+        os.close(handle)
+        atexit.register(_remove, path)
+        database_path = "sqlite:///{}".format(path)
+    app = create_app()
+    setup_db(app, database_path)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def vocabulary(size=2000, seed=0):
+    """Deterministic pseudo words, so search benchmarks have realistic text."""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [
+        "".join(rng.choice(letters) for _ in range(rng.randint(3, 10)))
+        for _ in range(size)
+    ]
+
+
+def seed(categories=5, questions=1000, batch_size=10000):
+    """
+    Insert categories and random questions with Core executemany, then
+    bring the question_counts and answer_forms tables the repositories
+    maintain on writes up to date with them.
+    """
+    rng = random.Random(questions)
+    words = vocabulary()
+    db.session.execute(
+        Category.__table__.insert(),
+        [{"type": "category {}".format(n)} for n in range(1, categories + 1)],
+    )
+    rows = []
+    for n in range(questions):
+        rows.append(
+            {
+                "question": " ".join(rng.choice(words) for _ in range(8)) + "?",
+                "answer": " ".join(rng.choice(words) for _ in range(2)),
+                "category_id": (n % categories) + 1,
+                "difficulty": rng.randint(1, 5),
+            }
+        )
+        if len(rows) >= batch_size:
+            db.session.execute(Question.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(Question.__table__.insert(), rows)
+    QuestionCount.reconcile(db.session)
+    grading.backfill(db.session)
+    db.session.commit()
+
+
+def commit_info():
+    """Commit the results were measured at, for the saved JSON results."""
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    return {"id": commit.decode().strip()}
+
+
+def timeit(fn, repeat=50):
+    """Return the mean time per call of fn in milliseconds."""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def report(title, columns, rows):
+    print(title)
+    print(" | ".join("{:>14}".format(column) for column in columns))
+    for row in rows:
+        print(
+            " | ".join(
+                "{:>14.3f}".format(value)
+                if isinstance(value, float)
+                else "{:>14}".format(value)
+                for value in row
+            )
+        )
+    print()
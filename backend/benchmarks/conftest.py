@@ -0,0 +1,142 @@
+"""
+Fixtures of the layer microbenchmarks (benchmarks/bench_layers.py).
+
+The `benchmark` fixture comes from pytest-benchmark when it is installed.
+Without it a minimal stand-in with the same call style times the function
+and writes the results, in the same JSON layout, to --benchmark-json.
+"""
+import datetime
+import json
+import os
+import platform
+import statistics
+import time
+
+import pytest
+
+from benchmarks.common import commit_info, make_app, seed
+
+try:
+    import pytest_benchmark
+except ImportError:
+    pytest_benchmark = None
+
+QUESTIONS = int(os.environ.get("BENCH_QUESTIONS", 10000))
+CATEGORIES = int(os.environ.get("BENCH_CATEGORIES", 20))
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = make_app()
+    with app.app_context():
+        seed(categories=CATEGORIES, questions=QUESTIONS)
+    return app
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield app
+
+
+if pytest_benchmark is None:
+    RESULTS = []
+
+    class Benchmark(object):
+        """Time fn over rounds until min_time seconds passed, like pytest-benchmark."""
+
+        min_rounds = 5
+        min_time = 0.5
+
+        def __init__(self, name, group=None):
+            self.name = name
+            self.group = group
+
+        def __call__(self, fn, *args, **kwargs):
+            result = fn(*args, **kwargs)
+            timings = []
+            started = time.perf_counter()
+            while (
+                len(timings) < self.min_rounds
+                or time.perf_counter() - started < self.min_time
+            ):
+                start = time.perf_counter()
+                result = fn(*args, **kwargs)
+                timings.append(time.perf_counter() - start)
+            mean = statistics.mean(timings)
+            RESULTS.append(
+                {
+                    "name": self.name,
+                    "group": self.group,
+                    "stats": {
+                        "min": min(timings),
+                        "max": max(timings),
+                        "mean": mean,
+                        "median": statistics.median(timings),
+                        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0,
+                        "rounds": len(timings),
+                        "ops": 1 / mean if mean else 0,
+                    },
+                }
+            )
+            return result
+
+    @pytest.fixture
+    def benchmark(request):
+        marker = request.node.get_closest_marker("benchmark")
+        group = marker.kwargs.get("group") if marker else None
+        return Benchmark(request.node.name, group)
+
+    def pytest_addoption(parser):
+        parser.addoption(
+            "--benchmark-json",
+            default=None,
+            help="Write the benchmark results to this JSON file",
+        )
+
+    def pytest_configure(config):
+        config.addinivalue_line("markers", "benchmark(group): benchmark options")
+
+    def pytest_terminal_summary(terminalreporter):
+        if not RESULTS:
+            return
+        terminalreporter.write_sep("-", "benchmarks (ms)")
+        terminalreporter.write_line(
+            "{:<50} {:>10} {:>10} {:>10} {:>8}".format(
+                "name", "min", "median", "mean", "rounds"
+            )
+        )
+        for result in RESULTS:
+            stats = result["stats"]
+            terminalreporter.write_line(
+                "{:<50} {:>10.3f} {:>10.3f} {:>10.3f} {:>8}".format(
+                    result["name"],
+                    stats["min"] * 1000,
+                    stats["median"] * 1000,
+                    stats["mean"] * 1000,
+                    stats["rounds"],
+                )
+            )
+
+    def pytest_sessionfinish(session):
+        path = session.config.getoption("--benchmark-json", None)
+        if not path or not RESULTS:
+            return
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "machine_info": {
+                        "node": platform.node(),
+                        "python_version": platform.python_version(),
+                        "machine": platform.machine(),
+                        "system": platform.system(),
+                    },
+                    "commit_info": commit_info(),
+                    "benchmarks": RESULTS,
+                    "datetime": datetime.datetime.utcnow().isoformat(),
+                    "questions": QUESTIONS,
+                    "categories": CATEGORIES,
+                },
+                file,
+                indent=2,
+            )
@@ -0,0 +1,61 @@
+"""
+Fill a database with synthetic categories and questions, to run the API or
+the load generator against a realistic question bank.
+
+    python -m benchmarks.generate sqlite:////tmp/trivia_bench.db --categories 20 --questions 100000
+    python -m benchmarks.generate postgresql://localhost:5432/trivia_bench --reset
+
+The schema is brought up to date with the migrations first. Questions are
+spread evenly over the categories, with pseudo word text and random
+difficulties, always the same for the same arguments.
+"""
+import argparse
+import time
+
+from benchmarks.common import seed
+from flaskr import create_app
+from models import setup_db, db, Question, Category
+import migrations
+
+
+def generate(database_path, categories=20, questions=100000, reset=False):
+    app = create_app()
+    setup_db(app, database_path)
+    with app.app_context():
+        if reset:
+            db.drop_all()
+            migrations.schema_migrations.drop(db.engine, checkfirst=True)
+        list(migrations.upgrade(db.engine))
+        if db.session.query(Category.id).first() is not None:
+            raise SystemExit(
+                "{} already holds categories, pass --reset to replace them".format(
+                    database_path
+                )
+            )
+        start = time.perf_counter()
+        seed(categories=categories, questions=questions)
+        elapsed = time.perf_counter() - start
+        return db.session.query(Question.id).count(), elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("database", help="SQLAlchemy URL of the database to fill")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=100000)
+    parser.add_argument(
+        "--reset", action="store_true", help="Drop the existing tables first"
+    )
+    args = parser.parse_args(argv)
+    count, elapsed = generate(
+        args.database, args.categories, args.questions, reset=args.reset
+    )
+    print(
+        "{} questions in {} categories generated in {:.1f}s".format(
+            count, args.categories, elapsed
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+HTTP load generator reporting throughput and latency percentiles per route.
+
+Start one or more servers against the same database, for example
+
+    gunicorn -w 4 --threads 8 -b :5000 "flaskr:create_app()"
+    uvicorn --workers 4 --port 5001 asgi:app
+
+and point the generator at them, for a single request
+
+    python -m benchmarks.load http://localhost:5000 http://localhost:5001 \
+        --path /api/quizzes --method POST --body '{"quiz_category": 0}'
+
+or for every preset route (or the ones picked with --route):
+
+    python -m benchmarks.load http://localhost:5000 --json results.json
+
+With --local N and no URL, an app is served in process on a throwaway
+SQLite database seeded with N questions. Every URL and route gets the same
+number of requests from the same number of concurrent keep-alive
+connections. --json saves the results to track them across releases.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import platform
+import threading
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.common import commit_info, make_app, report, seed, vocabulary
+from flaskr.rate_limit import TokenBucketLimiter
+
+# name: (method, path, JSON body)
+ROUTES = {
+    "categories": ("GET", "/api/categories", None),
+    "questions": ("GET", "/api/questions", None),
+    "questions_page_5": ("GET", "/api/questions?page=5", None),
+    "questions_category": ("GET", "/api/categories/1/questions", None),
+    "search": ("GET", "/api/questions?search_term={}".format(vocabulary()[0][:4]), None),
+    "quiz": ("POST", "/api/quizzes", {"quiz_category": 0}),
+    "quiz_round": ("POST", "/api/quizzes/round", {"quiz_category": 0, "count": 5}),
+}
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by the server")
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, value = line.decode("latin-1").split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get("content-length", 0)))
+    connection = headers.get("connection", "").lower()
+    if status_line.startswith(b"HTTP/1.0"):
+        return status, connection == "keep-alive"
+    return status, connection != "close"
+
+
+class Worker(object):
+    """One keep-alive connection sending requests back to back."""
+
+    def __init__(self, url, method, body):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        self.request = (
+            "{} {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n"
+            "Content-Length: {}\r\n\r\n".format(
+                method, path, parts.netloc, len(body)
+            ).encode()
+            + body
+        )
+        self.connection = None
+
+    async def send(self):
+        if self.connection is None:
+            self.connection = await asyncio.open_connection(self.host, self.port)
+        reader, writer = self.connection
+        writer.write(self.request)
+        await writer.drain()
+        status, keep_alive = await read_response(reader)
+        if not keep_alive:
+            self.close()
+        return status
+
+    def close(self):
+        if self.connection is not None:
+            self.connection[1].close()
+            self.connection = None
+
+
+async def run(url, requests, concurrency, method="GET", body=b""):
+    latencies = []
+    errors = 0
+    remaining = [requests]
+
+    async def loop(worker):
+        nonlocal errors
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                status = await worker.send()
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+                worker.close()
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            # Rejected by the rate limiter or failed
+            if status == 429 or status >= 500:
+                errors += 1
+        worker.close()
+
+    workers = [Worker(url, method, body) for _ in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*[loop(worker) for worker in workers])
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def serve_local(questions):
+    """Serve an app seeded with questions on a free local port, return its URL."""
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    app = make_app()
+    app.rate_limiter = TokenBucketLimiter(rate=10 ** 9, burst=10 ** 9)
+    with app.app_context():
+        seed(categories=20, questions=questions)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return "http://127.0.0.1:{}".format(server.server_port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("urls", nargs="*", help="Base URLs of the servers to compare")
+    parser.add_argument(
+        "--route",
+        action="append",
+        choices=sorted(ROUTES),
+        help="Preset route to load, repeat for several (default: all of them)",
+    )
+    parser.add_argument("--path", help="Load a single path instead of the presets")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--body", default="", help="JSON request body")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument(
+        "--local", type=int, metavar="QUESTIONS", help="Serve a seeded app in process"
+    )
+    parser.add_argument("--json", help="Save the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    if args.local:
+        urls.append(serve_local(args.local))
+    if not urls:
+        parser.error("pass at least one URL or --local")
+    if args.path:
+        routes = [(args.path, args.method.upper(), args.path, args.body.encode())]
+    else:
+        routes = [
+            (
+                name,
+                ROUTES[name][0],
+                ROUTES[name][1],
+                json.dumps(ROUTES[name][2]).encode() if ROUTES[name][2] else b"",
+            )
+            for name in args.route or sorted(ROUTES)
+        ]
+
+    results = []
+    for name, method, path, body in routes:
+        for url in urls:
+            result = asyncio.run(
+                run(
+                    url.rstrip("/") + path,
+                    args.requests,
+                    args.concurrency,
+                    method=method,
+                    body=body,
+                )
+            )
+            result.update(route=name, method=method, path=path, server=url)
+            results.append(result)
+    report(
+        "Load test ({} requests, {} connections)".format(
+            args.requests, args.concurrency
+        ),
+        (
+            "route",
+            "server",
+            "requests",
+            "errors",
+            "req/s",
+            "p50 (ms)",
+            "p95 (ms)",
+            "p99 (ms)",
+        ),
+        [
+            (
+                result["route"],
+                result["server"],
+                result["requests"],
+                result["errors"],
+                result["rps"],
+                result["p50"],
+                result["p95"],
+                result["p99"],
+            )
+            for result in results
+        ],
+    )
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(
+                {
+                    "machine_info": {
+                        "node": platform.node(),
+                        "python_version": platform.python_version(),
+                    },
+                    "commit_info": commit_info(),
+                    "datetime": datetime.datetime.utcnow().isoformat(),
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
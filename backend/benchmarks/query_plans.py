@@ -0,0 +1,86 @@
+"""
+Show the query plans and timings of the hot question queries before and
+after the indexes added by migration 2.
+
+    python -m benchmarks.query_plans
+"""
+import sys
+
+from sqlalchemy import text
+
+from benchmarks.common import make_app, seed, timeit, report
+from migrations import create_question_indexes
+from models import db
+
+SIZE = 100000
+# Ids of category 3 drawn by a quiz turn, spread over the table
+SAMPLE_IDS = ", ".join(str(3 + 5 * 1999 * n) for n in range(10))
+
+QUERIES = {
+    "category page": (
+        "SELECT id FROM questions WHERE category_id = 3 AND id > 5000 "
+        "ORDER BY id LIMIT 10"
+    ),
+    "category count": "SELECT count(*) FROM questions WHERE category_id = 3",
+    # The primary key IN query QuestionRepository.sample loads its draw with
+    "quiz sample": (
+        "SELECT questions.*, categories.type FROM questions "
+        "LEFT OUTER JOIN categories ON categories.id = questions.category_id "
+        "WHERE questions.id IN ({})".format(SAMPLE_IDS)
+    ),
+    "difficulty band": (
+        "SELECT id FROM questions WHERE category_id = 3 AND difficulty = 2 LIMIT 10"
+    ),
+}
+
+
+def explain(statement):
+    if db.engine.dialect.name == "sqlite":
+        rows = db.session.execute(text("EXPLAIN QUERY PLAN " + statement))
+        return " / ".join(row[-1] for row in rows)
+    rows = db.session.execute(text("EXPLAIN " + statement))
+    return " / ".join(row[0].strip() for row in rows)
+
+
+def measure():
+    plans, timings = {}, {}
+    for name, statement in QUERIES.items():
+        plans[name] = explain(statement)
+        timings[name] = timeit(
+            lambda: db.session.execute(text(statement)).fetchall(), repeat=20
+        )
+    return plans, timings
+
+
+def main(size=SIZE):
+    app = make_app()
+    with app.app_context():
+        seed(questions=size)
+        for index in ("ix_questions_category_id_id", "ix_questions_category_id_difficulty"):
+            db.session.execute(text("DROP INDEX IF EXISTS {}".format(index)))
+        db.session.commit()
+        before_plans, before = measure()
+
+        with db.engine.begin() as connection:
+            create_question_indexes(connection)
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+        after_plans, after = measure()
+
+    for name in QUERIES:
+        print(name)
+        print("  before: {}".format(before_plans[name]))
+        print("  after:  {}".format(after_plans[name]))
+    print()
+    report(
+        "Hot question queries on {} rows (ms per query)".format(size),
+        ("query", "no index", "indexed", "speedup"),
+        [
+            (name, before[name], after[name], before[name] / after[name])
+            for name in QUERIES
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else SIZE)
@@ -0,0 +1,63 @@
+"""
+Throughput of the quiz selection engine per targeting mode as the question
+bank grows, with the time it takes to load the question id index.
+
+    python -m benchmarks.quiz_engine
+    python -m benchmarks.quiz_engine 10000
+"""
+import random
+import sys
+import time
+
+from benchmarks.common import make_app, seed, timeit, report
+from models import db
+
+SIZES = (10000, 100000, 1000000)
+PREVIOUS_QUESTIONS = 20
+
+MODES = (
+    ("uniform", {}),
+    ("difficulty 5", {"difficulty": 5}),
+    ("band 2-4", {"min_difficulty": 2, "max_difficulty": 4}),
+    ("adaptive", {"adaptive": True, "score": 15}),
+)
+
+
+def main(sizes=SIZES):
+    rows = []
+    for size in sizes:
+        app = make_app()
+        with app.app_context():
+            seed(questions=size)
+            quizzes = app.services.quizzes
+            index = app.services.questions.question_repository.id_index
+            start = time.perf_counter()
+            index.ids(db.session)
+            load_ms = (time.perf_counter() - start) * 1000
+            previous = random.sample(range(1, size + 1), PREVIOUS_QUESTIONS)
+            for category_id in (None, 1):
+                for name, options in MODES:
+
+                    def turn():
+                        quizzes.next_question(
+                            category_id=category_id,
+                            previous_questions=previous,
+                            **options
+                        )
+                        db.session.expunge_all()
+
+                    ms = timeit(turn, repeat=500)
+                    rows.append(
+                        (size, category_id or "all", name, ms, 1000 / ms, load_ms)
+                    )
+    report(
+        "Quiz selection engine (one turn, {} previous questions)".format(
+            PREVIOUS_QUESTIONS
+        ),
+        ("questions", "category", "mode", "ms per turn", "turns/s", "index load ms"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main(tuple(int(size) for size in sys.argv[1:]) or SIZES)
@@ -0,0 +1,67 @@
+"""
+Compare the quiz question selection strategies as the question bank grows.
+
+    python -m benchmarks.quiz_selection
+"""
+import random
+import sys
+
+from sqlalchemy import not_
+
+from benchmarks.common import make_app, seed, timeit, report
+from flaskr.repositories.question_repository import QuestionRepository
+from models import db, Question
+
+SIZES = (1000, 10000, 100000)
+PREVIOUS_QUESTIONS = 20
+
+
+def load_all(repository, category_id, exclude):
+    """The original get_quiz strategy: load every candidate, pick one."""
+    query = repository.query
+    if exclude:
+        query = query.filter(not_(Question.id.in_(exclude)))
+    if category_id:
+        query = query.filter(Question.category_id == category_id)
+    questions = query.all()
+    return questions[random.randint(0, len(questions) - 1)]
+
+
+def main(sizes=SIZES):
+    rows = []
+    for size in sizes:
+        app = make_app()
+        with app.app_context():
+            seed(questions=size)
+            repository = QuestionRepository()
+            exclude = random.sample(range(1, size + 1), PREVIOUS_QUESTIONS)
+            for category_id in (None, 1):
+
+                def legacy():
+                    load_all(repository, category_id, exclude)
+                    db.session.expunge_all()
+
+                def sampled():
+                    repository.random(category_id=category_id, exclude=exclude)
+                    db.session.expunge_all()
+
+                legacy_ms = timeit(legacy, repeat=5)
+                sampled_ms = timeit(sampled, repeat=200)
+                rows.append(
+                    (
+                        size,
+                        category_id or "all",
+                        legacy_ms,
+                        sampled_ms,
+                        legacy_ms / sampled_ms,
+                    )
+                )
+    report(
+        "Quiz question selection (ms per turn)",
+        ("questions", "category", "load all", "random()", "speedup"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main(tuple(int(size) for size in sys.argv[1:]) or SIZES)
@@ -0,0 +1,51 @@
+"""
+Compare the ILIKE search path against the full text index as the table grows.
+
+    python -m benchmarks.search
+"""
+import random
+import sys
+
+from benchmarks.common import make_app, seed, timeit, report, vocabulary
+from flaskr import search
+from flaskr.repositories.question_repository import QuestionRepository
+from models import db
+
+SIZES = (1000, 10000, 100000)
+TERMS = 20
+
+
+def main(sizes=SIZES):
+    rng = random.Random(0)
+    terms = [word[:4] for word in rng.sample(vocabulary(), TERMS)]
+    rows = []
+    for size in sizes:
+        app = make_app()
+        with app.app_context():
+            seed(questions=size)
+            repository = QuestionRepository()
+
+            def run(build):
+                for term in terms:
+                    query = build(term)
+                    query.count()
+                    query.limit(10).all()
+                    db.session.expunge_all()
+
+            ilike_ms = timeit(
+                lambda: run(lambda term: search.ilike(repository.filter(), term)),
+                repeat=3,
+            )
+            search_ms = timeit(lambda: run(repository.search), repeat=3)
+            rows.append(
+                (size, ilike_ms / TERMS, search_ms / TERMS, ilike_ms / search_ms)
+            )
+    report(
+        "Question search, count and first page (ms per search)",
+        ("questions", "ilike", "search()", "speedup"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main(tuple(int(size) for size in sys.argv[1:]) or SIZES)
@@ -0,0 +1,71 @@
+"""
+Compare marshmallow dump + jsonify against the compiled serializer used by
+marshal_with(schema, fast=True) for growing page sizes.
+
+    python -m benchmarks.serialization
+"""
+import sys
+
+from flask import jsonify
+
+from benchmarks.common import timeit, report
+from decorators import json_response
+from flaskr import create_app
+from models import Question, Category
+from schemas import QuestionCollectionSchema
+from serializers import compile_schema, orjson
+
+PAGE_SIZES = (10, 50, 200, 1000)
+
+
+def page(size, categories=5):
+    types = [Category(type="category {}".format(n)) for n in range(categories)]
+    for n, category in enumerate(types, start=1):
+        category.id = n
+    questions = []
+    for n in range(size):
+        question = Question(
+            question="question number {}?".format(n),
+            answer="answer {}".format(n),
+            category_id=(n % categories) + 1,
+            difficulty=(n % 5) + 1,
+        )
+        question.id = n + 1
+        question.category = types[n % categories]
+        questions.append(question)
+    return {
+        "questions": questions,
+        "total_questions": size,
+        "categories": types,
+        "current_category": None,
+    }
+
+
+def main(sizes=PAGE_SIZES):
+    app = create_app()
+    schema = QuestionCollectionSchema()
+    serializer = compile_schema(schema)
+    rows = []
+    with app.test_request_context():
+        for size in sizes:
+            data = page(size)
+            assert (
+                json_response(serializer(data)).get_data()
+                == jsonify(schema.dump(data)).get_data()
+            )
+            marshmallow_ms = timeit(lambda: jsonify(schema.dump(data)), repeat=100)
+            compiled_ms = timeit(lambda: json_response(serializer(data)), repeat=100)
+            rows.append(
+                (size, marshmallow_ms, compiled_ms, marshmallow_ms / compiled_ms)
+            )
+    report(
+        "Question page serialization (ms per response, orjson {})".format(
+            "installed" if orjson else "missing"
+        ),
+        ("page size", "marshmallow", "compiled", "speedup"),
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main(tuple(int(size) for size in sys.argv[1:]) or PAGE_SIZES)
@@ -0,0 +1,60 @@
+import gzip
+from flask import request
+from models import get_setting
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+"""
+Negotiated compression of the JSON responses.
+
+Responses of a compressible mimetype and at least COMPRESS_MIN_SIZE bytes
+are encoded with brotli (when installed) or gzip, whichever the client
+prefers in Accept-Encoding. Streamed responses are left alone.
+"""
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "text/plain", "text/csv")
+
+
+def encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data, encoding, level=6, quality=4):
+    if encoding == "br":
+        return brotli.compress(data, quality=quality)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def init_app(app):
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.is_streamed
+            or response.direct_passthrough
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+        data = response.get_data()
+        if len(data) < get_setting(app, "COMPRESS_MIN_SIZE", 1024, int):
+            return response
+        encoding = request.accept_encodings.best_match(encodings())
+        if encoding is None:
+            return response
+        response.set_data(
+            compress(
+                data,
+                encoding,
+                level=get_setting(app, "COMPRESS_LEVEL", 6, int),
+                quality=get_setting(app, "COMPRESS_BR_QUALITY", 4, int),
+            )
+        )
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -1,34 +1,40 @@
+import hashlib
 from functools import wraps
-from flask import request, jsonify
+from urllib.parse import urlencode
+from flask import current_app, g, request, jsonify
 from marshmallow import ValidationError
 from error_handlers import ApiError
+from serializers import compile_schema, dumps
+from models import TableVersion
+from profiling import timed
 
 
 def parse_with(schema):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            form_data = request.form
-            if form_data:
-                data = {}
-                for key in form_data.keys():
-                    if form_data.getlist(key) and len(form_data.getlist(key)) > 1:
-                        data[key] = form_data.getlist(key)
-                    else:
-                        data[key] = form_data[key]
-            else:
-                data = request.get_json()
-            try:
-                entity = schema.load(data)
-            except ValidationError as err:
-                if args:
-                    api_error = args[0]
-                    if isinstance(api_error, ApiError):
-                        return (
-                            jsonify({"error": True, "message": api_error.message}),
-                            api_error.status_code,
-                        )
-                return jsonify(error=True, messages=err.messages), 400
+            with timed("parse"):
+                form_data = request.form
+                if form_data:
+                    data = {}
+                    for key in form_data.keys():
+                        if form_data.getlist(key) and len(form_data.getlist(key)) > 1:
+                            data[key] = form_data.getlist(key)
+                        else:
+                            data[key] = form_data[key]
+                else:
+                    data = request.get_json()
+                try:
+                    entity = schema.load(data)
+                except ValidationError as err:
+                    if args:
+                        api_error = args[0]
+                        if isinstance(api_error, ApiError):
+                            return (
+                                jsonify({"error": True, "message": api_error.message}),
+                                api_error.status_code,
+                            )
+                    return jsonify(error=True, messages=err.messages), 400
             return f(entity, *args, **kwargs)
 
         return decorated_function
@@ -44,15 +50,209 @@ def get_status_code_success(method):
     return 200
 
 
-def marshal_with(schema):
+def json_response(data):
+    """
+    jsonify with the compiled encoder, falling back to jsonify itself when the
+    app settings would make the output differ.
+    """
+    config = current_app.config
+    if (
+        current_app.debug
+        or config.get("JSONIFY_PRETTYPRINT_REGULAR")
+        or not config.get("JSON_SORT_KEYS", True)
+        or not config.get("JSON_AS_ASCII", True)
+    ):
+        return jsonify(data)
+    return current_app.response_class(
+        dumps(data) + b"\n", mimetype=config.get("JSONIFY_MIMETYPE", "application/json")
+    )
+
+
+def split_fields(value):
+    return tuple(sorted(set(name.strip() for name in value.split(",") if name.strip())))
+
+
+def selected_schema(schema, selectable, fields, exclude):
+    """
+    Copy of schema restricted with only= to the fields of its nested
+    selectable field, and without the top level fields listed in exclude.
+    """
+    for name in exclude:
+        if name not in schema.fields:
+            raise ApiError(message="Unknown field {}".format(name))
+    only = None
+    if fields:
+        nested = schema.fields[selectable]
+        nested = getattr(nested, "inner", nested)
+        for name in fields:
+            if name not in nested.schema.fields:
+                raise ApiError(message="Unknown field {}".format(name))
+        only = [name for name in schema.fields if name != selectable] + [
+            "{}.{}".format(selectable, name) for name in fields
+        ]
+    return schema.__class__(only=only, exclude=exclude)
+
+
+def marshal_with(schema, fast=False, selectable=None):
+    """
+    Dump the view result with schema. With fast=True the schema is compiled
+    once into a plain dict builder and encoded with the fastest available
+    JSON encoder, the response bytes are identical.
+
+    With selectable, the name of a nested field of schema, clients trim the
+    payload with ?fields= (the fields of selectable to return) and
+    ?exclude= (top level fields to leave out).
+    """
+    serializer = compile_schema(schema) if fast else None
+    selections = {}
+
+    def select(fields, exclude):
+        key = (fields, exclude)
+        if key not in selections:
+            if len(selections) >= 64:
+                selections.clear()
+            trimmed = selected_schema(schema, selectable, fields, exclude)
+            selections[key] = (trimmed, compile_schema(trimmed) if fast else None)
+        return selections[key]
+
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            response = schema.dump(f(*args, **kwargs))
-            status_code = response.get(
-                "status_code", get_status_code_success(request.method)
+            current_schema, current_serializer = schema, serializer
+            if selectable:
+                fields = split_fields(request.args.get("fields", ""))
+                exclude = split_fields(request.args.get("exclude", ""))
+                if fields or exclude:
+                    current_schema, current_serializer = select(fields, exclude)
+            result = f(*args, **kwargs)
+            with timed("serialize"):
+                if current_serializer:
+                    response = current_serializer(result)
+                else:
+                    response = current_schema.dump(result)
+                status_code = response.get(
+                    "status_code", get_status_code_success(request.method)
+                )
+                if current_serializer:
+                    return json_response(response), status_code
+                return jsonify(response), status_code
+
+        return decorated_function
+
+    return decorator
+
+
+def request_key():
+    """Method, path and query arguments in a stable order."""
+    return "{} {}?{}".format(
+        request.method, request.path, urlencode(sorted(request.args.items(multi=True)))
+    )
+
+
+def conditional(tables):
+    """
+    Answer GET requests with an ETag derived from the version counters of
+    tables and the request URL. A matching If-None-Match gets a 304 without
+    running the view, every response gets a Cache-Control header so shared
+    caches can serve it for HTTP_CACHE_S_MAXAGE seconds.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            session = current_app.replicas.read_session()
+            versions = TableVersion.current(session, tables)
+            # Repositories build the body from caches of these same versions
+            g.setdefault("table_versions", {}).update(zip(tables, versions))
+            key = "{}|{}".format(
+                request_key(),
+                ",".join("{}:{}".format(*pair) for pair in zip(tables, versions)),
             )
-            return jsonify(response), status_code
+            etag = g.etag = hashlib.sha1(key.encode()).hexdigest()
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = "public, max-age={}, s-maxage={}".format(
+                current_app.config.get("HTTP_CACHE_MAX_AGE", 0),
+                current_app.config.get("HTTP_CACHE_S_MAXAGE", 5),
+            )
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
+def coalesced(f):
+    """
+    Share one run of the view, serialization included, between concurrent
+    identical requests through current_app.single_flight. Placed under
+    conditional the key includes the table versions, so a response is
+    never shared across a write.
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = g.get("etag") or hashlib.sha1(request_key().encode()).hexdigest()
+
+        def run():
+            response = current_app.make_response(f(*args, **kwargs))
+            return "{} {}\n".format(response.status_code, response.mimetype).encode() + (
+                response.get_data()
+            )
+
+        head, body = current_app.single_flight.do(key, run).split(b"\n", 1)
+        status_code, mimetype = head.decode().split(" ", 1)
+        return current_app.response_class(
+            body, status=int(status_code), mimetype=mimetype
+        )
+
+    return decorated_function
+
+
+def client_address(remote_addr, forwarded_for=None, trusted_proxies=0):
+    """
+    Address rate limit buckets are keyed on: the connecting address, or
+    behind trusted_proxies reverse proxies the X-Forwarded-For entry
+    appended by the outermost of them. Entries further left come from the
+    client, which could change them on every request to get a new bucket.
+    """
+    if trusted_proxies and forwarded_for:
+        entries = [entry.strip() for entry in forwarded_for.split(",")]
+        entries = [entry for entry in entries if entry]
+        if entries:
+            return entries[-min(int(trusted_proxies), len(entries))]
+    return remote_addr
+
+
+def rate_limited(name):
+    """
+    Take a token from the bucket of the client for name with
+    current_app.rate_limiter, answering 429 with Retry-After when empty.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            client = client_address(
+                request.remote_addr,
+                ",".join(request.headers.getlist("X-Forwarded-For")),
+                current_app.config.get("RATE_LIMIT_TRUST_PROXY"),
+            )
+            allowed, retry_after = current_app.rate_limiter.allow(
+                "{}:{}".format(name, client)
+            )
+            if not allowed:
+                return (
+                    jsonify(error=True, message="Too many requests, slow down."),
+                    429,
+                    {"Retry-After": str(int(retry_after) + 1)},
+                )
+            return f(*args, **kwargs)
 
         return decorated_function
 
@@ -63,21 +263,22 @@ def parse_request(arguments):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            data = dict(**kwargs)
-            params = request.args
-            for argument in arguments:
-                if params.get(argument.name):
-                    data[argument.name] = argument.type(params.get(argument.name))
-                elif argument.default:
-                    data[argument.name] = argument.default
-                elif argument.required:
-                    return (
-                        jsonify(
-                            error=True,
-                            messages="Parameter {} is required".format(argument.name),
-                        ),
-                        400,
-                    )
+            with timed("parse"):
+                data = dict(**kwargs)
+                params = request.args
+                for argument in arguments:
+                    if params.get(argument.name):
+                        data[argument.name] = argument.type(params.get(argument.name))
+                    elif argument.default:
+                        data[argument.name] = argument.default
+                    elif argument.required:
+                        return (
+                            jsonify(
+                                error=True,
+                                messages="Parameter {} is required".format(argument.name),
+                            ),
+                            400,
+                        )
             return f(*args, **data)
 
         return decorated_function
@@ -85,6 +286,29 @@ def parse_request(arguments):
     return decorator
 
 
+def boolean(value):
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def bounded(minimum, maximum):
+    """Argument type of the integers from minimum to maximum, 400 otherwise."""
+
+    def parse(value):
+        try:
+            number = int(value)
+        except ValueError:
+            number = None
+        if number is None or not minimum <= number <= maximum:
+            raise ApiError(
+                message="Expected an integer from {} to {}, got {}".format(
+                    minimum, maximum, value
+                )
+            )
+        return number
+
+    return parse
+
+
 class Argument(object):
     def __init__(
         self,
@@ -1,28 +1,74 @@
 import os
 from flask_marshmallow import Marshmallow
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, request, abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 from flask_cors import CORS
-import random
 import click
-from decorators import parse_request, Argument, marshal_with, parse_with
+from decorators import (
+    parse_request,
+    Argument,
+    marshal_with,
+    parse_with,
+    boolean,
+    bounded,
+    conditional,
+    coalesced,
+    rate_limited,
+)
 from flaskr.repositories.category_repository import CategoryRepository
 from flaskr.repositories.question_repository import QuestionRepository
+from flaskr.repositories.result_repository import ResultRepository
+from flaskr.quiz_sessions import LRUSessionStore
+from flaskr.single_flight import SingleFlight
+from flaskr.rate_limit import TokenBucketLimiter
+from flaskr.result_buffer import ResultBuffer
+from flaskr.pagination import MAX_PAGE_SIZE
+from flaskr.replicas import ReplicaRouter
+from flaskr import replicas
+from flaskr.services import Services
+from flaskr import search
+from flaskr.bulk import (
+    QuestionImporter,
+    read_rows,
+    guess_format,
+    export_rows,
+    encode_rows,
+    FORMATS,
+    MIMETYPES,
+    MAX_CHUNK_SIZE,
+)
 
-from models import setup_db, Question, Category
+from models import setup_db, get_setting, Category, MAX_ID
 import click
 from schemas import (
     CategorySchema,
     CategoryCreateSchema,
+    QuestionBulkDeleteSchema,
+    QuestionBulkResultSchema,
+    QuestionBulkUpdateSchema,
     QuestionCollectionSchema,
     QuestionCreateSchema,
+    QuestionImportSchema,
     QuestionSchema,
     QuizCreateSchema,
+    QuizRoundCreateSchema,
+    QuizResultCreateSchema,
+    QuizGradeCreateSchema,
+    QuizGradeRoundSchema,
+    QuizGradeSchema,
+    QuizResultSchema,
+    LeaderboardSchema,
+    QuizSessionCreateSchema,
+    QuizSessionSchema,
     ErrorHandlerSchema,
+    quiz_schemas,
 )
 from error_handlers import ApiError
-from sqlalchemy import or_, not_
+import migrations
+import metrics
+import profiling
+import compression
 
 QUESTIONS_PER_PAGE = 10
 
@@ -30,11 +76,105 @@ QUESTIONS_PER_PAGE = 10
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    if test_config:
+        app.config.from_mapping(test_config)
     app.db = setup_db(app)
+    app.replicas = app.config.get("REPLICA_ROUTER") or ReplicaRouter.from_config(
+        app, app.db
+    )
+    replicas.init_app(app)
+    app.quiz_sessions = app.config.get("QUIZ_SESSION_STORE") or LRUSessionStore(
+        max_sessions=app.config.get("QUIZ_SESSION_MAX", 10000)
+    )
+    app.single_flight = app.config.get("SINGLE_FLIGHT") or SingleFlight()
+    app.rate_limiter = app.config.get("RATE_LIMITER") or TokenBucketLimiter(
+        rate=app.config.get("QUIZ_RATE_LIMIT", 5),
+        burst=app.config.get("QUIZ_RATE_BURST", 20),
+    )
     CORS(app, resources={r"/api/*": {"origins": "*"}})
     Marshmallow(app)
     category_repository = CategoryRepository()
     question_repository = QuestionRepository()
+    result_repository = ResultRepository()
+    app.services = services = Services(
+        category_repository, question_repository, result_repository
+    )
+
+    def save_results(results):
+        with app.app_context():
+            services.results.save(results)
+
+    app.quiz_results = ResultBuffer(
+        save_results,
+        max_size=app.config.get("RESULTS_FLUSH_SIZE", 500),
+        interval=app.config.get("RESULTS_FLUSH_INTERVAL", 1.0),
+        max_pending=app.config.get("RESULTS_MAX_PENDING", 100000),
+    )
+    app.metrics = metrics.Registry()
+    app.metrics.register(
+        metrics.Counter(
+            "trivia_category_cache_hits_total",
+            "Category list reads served from cache.",
+            lambda: [({}, category_repository.cache.hits)],
+        )
+    )
+    app.metrics.register(
+        metrics.Counter(
+            "trivia_category_cache_misses_total",
+            "Category list reads that loaded the table.",
+            lambda: [({}, category_repository.cache.misses)],
+        )
+    )
+    app.metrics.register(
+        metrics.Counter(
+            "trivia_coalesced_requests_total",
+            "Requests answered with the response of an identical request in flight.",
+            lambda: [({}, app.single_flight.shared)],
+        )
+    )
+    app.metrics.register(
+        metrics.Counter(
+            "trivia_rate_limited_requests_total",
+            "Quiz requests rejected by the rate limiter.",
+            lambda: [({}, app.rate_limiter.rejected)],
+        )
+    )
+
+    app.metrics.register(
+        metrics.Gauge(
+            "trivia_db_replica_up",
+            "Whether the read replica is in the rotation.",
+            lambda: [
+                ({"database": replica["url"]}, int(replica["up"]))
+                for replica in app.replicas.status()
+            ],
+        )
+    )
+
+    app.metrics.register(
+        metrics.Gauge(
+            "trivia_quiz_results_pending",
+            "Quiz results buffered and not yet written.",
+            lambda: [({}, app.quiz_results.pending)],
+        )
+    )
+    app.metrics.register(
+        metrics.Counter(
+            "trivia_quiz_results_flushed_total",
+            "Quiz results written by the result buffer.",
+            lambda: [({}, app.quiz_results.flushed)],
+        )
+    )
+    app.metrics.register(
+        metrics.Counter(
+            "trivia_quiz_results_dropped_total",
+            "Quiz results refused because the result buffer was full.",
+            lambda: [({}, app.quiz_results.dropped)],
+        )
+    )
+
+    compression.init_app(app)
+    profiling.init_app(app)
 
     @app.after_request
     def after_request(response):
@@ -53,20 +193,22 @@ def create_app(test_config=None):
     """
 
     @app.route("/api/categories", methods=["GET"])
+    @conditional(["categories"])
+    @coalesced
     def get_categories():
-        categories = category_repository.filter().all()
-        return jsonify([category.format() for category in categories])
+        return jsonify(services.categories.list())
 
     @app.route("/api/categories", methods=["POST"])
     @parse_with(CategoryCreateSchema())
     @marshal_with(CategorySchema())
     def create_categories_route(entity):
-        return category_repository.insert(**entity)
+        return services.categories.create(entity)
 
     @app.route("/api/categories/<int:id>")
-    @marshal_with(CategorySchema())
+    @conditional(["categories"])
+    @marshal_with(CategorySchema(), fast=True)
     def get_category(id):
-        return category_repository.get(id)
+        return services.categories.get(id)
 
     """
     Cli command to create categories
@@ -96,6 +238,36 @@ def create_app(test_config=None):
             print("type: {}".format(category.type))
             print("---------------------------------------------------------")
 
+    """
+    Cli commands to apply and list the schema migrations
+    """
+
+    @app.cli.command("migrate_db")
+    def migrate_db():
+        for version, description in migrations.upgrade(app.db.engine):
+            print("Applied migration {}: {}".format(version, description))
+        print("Database is up to date")
+
+    @app.cli.command("list_migrations")
+    def list_migrations():
+        applied = migrations.applied(app.db.engine)
+        for version, description, function in sorted(migrations.MIGRATIONS):
+            print(
+                "{} {}: {}".format(
+                    "[x]" if version in applied else "[ ]", version, description
+                )
+            )
+
+    """
+    Cli command to create the full text search index on an existing database
+    """
+
+    @app.cli.command("create_search_index")
+    def create_search_index():
+        with app.db.engine.begin() as connection:
+            search.install(connection)
+        print("Search index created successfully")
+
     """
     @TODO: 
     Create an endpoint to handle GET requests for questions, 
@@ -126,38 +298,71 @@ def create_app(test_config=None):
     category to be shown. 
     """
 
+    """
+    Passing pagination=cursor (or an after token) switches to keyset pagination:
+    each page returns a next_cursor and total_questions is only computed
+    when include_count=true.
+    """
+
     @app.route("/api/questions", methods=["GET"])
     @app.route("/api/categories/<int:current_category>/questions", methods=["GET"])
+    @conditional(["questions", "categories"])
+    @coalesced
     @parse_request(
         [
             Argument(name="page", default=0, type=int),
-            Argument(name="limit", default=10, type=int),
+            Argument(name="limit", default=10, type=bounded(1, MAX_PAGE_SIZE)),
             Argument(name="search_term", type=str),
+            Argument(name="pagination", default="page", type=str),
+            Argument(name="after", type=str),
+            Argument(name="include_count", type=boolean),
         ]
     )
-    @marshal_with(QuestionCollectionSchema())
-    def get_questions(page=0, limit=10, current_category=None, search_term=None):
-        categories = category_repository.filter().all()
-        query = question_repository.filter()
-        if search_term:
-            query = query.filter(
-                or_(
-                    Question.question.ilike("%{}%".format(search_term)),
-                    Question.answer.ilike("%{}%".format(search_term)),
+    @marshal_with(QuestionCollectionSchema(), fast=True, selectable="questions")
+    def get_questions(
+        page=0,
+        limit=10,
+        current_category=None,
+        search_term=None,
+        pagination="page",
+        after=None,
+        include_count=False,
+    ):
+        return services.questions.list(
+            page=page,
+            limit=limit,
+            current_category=current_category,
+            search_term=search_term,
+            pagination=pagination,
+            after=after,
+            include_count=include_count,
+        )
+
+    """
+    Question counts overall, per difficulty and per category, read from the
+    question_counts table maintained by the question writes.
+    """
+
+    @app.route("/api/stats", methods=["GET"])
+    @conditional(["questions", "categories"])
+    def get_stats():
+        return jsonify(services.questions.stats())
+
+    """
+    Cli command to correct the question counts that drifted from the
+    questions table, after writes made outside the repositories.
+    """
+
+    @app.cli.command("reconcile_question_counts")
+    def reconcile_question_counts():
+        drift = question_repository.reconcile_counts()
+        for (category_id, difficulty), (counted, stored) in sorted(drift.items()):
+            print(
+                "category {} difficulty {}: {} counted, {} stored".format(
+                    category_id, difficulty, counted, stored
                 )
             )
-        if current_category:
-            query = query.filter(Question.category_id == current_category)
-        count = query.count()
-
-        offset = ((page - 1) * limit) + 1 if page > 1 else 0
-        questions = query.limit(limit).offset(offset).all()
-        return {
-            "questions": questions,
-            "total_questions": count,
-            "categories": categories,
-            "current_category": current_category,
-        }
+        print("{} question counts corrected".format(len(drift)))
 
     """
 
@@ -169,12 +374,29 @@ def create_app(test_config=None):
 
     @app.route("/api/questions/<int:id>", methods=["DELETE"])
     def delete_question(id):
-        question_repository.delete(id)
+        services.questions.delete(id)
         return (
             jsonify({"id": id, "error": False, "message": "Item delete successfully"}),
             202,
         )
 
+    """
+    Moderation in bulk: update or delete every question listed in ids, or
+    matching filter, with set based statements in one transaction.
+    """
+
+    @app.route("/api/questions", methods=["PATCH"])
+    @parse_with(QuestionBulkUpdateSchema())
+    @marshal_with(QuestionBulkResultSchema())
+    def bulk_update_questions(entity):
+        return services.questions.bulk_update(entity)
+
+    @app.route("/api/questions", methods=["DELETE"])
+    @parse_with(QuestionBulkDeleteSchema())
+    @marshal_with(QuestionBulkResultSchema())
+    def bulk_delete_questions(entity):
+        return services.questions.bulk_delete(entity)
+
     """
     @TODO: 
     Create an endpoint to POST a new question, 
@@ -189,8 +411,97 @@ def create_app(test_config=None):
     @parse_with(QuestionCreateSchema())
     @marshal_with(QuestionSchema())
     def create_question(entity, *args, **kwargs):
-        category_repository.get(entity["category_id"])
-        return question_repository.insert(**entity)
+        return services.questions.create(entity)
+
+    """
+    Bulk import of questions from a JSON Lines or CSV body, inserted in chunks.
+    """
+
+    @app.route("/api/questions/bulk", methods=["POST"])
+    @parse_request(
+        [
+            Argument(name="format", type=str),
+            Argument(name="chunk_size", type=bounded(1, MAX_CHUNK_SIZE)),
+        ]
+    )
+    @marshal_with(QuestionImportSchema())
+    def import_questions_route(format=None, chunk_size=None):
+        format = format or guess_format(request.mimetype)
+        if format not in FORMATS:
+            raise ApiError(message="Unsupported format {}".format(format))
+        importer = QuestionImporter(
+            question_repository,
+            [category["id"] for category in category_repository.all()],
+            chunk_size=chunk_size or app.config.get("IMPORT_CHUNK_SIZE", 1000),
+        )
+        return importer.run(read_rows(request.stream, format))
+
+    """
+    Cli command to import questions from a JSON Lines or CSV file
+    """
+
+    @app.cli.command("import_questions")
+    @click.argument("file", type=click.File("rb"))
+    @click.option("--format", type=click.Choice(FORMATS), default=None)
+    @click.option("--chunk-size", default=1000, type=click.IntRange(1, MAX_CHUNK_SIZE))
+    def import_questions(file, format, chunk_size):
+        importer = QuestionImporter(
+            question_repository,
+            [category["id"] for category in category_repository.all()],
+            chunk_size=chunk_size,
+        )
+        result = importer.run(read_rows(file, format or guess_format(file.name)))
+        print(
+            "{} questions imported, {} rows failed".format(
+                result["inserted"], result["failed"]
+            )
+        )
+        for error in result["errors"]:
+            print("row {}: {}".format(error["row"], error["messages"]))
+
+    """
+    Streaming export of the question bank as JSON Lines or CSV.
+    """
+
+    @app.route("/api/questions/export", methods=["GET"])
+    @parse_request(
+        [
+            Argument(name="format", default="ndjson", type=str),
+            Argument(name="category", type=bounded(1, MAX_ID)),
+        ]
+    )
+    def export_questions_route(format="ndjson", category=None):
+        if format not in FORMATS:
+            raise ApiError(message="Unsupported format {}".format(format))
+        if category:
+            category_repository.find(category)
+        rows = export_rows(
+            question_repository.read_session,
+            category_id=category,
+            chunk_size=app.config.get("EXPORT_CHUNK_SIZE", 1000),
+        )
+        return Response(
+            stream_with_context(encode_rows(rows, format)),
+            mimetype=MIMETYPES[format],
+            headers={
+                "Content-Disposition": "attachment; filename=questions.{}".format(
+                    format
+                )
+            },
+        )
+
+    """
+    Cli command to export questions to a JSON Lines or CSV file
+    """
+
+    @app.cli.command("export_questions")
+    @click.argument("output", type=click.File("w"), default="-")
+    @click.option("--format", type=click.Choice(FORMATS), default=None)
+    @click.option("--category", type=int, default=None)
+    def export_questions(output, format, category):
+        rows = export_rows(question_repository.read_session, category_id=category)
+        for chunk in encode_rows(rows, format or guess_format(output.name)):
+            output.write(chunk)
 
     """
     @TODO: 
@@ -203,23 +514,142 @@ def create_app(test_config=None):
     and shown whether they were correct or not. 
     """
 
+    quiz_question_schema, quiz_round_schema = quiz_schemas(
+        get_setting(app, "QUIZ_INCLUDE_ANSWERS", False, bool)
+    )
+
     @app.route("/api/quizzes", methods=["POST"])
+    @rate_limited("quizzes")
     @parse_with(QuizCreateSchema())
-    @marshal_with(QuestionSchema())
+    @marshal_with(quiz_question_schema, fast=True)
     def get_quiz(entity, **kwargs):
-        question_ids = entity.get("previous_questions")
-        category_id = entity.get("quiz_category")
-        query = question_repository.query
-        if question_ids:
-            query = query.filter(not_(Question.id.in_(question_ids)))
-        if category_id:
-            category = category_repository.get(category_id)
-            query = query.filter(Question.category_id == category.id)
-        questions = query.all()
-        if not questions:
-            raise ApiError(message="No questions left, game is over.", status_code=404)
-        index = random.randint(0, len(questions) - 1)
-        return questions[index]
+        return services.quizzes.next_question(
+            category_id=entity.get("quiz_category"),
+            previous_questions=entity.get("previous_questions"),
+            difficulty=entity.get("difficulty"),
+            min_difficulty=entity.get("min_difficulty"),
+            max_difficulty=entity.get("max_difficulty"),
+            adaptive=entity.get("adaptive", False),
+            score=entity.get("score", 0),
+        )
+
+    """
+    A whole round of distinct random questions in a single call.
+    """
+
+    @app.route("/api/quizzes/round", methods=["POST"])
+    @rate_limited("quizzes")
+    @parse_with(QuizRoundCreateSchema())
+    @marshal_with(quiz_round_schema, fast=True)
+    def get_quiz_round(entity, **kwargs):
+        return services.quizzes.round(
+            category_id=entity.get("quiz_category"),
+            previous_questions=entity.get("previous_questions"),
+            count=entity.get("count", 5),
+        )
+
+    """
+    Grading of one guess, or of the guesses of a whole round, on the server
+    against the normalized answer forms stored with the questions.
+    """
+
+    @app.route("/api/quizzes/grade", methods=["POST"])
+    @rate_limited("grades")
+    @parse_with(QuizGradeCreateSchema())
+    def grade_answers(entity):
+        if "answers" in entity:
+            graded = services.quizzes.grade(entity["answers"], entity.get("fuzzy"))
+            return jsonify(QuizGradeRoundSchema().dump(graded))
+        result = services.quizzes.grade([entity], entity.get("fuzzy"))
+        return jsonify(QuizGradeSchema().dump(result["results"][0]))
+
+    """
+    Cli command to store the answer forms of the questions missing them,
+    or of every question with --rebuild after the grading rules changed.
+    """
+
+    @app.cli.command("backfill_answer_forms")
+    @click.option("--rebuild", is_flag=True, default=False)
+    def backfill_answer_forms(rebuild):
+        processed = question_repository.backfill_answer_forms(rebuild=rebuild)
+        print("Answer forms stored for {} questions".format(processed))
+
+    """
+    Results of finished quizzes are buffered and written in batches by a
+    background thread, they show in the leaderboards once written.
+    """
+
+    @app.route("/api/quizzes/results", methods=["POST"])
+    @rate_limited("results")
+    @parse_with(QuizResultCreateSchema())
+    def submit_quiz_result(entity):
+        result = services.results.submit(entity)
+        return jsonify(QuizResultSchema().dump(result)), 202
+
+    @app.route("/api/leaderboard", methods=["GET"])
+    @parse_request(
+        [
+            Argument(name="category", type=int),
+            Argument(
+                name="limit", type=bounded(1, ResultRepository.leaderboard_size)
+            ),
+        ]
+    )
+    @marshal_with(LeaderboardSchema())
+    def get_leaderboard(category=None, limit=None):
+        return services.results.leaderboard(category_id=category, limit=limit)
+
+    """
+    Quiz sessions keep a shuffled deck of question ids on the server,
+    so each turn only needs the session id instead of every previous question.
+    """
+
+    @app.route("/api/quizzes/sessions", methods=["POST"])
+    @rate_limited("sessions")
+    @parse_with(QuizSessionCreateSchema())
+    @marshal_with(QuizSessionSchema())
+    def create_quiz_session(entity, **kwargs):
+        return services.quizzes.create_session(entity.get("quiz_category"))
+
+    @app.route("/api/quizzes/sessions/<session_id>/next", methods=["POST"])
+    @rate_limited("quizzes")
+    @marshal_with(quiz_question_schema, fast=True)
+    def get_quiz_session_question(session_id):
+        return services.quizzes.session_question(session_id)
+
+    @app.route("/api/quizzes/sessions/<session_id>", methods=["DELETE"])
+    def delete_quiz_session(session_id):
+        services.quizzes.delete_session(session_id)
+        return (
+            jsonify(
+                {"id": session_id, "error": False, "message": "Item delete successfully"}
+            ),
+            202,
+        )
+
+    """
+    Cli command to aggregate the sampled profiles into a report per route
+    """
+
+    @app.cli.command("profile_report")
+    @click.option("--dir", "directory", default=None)
+    @click.option("--top", default=20)
+    @click.option("--sort", type=click.Choice(["tottime", "cumtime"]), default="tottime")
+    def profile_report(directory, top, sort):
+        directory = directory or app.config.get("PROFILE_DIR", "profiles")
+        for line in profiling.report(directory, top=top, sort=sort):
+            print(line)
+
+    """
+    Database pool, query and cache metrics in the Prometheus text format
+    """
+
+    @app.route("/api/_metrics", methods=["GET"])
+    def get_metrics():
+        return Response(
+            metrics.REGISTRY.render() + app.metrics.render(),
+            mimetype="text/plain; version=0.0.4",
+        )
 
     @app.errorhandler(ApiError)
     @marshal_with(ErrorHandlerSchema())
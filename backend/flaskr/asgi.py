@@ -0,0 +1,334 @@
+import asyncio
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from marshmallow import ValidationError
+from werkzeug.http import dump_cookie, parse_cookie
+from decorators import Argument, boolean, bounded, client_address
+from error_handlers import ApiError
+from flaskr.pagination import MAX_PAGE_SIZE
+from models import get_setting
+from serializers import compile_schema, dumps
+from schemas import (
+    CategorySchema,
+    CategoryCreateSchema,
+    QuestionCollectionSchema,
+    QuestionCreateSchema,
+    QuestionSchema,
+    QuizCreateSchema,
+    QuizRoundCreateSchema,
+    QuizGradeCreateSchema,
+    QuizGradeRoundSchema,
+    QuizGradeSchema,
+    ErrorHandlerSchema,
+    quiz_schemas,
+)
+
+
+"""
+ASGI serving mode for the read heavy and quiz routes.
+
+The router, request parsing and response writing run on the event loop, so
+a waiting client costs a coroutine instead of a worker thread. SQLAlchemy
+1.3 has no asyncio session, the service calls run on a bounded thread pool
+inside the Flask app context instead: ASGI_WORKERS caps the number of
+requests holding a database connection, the rest wait on the loop.
+"""
+
+LISTING_ARGUMENTS = [
+    Argument(name="page", default=0, type=int),
+    Argument(name="limit", default=10, type=bounded(1, MAX_PAGE_SIZE)),
+    Argument(name="search_term", type=str),
+    Argument(name="pagination", default="page", type=str),
+    Argument(name="after", type=str),
+    Argument(name="include_count", type=boolean),
+]
+
+
+class Route(object):
+    def __init__(
+        self, method, pattern, handler, schema=None, status_code=200, rate_limit=None
+    ):
+        self.method = method
+        self.rate_limit = rate_limit
+        self.pattern = re.compile(
+            "^{}$".format(re.sub(r"<int:(\w+)>", r"(?P<\1>[0-9]+)", pattern))
+        )
+        self.handler = handler
+        self.status_code = status_code
+        self.serialize = compile_schema(schema) if schema is not None else None
+
+    def match(self, path):
+        match = self.pattern.match(path)
+        if match:
+            return {name: int(value) for name, value in match.groupdict().items()}
+        return None
+
+
+def parse_args(query_string, arguments):
+    """Same rules as decorators.parse_request, over the raw query string."""
+    params = dict(parse_qsl(query_string.decode("latin-1")))
+    data = {}
+    for argument in arguments:
+        if params.get(argument.name):
+            data[argument.name] = argument.type(params.get(argument.name))
+        elif argument.default:
+            data[argument.name] = argument.default
+        elif argument.required:
+            raise ApiError(message="Parameter {} is required".format(argument.name))
+    return data
+
+
+class AsgiApp(object):
+    def __init__(self, flask_app, max_workers=None):
+        self.flask_app = flask_app
+        self.services = flask_app.services
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or flask_app.config.get("ASGI_WORKERS", 32),
+            thread_name_prefix="trivia-asgi",
+        )
+        self.error_schema = ErrorHandlerSchema()
+        services = self.services
+        quiz_question_schema, quiz_round_schema = quiz_schemas(
+            get_setting(flask_app, "QUIZ_INCLUDE_ANSWERS", False, bool)
+        )
+        self.routes = [
+            Route("GET", "/api/categories", lambda request: services.categories.list()),
+            Route(
+                "POST",
+                "/api/categories",
+                lambda request: services.categories.create(
+                    request.load(CategoryCreateSchema())
+                ),
+                CategorySchema(),
+                201,
+            ),
+            Route(
+                "GET",
+                "/api/categories/<int:id>",
+                lambda request: services.categories.get(request.params["id"]),
+                CategorySchema(),
+            ),
+            Route(
+                "GET",
+                "/api/questions",
+                lambda request: services.questions.list(
+                    **request.args(LISTING_ARGUMENTS)
+                ),
+                QuestionCollectionSchema(),
+            ),
+            Route(
+                "GET",
+                "/api/categories/<int:current_category>/questions",
+                lambda request: services.questions.list(
+                    current_category=request.params["current_category"],
+                    **request.args(LISTING_ARGUMENTS)
+                ),
+                QuestionCollectionSchema(),
+            ),
+            Route("GET", "/api/stats", lambda request: services.questions.stats()),
+            Route(
+                "POST",
+                "/api/questions",
+                lambda request: services.questions.create(
+                    request.load(QuestionCreateSchema())
+                ),
+                QuestionSchema(),
+                201,
+            ),
+            Route(
+                "POST",
+                "/api/quizzes",
+                self.get_quiz,
+                quiz_question_schema,
+                201,
+                rate_limit="quizzes",
+            ),
+            Route(
+                "POST",
+                "/api/quizzes/round",
+                self.get_quiz_round,
+                quiz_round_schema,
+                201,
+                rate_limit="quizzes",
+            ),
+            Route(
+                "POST",
+                "/api/quizzes/grade",
+                self.grade_answers,
+                rate_limit="grades",
+            ),
+        ]
+        self.grade_schema = QuizGradeSchema()
+        self.grade_round_schema = QuizGradeRoundSchema()
+
+    def get_quiz(self, request):
+        entity = request.load(QuizCreateSchema())
+        return self.services.quizzes.next_question(
+            category_id=entity.get("quiz_category"),
+            previous_questions=entity.get("previous_questions"),
+            difficulty=entity.get("difficulty"),
+            min_difficulty=entity.get("min_difficulty"),
+            max_difficulty=entity.get("max_difficulty"),
+            adaptive=entity.get("adaptive", False),
+            score=entity.get("score", 0),
+        )
+
+    def get_quiz_round(self, request):
+        entity = request.load(QuizRoundCreateSchema())
+        return self.services.quizzes.round(
+            category_id=entity.get("quiz_category"),
+            previous_questions=entity.get("previous_questions"),
+            count=entity.get("count", 5),
+        )
+
+    def grade_answers(self, request):
+        entity = request.load(QuizGradeCreateSchema())
+        if "answers" in entity:
+            graded = self.services.quizzes.grade(entity["answers"], entity.get("fuzzy"))
+            return self.grade_round_schema.dump(graded)
+        graded = self.services.quizzes.grade([entity], entity.get("fuzzy"))
+        return self.grade_schema.dump(graded["results"][0])
+
+    def resolve(self, method, path):
+        allowed = False
+        for route in self.routes:
+            params = route.match(path)
+            if params is None:
+                continue
+            if route.method == method:
+                return route, params
+            allowed = True
+        raise ApiError(
+            message="Method not allowed." if allowed else "Resource not found.",
+            status_code=405 if allowed else 404,
+        )
+
+    def call(self, route, request):
+        """
+        Run the route handler and serialize its result, in a worker thread.
+        Returns the status code, the body and the extra headers.
+        """
+        if route.rate_limit:
+            allowed, retry_after = self.flask_app.rate_limiter.allow(
+                "{}:{}".format(route.rate_limit, request.client(self.flask_app.config))
+            )
+            if not allowed:
+                return (
+                    429,
+                    dumps({"error": True, "message": "Too many requests, slow down."}),
+                    [(b"retry-after", str(int(retry_after) + 1).encode())],
+                )
+        replicas = self.flask_app.replicas
+        with self.flask_app.app_context():
+            replicas.begin(request.cookie(replicas.cookie_name))
+            try:
+                result = route.handler(request)
+                if route.serialize is not None:
+                    result = route.serialize(result)
+                headers = []
+                cookie = replicas.cookie()
+                if cookie is not None:
+                    name, value, max_age = cookie
+                    cookie = dump_cookie(name, value, max_age=max_age, httponly=True)
+                    headers.append((b"set-cookie", cookie.encode("latin-1")))
+                return route.status_code, dumps(result), headers
+            except ApiError as error:
+                return error.status_code, dumps(self.error_schema.dump(error)), []
+            except ValidationError as err:
+                return 400, dumps({"error": True, "messages": err.messages}), []
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        headers = []
+        try:
+            route, params = self.resolve(scope["method"], scope["path"])
+            request = Request(scope, params, body)
+            loop = asyncio.get_running_loop()
+            status_code, content, headers = await loop.run_in_executor(
+                self.executor, self.call, route, request
+            )
+        except ApiError as error:
+            status_code, content = error.status_code, dumps(self.error_schema.dump(error))
+        except Exception:
+            self.flask_app.logger.exception("Unhandled error in %s", scope["path"])
+            status_code, content = 500, dumps({"error": True, "message": "Server error."})
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(content) + 1).encode()),
+                    (b"access-control-allow-origin", b"*"),
+                ]
+                + headers,
+            }
+        )
+        await send({"type": "http.response.body", "body": content + b"\n"})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+class Request(object):
+    def __init__(self, scope, params, body):
+        self.scope = scope
+        self.params = params
+        self.body = body
+
+    def client(self, config):
+        """Client address, see decorators.client_address."""
+        forwarded_for = ",".join(
+            value.decode("latin-1")
+            for name, value in self.scope.get("headers", [])
+            if name == b"x-forwarded-for"
+        )
+        client = self.scope.get("client")
+        return client_address(
+            client[0] if client else None,
+            forwarded_for,
+            config.get("RATE_LIMIT_TRUST_PROXY"),
+        )
+
+    def cookie(self, name):
+        for header, value in self.scope.get("headers", []):
+            if header == b"cookie":
+                return parse_cookie(value.decode("latin-1")).get(name)
+        return None
+
+    def args(self, arguments):
+        return parse_args(self.scope.get("query_string", b""), arguments)
+
+    def load(self, schema):
+        try:
+            data = json.loads(self.body) if self.body else None
+        except ValueError:
+            raise ApiError(message="Request body is not valid JSON")
+        return schema.load(data)
+
+
+def create_asgi_app(flask_app, max_workers=None):
+    """
+    Serve the category, question listing, question creation and quiz routes
+    of flask_app over ASGI, through the same services and schemas.
+    """
+    return AsgiApp(flask_app, max_workers=max_workers)
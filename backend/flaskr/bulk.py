@@ -0,0 +1,154 @@
+import csv
+import io
+import json
+from marshmallow import ValidationError
+from models import Question
+from schemas import QuestionCreateSchema
+
+
+"""
+Bulk loading and dumping of questions as JSON Lines or CSV.
+
+Imported rows are validated with QuestionCreateSchema and inserted chunk by
+chunk with a single multi-row INSERT, every invalid row is reported with its
+line number instead of aborting the whole import. Exports stream plain rows
+from a server side cursor, so memory stays flat whatever the table size.
+"""
+
+FORMATS = ("ndjson", "csv")
+MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+QUESTION_FIELDS = ("question", "answer", "category_id", "difficulty")
+EXPORT_FIELDS = ("id",) + QUESTION_FIELDS
+# Most rows an import validates and inserts at once
+MAX_CHUNK_SIZE = 10000
+
+
+def guess_format(name_or_mimetype):
+    if name_or_mimetype and "csv" in name_or_mimetype.lower():
+        return "csv"
+    return "ndjson"
+
+
+def read_rows(stream, format="ndjson"):
+    """
+    Yield (line number, row, error) for every record of a binary stream.
+    Rows that can not be decoded come back as (line number, None, error).
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    if format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            if "aliases" in row:
+                # Aliases are separated by "|" in a single CSV cell
+                aliases = (row["aliases"] or "").split("|")
+                row["aliases"] = [alias for alias in aliases if alias]
+            yield reader.line_num, row, None
+        return
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as err:
+            yield number, None, {"_schema": ["Invalid JSON: {}".format(err)]}
+            continue
+        if not isinstance(row, dict):
+            yield number, None, {"_schema": ["Invalid input type."]}
+            continue
+        yield number, row, None
+
+
+class QuestionImporter(object):
+    def __init__(self, question_repository, category_ids, chunk_size=1000, max_errors=1000):
+        self.question_repository = question_repository
+        self.category_ids = set(category_ids)
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.schema = QuestionCreateSchema()
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def _error(self, number, messages):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": number, "messages": messages})
+
+    def _flush(self, chunk):
+        if not chunk:
+            return
+        numbers = [number for number, row in chunk]
+        try:
+            entities = self.schema.load([row for number, row in chunk], many=True)
+            invalid = {}
+        except ValidationError as err:
+            entities = err.valid_data
+            invalid = err.messages
+        rows = []
+        for index, entity in enumerate(entities):
+            if index in invalid:
+                self._error(numbers[index], invalid[index])
+            elif entity.get("category_id") not in self.category_ids:
+                self._error(
+                    numbers[index],
+                    {
+                        "category_id": [
+                            "Category not found with id {}".format(
+                                entity.get("category_id")
+                            )
+                        ]
+                    },
+                )
+            else:
+                row = dict((key, entity.get(key)) for key in QUESTION_FIELDS)
+                # Not a column, bulk_insert passes it on to the answer forms
+                row["aliases"] = entity.get("aliases") or []
+                rows.append(row)
+        self.inserted += self.question_repository.bulk_insert(rows)
+
+    def run(self, records):
+        chunk = []
+        for number, row, error in records:
+            if error:
+                self._error(number, error)
+                continue
+            # Exported files carry the ids, new ones are assigned on import
+            row.pop("id", None)
+            chunk.append((number, row))
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+        self._flush(chunk)
+        return {"inserted": self.inserted, "failed": self.failed, "errors": self.errors}
+
+
+def export_rows(session, category_id=None, chunk_size=1000):
+    """Yield every question as a dict, fetching chunk_size rows at a time."""
+    columns = [getattr(Question, field) for field in EXPORT_FIELDS]
+    query = session.query(*columns).order_by(Question.id)
+    if category_id:
+        query = query.filter(Question.category_id == category_id)
+    query = query.execution_options(stream_results=True).yield_per(chunk_size)
+    for row in query:
+        yield dict(zip(EXPORT_FIELDS, row))
+
+
+def encode_rows(rows, format="ndjson", buffer_size=65536):
+    """Encode rows as text, yielding chunks of about buffer_size characters."""
+    buffer = io.StringIO()
+    if format == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps(row))
+            buffer.write("\n")
+    for row in rows:
+        write(row)
+        if buffer.tell() >= buffer_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,49 @@
+import threading
+import time
+
+
+class TTLCache(object):
+    """
+    Small thread safe key/value cache whose entries expire after ttl seconds.
+
+    Counts hits and misses so callers can tell whether it is worth keeping.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def get_or_set(self, key, factory):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.set(key, factory())
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,117 @@
+import difflib
+import re
+import unicodedata
+from sqlalchemy import exists, select
+from models import AnswerForm, Question
+
+
+"""
+Answer grading.
+
+Guesses and answers are compared in a normalized form: accents, case,
+punctuation and a leading article are dropped and spaces collapsed. Every
+question stores the normalized forms it accepts in the answer_forms table,
+computed once on insert: its answer, the answer without parenthesized
+parts, its last word for multi word answers (so "Fleming" is accepted for
+"Alexander Fleming"), numbers written both as digits and words, and any
+aliases given on creation. The quiz view used to accept any single word
+of the answer, "of" included; only the last one is kept.
+
+Changing these rules only needs `flask backfill_answer_forms --rebuild`.
+"""
+
+ARTICLES = ("the", "a", "an")
+NUMBERS = (
+    "zero one two three four five six seven eight nine ten eleven twelve "
+    "thirteen fourteen fifteen sixteen seventeen eighteen nineteen twenty"
+).split()
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r"['’`]", "", text.lower())
+    words = re.sub(r"[\W_]+", " ", text).split()
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+
+def _number_forms(form):
+    if form.isdigit() and int(form) < len(NUMBERS):
+        return [NUMBERS[int(form)]]
+    if form in NUMBERS:
+        return [str(NUMBERS.index(form))]
+    return []
+
+
+def answer_forms(answer, aliases=()):
+    """Sorted normalized forms accepted for answer."""
+    forms = set()
+    for text in [answer, re.sub(r"\([^)]*\)", " ", answer or "")] + list(aliases):
+        form = normalize(text)
+        if not form:
+            continue
+        forms.add(form)
+        forms.update(_number_forms(form))
+        words = form.split()
+        if len(words) > 1 and len(words[-1]) > 2:
+            forms.add(words[-1])
+    return sorted(forms)
+
+
+def grade(guess, forms, fuzzy_ratio=None):
+    """
+    Whether guess matches one of forms, or with fuzzy_ratio comes close
+    enough to one of them (difflib similarity ratio, 0 to 1).
+    """
+    guess = normalize(guess)
+    if not guess:
+        return False
+    if guess in forms:
+        return True
+    if fuzzy_ratio:
+        for form in forms:
+            matcher = difflib.SequenceMatcher(None, guess, form)
+            # real_quick_ratio is an upper bound of ratio, and much cheaper
+            if matcher.real_quick_ratio() < fuzzy_ratio:
+                continue
+            if matcher.ratio() >= fuzzy_ratio:
+                return True
+    return False
+
+
+def form_rows(question_id, answer, aliases=()):
+    return [
+        {"question_id": question_id, "form": form}
+        for form in answer_forms(answer, aliases)
+    ]
+
+
+def backfill(connection, rebuild=False, chunk_size=1000):
+    """
+    Store the answer forms of the questions without any, or of every
+    question with rebuild, walking the questions by id. Works on a
+    connection or a session, returns the number of questions processed.
+    """
+    questions = Question.__table__
+    forms = AnswerForm.__table__
+    query = select([questions.c.id, questions.c.answer]).order_by(questions.c.id)
+    if not rebuild:
+        query = query.where(~exists().where(forms.c.question_id == questions.c.id))
+    processed = 0
+    after_id = 0
+    while True:
+        rows = connection.execute(
+            query.where(questions.c.id > after_id).limit(chunk_size)
+        ).fetchall()
+        if not rows:
+            return processed
+        ids = [id for id, answer in rows]
+        if rebuild:
+            connection.execute(forms.delete().where(forms.c.question_id.in_(ids)))
+        values = [form for id, answer in rows for form in form_rows(id, answer)]
+        if values:
+            connection.execute(forms.insert(), values)
+        processed += len(rows)
+        after_id = ids[-1]
@@ -0,0 +1,100 @@
+import bisect
+import itertools
+import threading
+import time
+from models import QuizResult, TableVersion
+
+
+class Leaderboard(object):
+    """
+    Top size results of each category, kept in memory.
+
+    A category board is loaded from the quiz_results table the first time
+    it is read, then results flushed by this process are merged in as they
+    are written. Results written by other processes are picked up by
+    comparing the quiz_results table version with the one the boards were
+    built at, at most every refresh_interval seconds.
+
+    Boards are replaced rather than mutated, so readers holding one never
+    see it change under them.
+    """
+
+    def __init__(self, size=10, refresh_interval=5):
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self.version = None
+        self._boards = {}
+        self._checked_at = 0
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def top(self, session, category_id=None, limit=None):
+        """Best results of category_id (None for quizzes over every category)."""
+        self._check(session)
+        board = self._boards.get(category_id)
+        if board is None:
+            with self._lock:
+                board = self._boards.get(category_id)
+                if board is None:
+                    board = self._load(session, category_id)
+                    self._boards[category_id] = board
+        return [entry[-1] for entry in board[:limit]]
+
+    def offer(self, results):
+        """Merge results committed by this process into the loaded boards."""
+        with self._lock:
+            boards = dict(self._boards)
+            for result in results:
+                board = boards.get(result["category_id"])
+                if board is None:
+                    continue
+                entry = self._entry(result)
+                if len(board) >= self.size and entry >= board[-1]:
+                    continue
+                board = list(board)
+                bisect.insort(board, entry)
+                boards[result["category_id"]] = board[: self.size]
+            self._boards = boards
+            if self.version is not None:
+                # The flush bumped the table version once
+                self.version += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._boards = {}
+            self.version = None
+
+    def _entry(self, result):
+        # Best score first, the earliest among equal scores
+        return (-result["score"], result["created_at"], next(self._order), result)
+
+    def _check(self, session):
+        if time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            (version,) = TableVersion.current(session, [QuizResult.__tablename__])
+            if version != self.version:
+                self._boards = {}
+                self.version = version
+            self._checked_at = time.monotonic()
+
+    def _load(self, session, category_id):
+        table = QuizResult.__table__
+        rows = session.execute(
+            table.select()
+            .where(table.c.category_id == category_id)
+            .order_by(table.c.score.desc(), table.c.created_at)
+            .limit(self.size)
+        )
+        return [
+            self._entry(
+                {
+                    "player": row.player,
+                    "category_id": row.category_id,
+                    "score": row.score,
+                    "total": row.total,
+                    "created_at": row.created_at,
+                }
+            )
+            for row in rows
+        ]
@@ -0,0 +1,37 @@
+import base64
+import json
+from error_handlers import ApiError
+
+
+"""
+Opaque cursors for keyset pagination.
+
+A cursor holds the sort key of the last row of a page: (id) for the whole
+question list, (category_id, id) for the questions of a category.
+"""
+
+# Most questions a listing page, by offset or cursor, can hold
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(id, category_id=None):
+    key = {"id": id}
+    if category_id:
+        key["category_id"] = category_id
+    raw = json.dumps(key, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token, category_id=None):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        id = int(key["id"])
+    except (ValueError, TypeError, KeyError):
+        raise ApiError(message="Invalid cursor {}".format(token), status_code=400)
+    if key.get("category_id") != (category_id or None):
+        raise ApiError(
+            message="Cursor {} does not belong to this listing".format(token),
+            status_code=400,
+        )
+    return id
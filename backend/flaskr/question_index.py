@@ -0,0 +1,175 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from sqlalchemy import select
+from models import Question, TableVersion
+
+ALL = None
+
+
+class BucketUnion(object):
+    """Read only sequence over several id buckets, indexed one after the other."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def __getitem__(self, index):
+        for bucket in self.buckets:
+            if index < len(bucket):
+                return bucket[index]
+            index -= len(bucket)
+        raise IndexError(index)
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            yield from bucket
+
+
+class QuestionIdIndex(object):
+    """
+    In process index of question ids bucketed by (category, difficulty),
+    with ALL standing for any category or any difficulty. Every bucket is
+    a sorted array('i') (4 bytes per question and bucket).
+
+    The index is loaded on first use and kept current by the writes of its
+    own process, given the questions table version each write committed:
+    a write is applied in place only when it is the next version after the
+    index's, otherwise another process wrote in between and the index is
+    reloaded. Writes of other processes alone are picked up by comparing
+    the table version with the index's, at most every refresh_interval
+    seconds.
+
+    Buckets are replaced rather than mutated, so readers holding one never
+    see it change under them.
+    """
+
+    def __init__(self, refresh_interval=5):
+        self.refresh_interval = refresh_interval
+        self.version = None
+        self._buckets = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def ids(self, session, category_id=ALL, difficulties=None):
+        """
+        Sorted ids of the questions of category_id, or of every question,
+        restricted to difficulties when given. Several difficulties give a
+        BucketUnion, which is not sorted across buckets.
+        """
+        buckets = self._current(session)
+        category_id = category_id or ALL
+        if difficulties is None:
+            return buckets.get((category_id, ALL), array("i"))
+        selected = [
+            buckets[(category_id, difficulty)]
+            for difficulty in difficulties
+            if (category_id, difficulty) in buckets
+        ]
+        if len(selected) == 1:
+            return selected[0]
+        return BucketUnion(selected)
+
+    def _current(self, session):
+        buckets = self._buckets
+        age = time.monotonic() - self._checked_at
+        if buckets is not None and age < self.refresh_interval:
+            return buckets
+        with self._lock:
+            (version,) = TableVersion.current(session, [Question.__tablename__])
+            if self._buckets is None or version != self.version:
+                self._buckets = self._load(session)
+                self.version = version
+            self._checked_at = time.monotonic()
+            return self._buckets
+
+    @staticmethod
+    def _keys(category_id, difficulty):
+        keys = [(ALL, ALL), (category_id, ALL)]
+        if difficulty is not None:
+            keys += [(ALL, difficulty), (category_id, difficulty)]
+        return keys
+
+    def _load(self, session):
+        # Fill the (category, difficulty) buckets from a plain Core select,
+        # then derive the ALL buckets by merging them back in id order.
+        table = Question.__table__
+        rows = session.execute(
+            select([table.c.id, table.c.category_id, table.c.difficulty]).order_by(
+                table.c.id
+            )
+        )
+        pairs = {}
+        for id, category_id, difficulty in rows:
+            bucket = pairs.get((category_id, difficulty))
+            if bucket is None:
+                bucket = pairs[(category_id, difficulty)] = array("i")
+            bucket.append(id)
+        buckets = {}
+        for key in set(
+            key
+            for category_id, difficulty in pairs
+            for key in self._keys(category_id, difficulty)
+        ):
+            parts = [
+                bucket
+                for (category_id, difficulty), bucket in pairs.items()
+                if key in self._keys(category_id, difficulty)
+            ]
+            if len(parts) == 1:
+                buckets[key] = parts[0]
+            else:
+                buckets[key] = array("i", sorted(chain(*parts)))
+        buckets.setdefault((ALL, ALL), array("i"))
+        return buckets
+
+    def _follows(self, version):
+        # Called with the lock held
+        if self._buckets is None:
+            return False
+        if version != self.version + 1:
+            self._buckets = None
+            self.version = None
+            return False
+        self.version = version
+        return True
+
+    def add(self, id, category_id, difficulty, version):
+        """Record a question committed by this process at table version."""
+        with self._lock:
+            if not self._follows(version):
+                return
+            buckets = dict(self._buckets)
+            for key in set(self._keys(category_id, difficulty)):
+                bucket = buckets.get(key, array("i"))
+                index = bisect_left(bucket, id)
+                if index < len(bucket) and bucket[index] == id:
+                    continue
+                bucket = array("i", bucket)
+                bucket.insert(index, id)
+                buckets[key] = bucket
+            self._buckets = buckets
+
+    def remove(self, id, version):
+        """Forget a question deleted by this process at table version."""
+        with self._lock:
+            if not self._follows(version):
+                return
+            buckets = dict(self._buckets)
+            for key, bucket in self._buckets.items():
+                index = bisect_left(bucket, id)
+                if index < len(bucket) and bucket[index] == id:
+                    bucket = array("i", bucket)
+                    del bucket[index]
+                    buckets[key] = bucket
+            self._buckets = buckets
+
+    def invalidate(self):
+        """Reload on next use, for writes whose ids are not known."""
+        with self._lock:
+            self._buckets = None
+            self.version = None
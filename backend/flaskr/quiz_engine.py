@@ -0,0 +1,57 @@
+"""
+Difficulty selection for quiz turns.
+
+A turn targets either a fixed difficulty band or, in adaptive mode, the
+difficulty matching the player's running score: the share of correct
+answers among the previous questions, mapped linearly onto the difficulty
+scale. The bands returned are tried in order, widening around the target
+until a question is left.
+"""
+
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+# Difficulty of the first adaptive turn, when there is no score yet.
+START_DIFFICULTY = 3
+
+
+def band(low=MIN_DIFFICULTY, high=MAX_DIFFICULTY):
+    return tuple(range(max(low, MIN_DIFFICULTY), min(high, MAX_DIFFICULTY) + 1))
+
+
+def target_difficulty(score, answered, start=START_DIFFICULTY):
+    if not answered:
+        return start
+    accuracy = min(max(score / float(answered), 0.0), 1.0)
+    return MIN_DIFFICULTY + int(round(accuracy * (MAX_DIFFICULTY - MIN_DIFFICULTY)))
+
+
+def widening_bands(target):
+    """The target alone, then target ± 1, ± 2... up to the whole scale."""
+    width = 0
+    while True:
+        yield band(target - width, target + width)
+        if target - width <= MIN_DIFFICULTY and target + width >= MAX_DIFFICULTY:
+            return
+        width += 1
+
+
+def difficulty_bands(
+    difficulty=None,
+    min_difficulty=None,
+    max_difficulty=None,
+    adaptive=False,
+    score=0,
+    answered=0,
+):
+    """
+    Difficulty bands to draw from, in order. [None] means any difficulty,
+    so questions without one stay eligible.
+    """
+    if adaptive:
+        target = target_difficulty(score, answered, difficulty or START_DIFFICULTY)
+        return list(widening_bands(target))
+    if difficulty is not None:
+        return [band(difficulty, difficulty)]
+    if min_difficulty is not None or max_difficulty is not None:
+        return [band(min_difficulty or MIN_DIFFICULTY, max_difficulty or MAX_DIFFICULTY)]
+    return [None]
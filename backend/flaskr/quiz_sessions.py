@@ -0,0 +1,78 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+
+class LRUSessionStore(object):
+    """
+    In-process quiz session store.
+
+    Keeps the shuffled deck of question ids of each session, dropping the
+    least recently used sessions once max_sessions is reached.
+    """
+
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self._decks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, question_ids):
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._decks[session_id] = list(reversed(question_ids))
+            while len(self._decks) > self.max_sessions:
+                self._decks.popitem(last=False)
+        return session_id
+
+    def pop(self, session_id):
+        """Return the next question id, None when the deck is empty."""
+        with self._lock:
+            deck = self._decks.get(session_id)
+            if deck is None:
+                raise KeyError(session_id)
+            self._decks.move_to_end(session_id)
+            return deck.pop() if deck else None
+
+    def delete(self, session_id):
+        with self._lock:
+            self._decks.pop(session_id, None)
+
+
+class RedisSessionStore(object):
+    """
+    Quiz session store backed by a Redis compatible client.
+
+    Only rpush, lpop, set, exists, expire and delete are used, so any client
+    exposing those commands (redis-py, or a local fake in tests) works.
+    """
+
+    prefix = "trivia:quiz"
+
+    def __init__(self, client, ttl=3600):
+        self.client = client
+        self.ttl = ttl
+
+    def _keys(self, session_id):
+        base = "{}:{}".format(self.prefix, session_id)
+        return base + ":deck", base + ":meta"
+
+    def create(self, question_ids):
+        session_id = uuid.uuid4().hex
+        deck_key, meta_key = self._keys(session_id)
+        self.client.set(meta_key, len(question_ids), ex=self.ttl)
+        if question_ids:
+            self.client.rpush(deck_key, *question_ids)
+            self.client.expire(deck_key, self.ttl)
+        return session_id
+
+    def pop(self, session_id):
+        deck_key, meta_key = self._keys(session_id)
+        value = self.client.lpop(deck_key)
+        if value is None:
+            if not self.client.exists(meta_key):
+                raise KeyError(session_id)
+            return None
+        return int(value)
+
+    def delete(self, session_id):
+        self.client.delete(*self._keys(session_id))
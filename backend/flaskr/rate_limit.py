@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger("trivia.rate_limit")
+
+
+"""
+Token bucket rate limiting.
+
+Buckets hold up to burst tokens and refill at rate tokens per second, each
+request takes one. They are tracked as a theoretical arrival time (GCRA),
+so a bucket is a single float whichever the backend.
+"""
+
+
+def _take(tat, now, rate, burst):
+    """Return (allowed, new arrival time, seconds until a token is back)."""
+    interval = 1.0 / rate
+    new_tat = max(tat or now, now) + interval
+    excess = new_tat - now - burst * interval
+    if excess > 0:
+        return False, tat, excess
+    return True, new_tat, 0.0
+
+
+class TokenBucketLimiter(object):
+    """In-process limiter, forgetting the least recently seen clients past max_clients."""
+
+    def __init__(self, rate=5, burst=20, max_clients=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.rejected = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Take a token for key, return (allowed, retry_after seconds)."""
+        with self._lock:
+            allowed, tat, retry_after = _take(
+                self._buckets.get(key), time.time(), self.rate, self.burst
+            )
+            self._buckets[key] = tat
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            if not allowed:
+                self.rejected += 1
+            return allowed, retry_after
+
+
+class RedisTokenBucketLimiter(object):
+    """
+    Limiter shared by every process through a redis-py compatible client.
+
+    The bucket of a client is read and written in an optimistic transaction
+    (WATCH, then MULTI/EXEC, retried when another request changed the bucket
+    in between), so concurrent requests of a burst each take their own
+    token. When Redis can not be reached the request is denied, the
+    limiter failing closed. Only transaction, get and set (with px) are used.
+    """
+
+    prefix = "trivia:ratelimit"
+
+    def __init__(self, client, rate=5, burst=20):
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.rejected = 0
+        self.errors = 0
+
+    def allow(self, key):
+        base = "{}:{}".format(self.prefix, key)
+
+        def take(pipe):
+            tat = pipe.get(base)
+            now = time.time()
+            allowed, tat, retry_after = _take(
+                float(tat) if tat is not None else None, now, self.rate, self.burst
+            )
+            pipe.multi()
+            # The bucket is full again once tat has passed, it can expire then
+            pipe.set(base, repr(tat), px=max(1, int((tat - now) * 1000) + 1))
+            return allowed, retry_after
+
+        try:
+            allowed, retry_after = self.client.transaction(
+                take, base, value_from_callable=True
+            )
+        except Exception:
+            self.errors += 1
+            logger.exception("Rate limiting %s failed, denying the request", key)
+            allowed, retry_after = False, 1.0 / self.rate
+        if not allowed:
+            self.rejected += 1
+        return allowed, retry_after
@@ -0,0 +1,192 @@
+import itertools
+import threading
+import time
+from flask import current_app, g, request
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.orm import sessionmaker
+from models import engine_options, get_setting
+import metrics
+
+
+"""
+Read/write splitting over read replicas.
+
+Repository reads (filter, get, listings, counts, exports, table versions)
+run on a session bound to one of the DATABASE_REPLICA_URLS, picked round
+robin per request; writes always go to the primary session. Once a request
+wrote, its remaining reads use the primary and the response sets a cookie
+keeping that client on the primary for REPLICA_STICKY_SECONDS, so it reads
+its own writes while the replicas catch up.
+
+A replica is pinged before use at most every REPLICA_CHECK_INTERVAL
+seconds and dropped from the rotation for REPLICA_RETRY_SECONDS when the
+ping or any statement on it fails with a database error. Without healthy
+replicas every read goes to the primary.
+"""
+
+
+class Replica(object):
+    def __init__(self, engine, retry_interval=30):
+        self.engine = engine
+        self.retry_interval = retry_interval
+        self.sessionmaker = sessionmaker(bind=engine)
+        self.down_until = 0.0
+        self.checked_at = 0.0
+        self.failures = 0
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(context):
+            if isinstance(context.sqlalchemy_exception, exc.DBAPIError):
+                self.mark_down()
+
+    @property
+    def url(self):
+        return repr(self.engine.url)
+
+    def mark_down(self):
+        self.failures += 1
+        self.down_until = time.monotonic() + self.retry_interval
+
+    def available(self, now):
+        return now >= self.down_until
+
+    def ping(self):
+        try:
+            with self.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except exc.SQLAlchemyError:
+            # handle_error has already marked the replica down
+            return False
+        return True
+
+
+class ReplicaRouter(object):
+    cookie_name = "trivia_primary"
+
+    def __init__(
+        self,
+        primary,
+        engines=(),
+        sticky_seconds=5,
+        retry_interval=30,
+        check_interval=10,
+    ):
+        self.primary = primary
+        self.sticky_seconds = sticky_seconds
+        self.check_interval = check_interval
+        self.replicas = [Replica(engine, retry_interval) for engine in engines]
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, app, primary):
+        urls = app.config.get("DATABASE_REPLICA_URLS") or get_setting(
+            app, "DATABASE_REPLICA_URLS", ""
+        )
+        if isinstance(urls, str):
+            urls = [url.strip() for url in urls.split(",") if url.strip()]
+        engines = [
+            metrics.instrument_engine(create_engine(url, **engine_options(app, url)))
+            for url in urls
+        ]
+        return cls(
+            primary,
+            engines,
+            sticky_seconds=get_setting(app, "REPLICA_STICKY_SECONDS", 5, float),
+            retry_interval=get_setting(app, "REPLICA_RETRY_SECONDS", 30, float),
+            check_interval=get_setting(app, "REPLICA_CHECK_INTERVAL", 10, float),
+        )
+
+    def begin(self, cookie_value):
+        """Keep the reads of this request on the primary until cookie_value."""
+        if not self.replicas or not cookie_value:
+            return
+        try:
+            until = float(cookie_value)
+        except ValueError:
+            return
+        if until > time.time():
+            g.read_primary = True
+
+    def wrote(self):
+        """Send the next reads of this request, and of its client, to the primary."""
+        g.read_primary = g.wrote_primary = True
+
+    def sticky(self):
+        """Whether replicas exist but this request reads from the primary."""
+        return bool(self.replicas) and bool(g.get("read_primary"))
+
+    def cookie(self):
+        """(name, value, max_age) of the cookie to set, None without a write."""
+        if not self.replicas or not g.get("wrote_primary"):
+            return None
+        return (
+            self.cookie_name,
+            repr(time.time() + self.sticky_seconds),
+            int(self.sticky_seconds) or 1,
+        )
+
+    def choose(self):
+        """Next available replica in turn, None when none is."""
+        now = time.monotonic()
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._turn) % len(self.replicas)]
+            if not replica.available(now):
+                continue
+            with self._lock:
+                due = now - replica.checked_at >= self.check_interval
+                if due:
+                    replica.checked_at = now
+            if due and not replica.ping():
+                continue
+            return replica
+        return None
+
+    def read_session(self):
+        """Session reads of the current request should use."""
+        if not self.replicas or self.sticky():
+            return self.primary.session
+        replica = g.get("replica")
+        if replica is None or not replica.available(time.monotonic()):
+            # First read of the request, or its replica failed meanwhile
+            replica = g.replica = self.choose()
+            if replica is None:
+                return self.primary.session
+            self.close()
+            g.replica_session = replica.sessionmaker()
+        return g.replica_session
+
+    def close(self):
+        session = g.pop("replica_session", None)
+        if session is not None:
+            session.close()
+
+    def status(self):
+        now = time.monotonic()
+        return [
+            {
+                "url": replica.url,
+                "up": replica.available(now),
+                "failures": replica.failures,
+            }
+            for replica in self.replicas
+        ]
+
+
+def init_app(app):
+    @app.before_request
+    def read_cookie():
+        replicas = current_app.replicas
+        replicas.begin(request.cookies.get(replicas.cookie_name))
+
+    @app.after_request
+    def set_cookie(response):
+        cookie = current_app.replicas.cookie()
+        if cookie is not None:
+            name, value, max_age = cookie
+            response.set_cookie(name, value, max_age=max_age, httponly=True)
+        return response
+
+    @app.teardown_appcontext
+    def close_replica_session(exception=None):
+        current_app.replicas.close()
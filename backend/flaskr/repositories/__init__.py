@@ -1,6 +1,7 @@
 from flaskr.repositories.base_repository import *
 import flaskr.repositories.category_repository as category_repository
 import flaskr.repositories.question_repository as question_repository
+import flaskr.repositories.result_repository as result_repository
 
 
 __all__ = ["BaseRepository"]
@@ -1,20 +1,48 @@
-from flask import jsonify, current_app
-from sqlalchemy import exc
+from flask import jsonify, current_app, g
+from sqlalchemy import exc, select
+from sqlalchemy.orm import joinedload, selectinload
 from error_handlers import ApiError
+from models import TableVersion
+
+LOADER_STRATEGIES = {"joined": joinedload, "selectin": selectinload}
+
 
 class BaseRepository(object):
     name = "BaseRepository"
-    
+    # Relationships loaded along with filter() queries, mapped to the
+    # loader strategy: "joined" (same SELECT) or "selectin" (one extra IN query)
+    eager_load = {}
+    # Columns _rows_changed needs from the rows of bulk_update and bulk_delete
+    tracked_columns = ()
+    # Ids per UPDATE or DELETE statement of bulk_update and bulk_delete,
+    # rows per INSERT statement of bulk_insert when it returns ids
+    bulk_chunk_size = 500
+    # Whether bulk_insert passes the rows to _rows_changed with their id
+    bulk_insert_ids = False
+
     @property
     def session(self):
+        """Primary session, for writes and the reads they depend on."""
         return current_app.db.session
 
+    @property
+    def read_session(self):
+        """Session of a read replica when configured, see flaskr.replicas."""
+        return current_app.replicas.read_session()
+
     @property
     def query(self):
         return self.session.query(self.model)
 
+    @property
+    def read_query(self):
+        return self.read_session.query(self.model)
+
     def get(self, id):
-        entity = self.query.get(id)
+        return self._get(self.read_query, id)
+
+    def _get(self, query, id):
+        entity = query.get(id)
         if not entity:
             raise ApiError(
                 message="{} not found with id {}".format(self.name, id),
@@ -22,18 +50,38 @@ class BaseRepository(object):
             )
         return entity
 
+    def loader_options(self):
+        return [
+            LOADER_STRATEGIES[strategy](getattr(self.model, relationship))
+            for relationship, strategy in self.eager_load.items()
+        ]
+
     def filter(self, **kwargs):
-        query = self.query
+        query = self.read_query.options(*self.loader_options())
         if kwargs:
-            query = query.filter(**kwargs)
+            query = query.filter_by(**kwargs)
         return query
 
     def insert(self, **kwargs):
+        """
+        Create an entity from the column values of kwargs. Other keys are
+        only passed on to _rows_changed.
+        """
         try:
-            entity = self.model(**kwargs)
+            entity = self.model(
+                **{
+                    key: value
+                    for key, value in kwargs.items()
+                    if key in self.model.__table__.c
+                }
+            )
             self.session.add(entity)
+            self.session.flush()
+            self._rows_changed(added=[dict(kwargs, id=entity.id)])
+            self._bump_version()
             self.session.commit()
             self.session.refresh(entity)
+            self._changed()
             return entity
         except:
             raise ApiError(
@@ -41,20 +89,78 @@ class BaseRepository(object):
                 status_code=500,
             )
 
-    def update(self, id, **kwargs):
+    def bulk_insert(self, rows):
+        """Insert a list of column dicts with a single executemany, one commit."""
+        if not rows:
+            return 0
         try:
-            entity = self.query.get(id)
-            if not entity:
-                raise ApiError(
-                    message="{} not found with id {}".format(self.name, id),
-                    status_code=404,
+            if self.bulk_insert_ids:
+                ids = self._insert_returning_ids(rows)
+                added = [dict(row, id=id) for row, id in zip(rows, ids)]
+            else:
+                self.session.execute(self.model.__table__.insert(), rows)
+                added = rows
+            self._rows_changed(added=added)
+            self._bump_version()
+            self.session.commit()
+        except exc.SQLAlchemyError:
+            self.session.rollback()
+            raise ApiError(
+                message="Error creating new {}".format(self.name),
+                status_code=500,
+            )
+        self._changed()
+        return len(rows)
+
+    def _insert_returning_ids(self, rows):
+        table = self.model.__table__
+        keys = [column for column in table.c if column.key in rows[0]]
+        rows = [{column.key: row[column.key] for column in keys} for row in rows]
+        if self.session.get_bind().dialect.implicit_returning:
+            # Multi row INSERT ... RETURNING, which does not promise the
+            # VALUES order: the columns come back to match the rows on
+            inserted = []
+            for start in range(0, len(rows), self.bulk_chunk_size):
+                inserted.extend(
+                    self.session.execute(
+                        table.insert()
+                        .values(rows[start : start + self.bulk_chunk_size])
+                        .returning(table.c.id, *keys)
+                    )
                 )
+            return self._match_ids(rows, keys, inserted)
+        # SQLite: one executemany, then the rows are read back. The write
+        # lock is held from the first INSERT, so they have the highest ids.
+        self.session.execute(table.insert(), rows)
+        inserted = self.session.execute(
+            select([table.c.id] + keys).order_by(table.c.id.desc()).limit(len(rows))
+        )
+        return self._match_ids(rows, keys, inserted)
+
+    def _match_ids(self, rows, keys, inserted):
+        """
+        Ids of rows, from the (id, *keys) rows inserted: each row gets the id
+        of an inserted row with the same values, whatever their order. Rows
+        with the same values get their ids in ascending order.
+        """
+        ids = {}
+        for id, *values in sorted(inserted):
+            ids.setdefault(tuple(values), []).append(id)
+        return [ids[tuple(row[column.key] for column in keys)].pop(0) for row in rows]
+
+    def update(self, id, **kwargs):
+        try:
+            entity = self._get(self.query, id)
+            before = self._snapshot(entity)
             for key in kwargs.keys():
                 if hasattr(self.model, key):
-                    setattr(self.model, key, kwargs.get(key))
+                    setattr(entity, key, kwargs.get(key))
             self.session.add(entity)
+            self._rows_changed(added=[self._snapshot(entity)], removed=[before])
+            self._bump_version()
             self.session.commit()
             self.session.refresh(entity)
+            self._changed()
             return entity
         except:
             raise ApiError(
@@ -64,12 +170,112 @@ class BaseRepository(object):
 
     def delete(self, id):
         try:
-            entity = self.get(id)
+            entity = self._get(self.query, id)
             self.session.delete(entity)
+            self._rows_changed(removed=[self._snapshot(entity)])
+            self._bump_version()
             self.session.commit()
+            self._changed()
             return "", 204
         except:
             raise ApiError(
                 message="Error deleting {}".format(self.name),
                 status_code=500,
             )
+
+    def bulk_update(self, ids=None, where=(), **values):
+        """
+        Set values on the rows listed in ids, or on every row matching the
+        where clauses, with set based statements in one transaction and
+        without loading entities. Returns the number of rows updated.
+        """
+        table = self.model.__table__
+        for key in values:
+            if key not in table.c or table.c[key].primary_key:
+                raise ApiError(message="Unknown field {}".format(key))
+        return self._bulk_write(ids, where, table.update().values(**values), values)
+
+    def bulk_delete(self, ids=None, where=()):
+        """Delete like bulk_update updates, returns the number of rows deleted."""
+        return self._bulk_write(ids, where, self.model.__table__.delete())
+
+    def _bulk_write(self, ids, where, statement, values=None):
+        # The affected rows (their id and tracked columns only) are read
+        # and locked first: the statements then target exactly those ids and
+        # the aggregates get their before and after values.
+        table = self.model.__table__
+        query = select([table.c.id] + [table.c[name] for name in self.tracked_columns])
+        if ids is not None:
+            query = query.where(table.c.id.in_(ids))
+        for clause in where:
+            query = query.where(clause)
+        try:
+            rows = self.session.execute(query.with_for_update())
+            removed = [dict(row) for row in rows]
+            if not removed:
+                self.session.rollback()
+                return 0
+            for start in range(0, len(removed), self.bulk_chunk_size):
+                chunk = removed[start : start + self.bulk_chunk_size]
+                self.session.execute(
+                    statement.where(table.c.id.in_([row["id"] for row in chunk]))
+                )
+            added = []
+            if values is not None:
+                added = [dict(row, **values) for row in removed]
+            self._rows_changed(added=added, removed=removed)
+            self._bump_version()
+            self.session.commit()
+        except exc.SQLAlchemyError:
+            self.session.rollback()
+            raise ApiError(
+                message="Error {} {}".format(
+                    "updating" if values is not None else "deleting", self.name
+                ),
+                status_code=500,
+            )
+        self._bulk_changed(added=added, removed=removed)
+        self._changed()
+        return len(removed)
+
+    def table_version(self, name=None):
+        """
+        Version of the table name (this repository's by default) seen by the
+        current request: the one its ETag was built from when conditional
+        read it, else read once from the read session.
+        """
+        name = name or self.model.__tablename__
+        versions = g.setdefault("table_versions", {})
+        if name not in versions:
+            (versions[name],) = TableVersion.current(self.read_session, [name])
+        return versions[name]
+
+    def _bump_version(self):
+        TableVersion.bump(self.session, self.model.__tablename__)
+        g.get("table_versions", {}).pop(self.model.__tablename__, None)
+        current_app.replicas.wrote()
+
+    def _snapshot(self, entity):
+        return {
+            column.key: getattr(entity, column.key)
+            for column in self.model.__table__.columns
+        }
+
+    def _rows_changed(self, added=(), removed=()):
+        """
+        Called inside the transaction of every write with the column dicts
+        of the rows added and removed, override to maintain aggregates.
+        """
+        pass
+
+    def _bulk_changed(self, added=(), removed=()):
+        """
+        Called after a committed bulk_update or bulk_delete with the rows
+        before (removed) and after (added) it, override to update in memory
+        state. The rows only hold the id and tracked_columns.
+        """
+        pass
+
+    def _changed(self):
+        """Called after every committed write, override to drop derived state."""
+        pass
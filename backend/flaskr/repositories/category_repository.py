@@ -1,7 +1,62 @@
+import time
+from collections import OrderedDict
+from flask import g
+from flaskr.cache import TTLCache
 from flaskr.repositories import BaseRepository
+from error_handlers import ApiError
 from models import Category
 
 
 class CategoryRepository(BaseRepository):
     name = "Category"
-    model = Category
\ No newline at end of file
+    model = Category
+    # Seconds a category list is kept, it is cached per categories table
+    # version so writes from any worker replace it.
+    cache_ttl = 300
+    # Seconds between checks of the table version outside conditional
+    # requests, which read it for their ETag anyway.
+    refresh_interval = 5
+
+    def __init__(self):
+        self.cache = TTLCache(ttl=self.cache_ttl)
+        self._checked = (None, 0)
+
+    def _load(self):
+        # Read from the primary: a lagging replica would cache an old list
+        # under the version of the write it has not replayed yet.
+        categories = self.query.order_by(Category.id)
+        return OrderedDict((category.id, category.format()) for category in categories)
+
+    def _version(self):
+        versions = g.get("table_versions", {})
+        if self.model.__tablename__ in versions:
+            return versions[self.model.__tablename__]
+        version, checked_at = self._checked
+        if version is None or time.monotonic() - checked_at >= self.refresh_interval:
+            version = self.table_version()
+            self._checked = (version, time.monotonic())
+        return version
+
+    def _categories(self):
+        return self.cache.get_or_set(("categories", self._version()), self._load)
+
+    def all(self):
+        """Formatted categories of the current categories table version."""
+        return list(self._categories().values())
+
+    def find(self, id):
+        category = self._categories().get(id)
+        if not category:
+            # Created by another worker since the version was last checked?
+            self._checked = (None, 0)
+            category = self._load().get(id)
+        if not category:
+            raise ApiError(
+                message="{} not found with id {}".format(self.name, id),
+                status_code=404,
+            )
+        return category
+
+    def _changed(self):
+        self._checked = (None, 0)
+        self.cache.invalidate()
@@ -1,7 +1,259 @@
+import random
+from sqlalchemy import select
+from flaskr import grading
+from flaskr import search
+from flaskr.cache import TTLCache
+from flaskr.question_index import QuestionIdIndex
 from flaskr.repositories import BaseRepository
-from models import Question
+from models import AnswerForm, Question, QuestionCount, TableVersion
 
 
 class QuestionRepository(BaseRepository):
     name = "Question"
-    model = Question
\ No newline at end of file
+    model = Question
+    eager_load = {"category": "joined"}
+    tracked_columns = ("category_id", "difficulty")
+    # New questions get their answer forms, keyed by question id
+    bulk_insert_ids = True
+    # Random id probes tried before drawing from the remaining candidates.
+    random_attempts = 8
+    # Seconds a search count is kept, it is cached per questions table
+    # version so writes from any worker replace it.
+    count_ttl = 30
+    # Seconds between checks of the id index against the questions version.
+    index_refresh = 5
+
+    def __init__(self):
+        self.count_cache = TTLCache(ttl=self.count_ttl)
+        self.id_index = QuestionIdIndex(refresh_interval=self.index_refresh)
+
+    def listing(self, category_id=None, search_term=None):
+        if search_term:
+            return self.search(search_term, category_id)
+        query = self.filter()
+        if category_id:
+            query = query.filter(Question.category_id == category_id)
+        return query
+
+    def search(self, search_term, category_id=None):
+        """
+        Questions whose question or answer has words starting with the
+        words of search_term, ranked by relevance. Uses the full text index
+        when it is installed and falls back to ILIKE otherwise.
+        """
+        query = self.filter()
+        if category_id:
+            query = query.filter(Question.category_id == category_id)
+        return search.search(query, self.read_session, search_term)
+
+    def count(self, category_id=None, search_term=None):
+        """
+        Number of questions of the listing. Without a search term it is read
+        from the question_counts table instead of counting the rows, search
+        counts are cached per questions table version.
+        """
+        if not search_term:
+            return QuestionCount.total(self.read_session, category_id)
+        return self.count_cache.get_or_set(
+            (category_id, search_term, self.table_version()),
+            lambda: self.listing(category_id, search_term).count(),
+        )
+
+    def counts(self):
+        """(category_id, difficulty, count) rows of the question_counts table."""
+        return QuestionCount.rows(self.read_session).all()
+
+    def reconcile_counts(self):
+        """Correct the question_counts rows that drifted from the questions table."""
+        drift = QuestionCount.reconcile(self.session)
+        if drift:
+            self._bump_version()
+        self.session.commit()
+        self._changed()
+        return drift
+
+    def page(self, query, page=1, limit=10):
+        offset = (page - 1) * limit if page > 1 else 0
+        return query.order_by(Question.id).limit(limit).offset(offset).all()
+
+    def keyset(self, query, after_id=None, limit=10):
+        """
+        Return up to limit questions with an id greater than after_id and
+        whether more rows follow. Walks the primary key (or the
+        category_id, id pair) instead of skipping rows with an offset.
+        """
+        if after_id:
+            query = query.filter(Question.id > after_id)
+        questions = query.order_by(None).order_by(Question.id).limit(limit + 1).all()
+        return questions[:limit], len(questions) > limit
+
+    def ids(self, category_id=None):
+        return list(self.id_index.ids(self.read_session, category_id))
+
+    def sample_ids(self, count, category_id=None):
+        """Up to count distinct question ids of category_id, in random order."""
+        ids = self.id_index.ids(self.read_session, category_id)
+        return random.sample(ids, min(count, len(ids)))
+
+    def random(self, category_id=None, exclude=None, difficulties=None):
+        """
+        Pick one question uniformly at random among the ones matching
+        category_id and difficulties and not listed in exclude.
+        """
+        questions = self.sample(
+            1, category_id=category_id, exclude=exclude, difficulties=difficulties
+        )
+        return questions[0] if questions else None
+
+    def sample(self, count, category_id=None, exclude=None, difficulties=None):
+        """
+        Pick up to count distinct questions uniformly at random among the
+        ones matching category_id and not listed in exclude. difficulties
+        restricts the draw to questions of those difficulty levels.
+
+        Ids are sampled from the in memory id index and loaded with a
+        single primary key IN query. Ids deleted by another process since
+        the index was refreshed are replaced by a new draw.
+        """
+        ids = self.id_index.ids(self.read_session, category_id, difficulties)
+        exclude = set(exclude or ())
+        questions = []
+        while len(questions) < count:
+            chosen = self._sample_ids(ids, count - len(questions), exclude)
+            if not chosen:
+                break
+            exclude.update(chosen)
+            found = {
+                question.id: question
+                for question in self.filter().filter(Question.id.in_(chosen))
+            }
+            if len(found) < len(chosen):
+                self.id_index.invalidate()
+            questions.extend(found[id] for id in chosen if id in found)
+        return questions
+
+    def _sample_ids(self, ids, count, exclude):
+        # Random probes are cheap while most ids are eligible; once
+        # random_attempts probes per pick missed, draw from the remainder.
+        chosen = []
+        if len(exclude) < len(ids):
+            picked = set()
+            for _ in range(self.random_attempts * count):
+                candidate = ids[random.randrange(len(ids))]
+                if candidate in exclude or candidate in picked:
+                    continue
+                picked.add(candidate)
+                chosen.append(candidate)
+                if len(chosen) == count:
+                    return chosen
+            exclude = exclude | picked
+        candidates = [id for id in ids if id not in exclude]
+        return chosen + random.sample(
+            candidates, min(count - len(chosen), len(candidates))
+        )
+
+    def insert(self, **kwargs):
+        entity = super().insert(**kwargs)
+        self.id_index.add(
+            entity.id, entity.category_id, entity.difficulty, self._version()
+        )
+        return entity
+
+    def bulk_insert(self, rows):
+        inserted = super().bulk_insert(rows)
+        self.id_index.invalidate()
+        return inserted
+
+    def delete(self, id):
+        result = super().delete(id)
+        self.id_index.remove(id, self._version())
+        return result
+
+    def _version(self):
+        """Questions table version, read on the primary after a write."""
+        (version,) = TableVersion.current(self.session, [Question.__tablename__])
+        return version
+
+    def criteria(self, category_id=None, difficulty=None):
+        """Where clauses of bulk_update and bulk_delete filters."""
+        clauses = []
+        if category_id is not None:
+            clauses.append(Question.category_id == category_id)
+        if difficulty is not None:
+            clauses.append(Question.difficulty == difficulty)
+        return clauses
+
+    def _bulk_changed(self, added=(), removed=()):
+        keys = [(row["category_id"], row["difficulty"]) for row in removed]
+        if keys != [(row["category_id"], row["difficulty"]) for row in added]:
+            self.id_index.invalidate()
+
+    def answer_forms(self, ids):
+        """{id: (answer, accepted forms)} of the questions of ids, in one query."""
+        questions = Question.__table__
+        forms = AnswerForm.__table__
+        rows = self.read_session.execute(
+            select([questions.c.id, questions.c.answer, forms.c.form])
+            .select_from(
+                questions.outerjoin(forms, forms.c.question_id == questions.c.id)
+            )
+            .where(questions.c.id.in_(ids))
+        )
+        result = {}
+        for id, answer, form in rows:
+            answer, accepted = result.setdefault(id, (answer, set()))
+            if form is not None:
+                accepted.add(form)
+        return result
+
+    def backfill_answer_forms(self, rebuild=False):
+        processed = grading.backfill(self.session, rebuild=rebuild)
+        self.session.commit()
+        return processed
+
+    def _rows_changed(self, added=(), removed=()):
+        deltas = {}
+        for sign, rows in ((1, added), (-1, removed)):
+            for row in rows:
+                key = QuestionCount.key(row.get("category_id"), row.get("difficulty"))
+                deltas[key] = deltas.get(key, 0) + sign
+        QuestionCount.apply(self.session, deltas)
+        self._store_answer_forms(added, removed)
+
+    def _store_answer_forms(self, added, removed):
+        forms = AnswerForm.__table__
+        # Every added row has its id: rows of new questions are not in
+        # removed, the others are updates of the removed row of that id.
+        before = set(row["id"] for row in removed)
+        kept = set(row["id"] for row in added)
+        answers = {row["id"]: row["answer"] for row in added if "answer" in row}
+        values = [
+            form
+            for row in added
+            if row["id"] not in before
+            for form in grading.form_rows(
+                row["id"], row.get("answer"), row.get("aliases") or ()
+            )
+        ]
+        # Forms of deleted questions and of questions whose answer changed
+        stale = [
+            row["id"]
+            for row in removed
+            if row["id"] not in kept
+            or row["id"] in answers
+            and answers[row["id"]] != row.get("answer")
+        ]
+        for start in range(0, len(stale), self.bulk_chunk_size):
+            chunk = stale[start : start + self.bulk_chunk_size]
+            self.session.execute(forms.delete().where(forms.c.question_id.in_(chunk)))
+        values.extend(
+            form
+            for id in stale
+            if id in answers
+            for form in grading.form_rows(id, answers[id])
+        )
+        if values:
+            self.session.execute(forms.insert(), values)
+
+    def _changed(self):
+        self.count_cache.invalidate()
@@ -0,0 +1,25 @@
+from flaskr.leaderboard import Leaderboard
+from flaskr.repositories import BaseRepository
+from models import QuizResult
+
+
+class ResultRepository(BaseRepository):
+    name = "Quiz result"
+    model = QuizResult
+    # Results kept per category leaderboard.
+    leaderboard_size = 10
+    # Seconds between checks of the leaderboards against the results version.
+    leaderboard_refresh = 5
+
+    def __init__(self):
+        self.leaderboard = Leaderboard(
+            size=self.leaderboard_size, refresh_interval=self.leaderboard_refresh
+        )
+
+    def top(self, category_id=None, limit=None):
+        return self.leaderboard.top(self.read_session, category_id, limit)
+
+    def bulk_insert(self, rows):
+        inserted = super().bulk_insert(rows)
+        self.leaderboard.offer(rows)
+        return inserted
@@ -0,0 +1,103 @@
+import atexit
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger("trivia.results")
+
+
+class ResultBuffer(object):
+    """
+    Write-behind buffer of quiz results.
+
+    Submissions are appended in memory and handed to flush, a function
+    writing a list of rows in one transaction, by a background thread: as
+    soon as max_size rows are pending, or interval seconds after the first
+    pending row. Rows of a failed flush are put back and retried on the
+    next one. Past max_pending rows, add refuses new ones.
+
+    Pending rows are lost if the process is killed, close() (also run at
+    exit) writes them out on a clean shutdown.
+    """
+
+    def __init__(self, flush, max_size=500, interval=1.0, max_pending=100000):
+        self.write = flush
+        self.max_size = max_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.dropped = 0
+        self.failures = 0
+        self._rows = []
+        self._closed = False
+        self._thread = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return len(self._rows)
+
+    def add(self, row):
+        """Queue row, return False when the buffer is full."""
+        with self._condition:
+            if len(self._rows) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._rows.append(row)
+            if self._thread is None:
+                self._start()
+            if len(self._rows) == 1 or len(self._rows) >= self.max_size:
+                self._condition.notify()
+        return True
+
+    def flush(self):
+        """Write every pending row now, in batches of max_size."""
+        with self._flush_lock:
+            with self._condition:
+                rows, self._rows = self._rows, []
+            for start in range(0, len(rows), self.max_size):
+                batch = rows[start : start + self.max_size]
+                try:
+                    self.write(batch)
+                except Exception:
+                    self.failures += 1
+                    logger.exception("Flushing %s quiz results failed", len(batch))
+                    with self._condition:
+                        self._rows[:0] = rows[start:]
+                    return
+                self.flushed += len(batch)
+
+    def close(self, timeout=5):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        else:
+            self.flush()
+
+    def _start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="trivia-results", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._rows and not self._closed:
+                    self._condition.wait()
+                deadline = time.monotonic() + self.interval
+                while len(self._rows) < self.max_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
@@ -0,0 +1,115 @@
+import re
+from sqlalchemy import event, exc, func, literal_column, or_, table, column, text
+from models import Question
+
+
+"""
+Full text search over question and answer.
+
+PostgreSQL keeps a generated tsvector column with a GIN index, SQLite keeps
+an external content FTS5 table synced by triggers. Other backends, or
+databases where the index was never installed, fall back to ILIKE.
+"""
+
+POSTGRES_DDL = [
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', "
+    "coalesce(question, '') || ' ' || coalesce(answer, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_questions_search_vector "
+    "ON questions USING GIN (search_vector)",
+]
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+    "question, answer, content='questions', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions "
+    "BEGIN INSERT INTO questions_fts(rowid, question, answer) "
+    "VALUES (new.id, new.question, new.answer); END",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions "
+    "BEGIN INSERT INTO questions_fts(questions_fts, rowid, question, answer) "
+    "VALUES ('delete', old.id, old.question, old.answer); END",
+    "CREATE TRIGGER IF NOT EXISTS questions_fts_update AFTER UPDATE ON questions "
+    "BEGIN INSERT INTO questions_fts(questions_fts, rowid, question, answer) "
+    "VALUES ('delete', old.id, old.question, old.answer); "
+    "INSERT INTO questions_fts(rowid, question, answer) "
+    "VALUES (new.id, new.question, new.answer); END",
+    "INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')",
+]
+
+fts_table = table("questions_fts", column("rowid"), column("rank"))
+search_vector = literal_column("questions.search_vector")
+
+# Whether the search index exists, per database url
+_installed = {}
+
+
+def install(connection):
+    """Create the search index for the connection dialect, idempotent."""
+    statements = {"postgresql": POSTGRES_DDL, "sqlite": SQLITE_DDL}
+    for statement in statements.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+    _installed.pop(str(connection.engine.url), None)
+
+
+@event.listens_for(Question.__table__, "after_create")
+def install_after_create(target, connection, **kwargs):
+    try:
+        install(connection)
+    except exc.OperationalError:
+        # SQLite built without FTS5, searches fall back to ILIKE
+        pass
+
+
+def is_installed(session):
+    bind = session.get_bind()
+    key = str(bind.url)
+    if key not in _installed:
+        if bind.dialect.name == "sqlite":
+            statement = (
+                "SELECT count(*) FROM sqlite_master "
+                "WHERE type = 'table' AND name = 'questions_fts'"
+            )
+        elif bind.dialect.name == "postgresql":
+            statement = (
+                "SELECT count(*) FROM information_schema.columns "
+                "WHERE table_name = 'questions' AND column_name = 'search_vector'"
+            )
+        else:
+            return False
+        _installed[key] = bool(session.execute(text(statement)).scalar())
+    return _installed[key]
+
+
+def terms(search_term):
+    return re.findall(r"\w+", search_term.lower())
+
+
+def search(query, session, search_term):
+    """
+    Filter query down to the questions with a word starting with each word
+    of search_term, best matches first.
+    """
+    words = terms(search_term)
+    if not words or not is_installed(session):
+        return ilike(query, search_term)
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        match = " ".join('"{}"*'.format(word) for word in words)
+        return (
+            query.join(fts_table, fts_table.c.rowid == Question.id)
+            .filter(literal_column("questions_fts").match(match))
+            .order_by(fts_table.c.rank)
+        )
+    tsquery = func.to_tsquery("english", " & ".join(w + ":*" for w in words))
+    return query.filter(search_vector.op("@@")(tsquery)).order_by(
+        func.ts_rank(search_vector, tsquery).desc()
+    )
+
+
+def ilike(query, search_term):
+    return query.filter(
+        or_(
+            Question.question.ilike("%{}%".format(search_term)),
+            Question.answer.ilike("%{}%".format(search_term)),
+        )
+    )
@@ -0,0 +1,305 @@
+import datetime
+from flask import current_app
+from error_handlers import ApiError
+from flaskr import grading
+from flaskr.pagination import encode_cursor, decode_cursor
+from flaskr.quiz_engine import difficulty_bands
+
+
+"""
+Service layer shared by the Flask routes and the ASGI app.
+
+Services hold the logic of each endpoint on top of the repositories and take
+already parsed arguments, so every serving mode validates and dumps with the
+same schemas around the same calls.
+"""
+
+
+def _difficulty_counts(counts):
+    return [
+        {"difficulty": difficulty or None, "total_questions": count}
+        for difficulty, count in sorted(counts.items())
+    ]
+
+
+class CategoryService(object):
+    def __init__(self, category_repository):
+        self.category_repository = category_repository
+
+    def list(self):
+        return self.category_repository.all()
+
+    def get(self, id):
+        return self.category_repository.find(id)
+
+    def create(self, entity):
+        return self.category_repository.insert(**entity)
+
+
+class QuestionService(object):
+    def __init__(self, question_repository, category_repository):
+        self.question_repository = question_repository
+        self.category_repository = category_repository
+
+    def list(
+        self,
+        page=0,
+        limit=10,
+        current_category=None,
+        search_term=None,
+        pagination="page",
+        after=None,
+        include_count=False,
+    ):
+        categories = self.category_repository.all()
+        query = self.question_repository.listing(current_category, search_term)
+        result = {
+            "categories": categories,
+            "current_category": current_category,
+        }
+        if pagination == "cursor" or after:
+            after_id = decode_cursor(after, current_category) if after else None
+            questions, has_more = self.question_repository.keyset(query, after_id, limit)
+            result["next_cursor"] = (
+                encode_cursor(questions[-1].id, current_category)
+                if has_more and questions
+                else None
+            )
+            if include_count:
+                result["total_questions"] = self.question_repository.count(
+                    current_category, search_term
+                )
+        else:
+            questions = self.question_repository.page(query, page, limit)
+            result["total_questions"] = self.question_repository.count(
+                current_category, search_term
+            )
+        result["questions"] = questions
+        return result
+
+    def create(self, entity):
+        self.category_repository.find(entity["category_id"])
+        return self.question_repository.insert(**entity)
+
+    def delete(self, id):
+        self.question_repository.delete(id)
+
+    def bulk_update(self, entity):
+        values = entity["values"]
+        if "category_id" in values:
+            self.category_repository.find(values["category_id"])
+        updated = self.question_repository.bulk_update(
+            ids=entity.get("ids"),
+            where=self.question_repository.criteria(**entity.get("filter", {})),
+            **values
+        )
+        return {"updated": updated}
+
+    def bulk_delete(self, entity):
+        deleted = self.question_repository.bulk_delete(
+            ids=entity.get("ids"),
+            where=self.question_repository.criteria(**entity.get("filter", {})),
+        )
+        return {"deleted": deleted}
+
+    def stats(self):
+        """
+        Question counts overall, per difficulty and per category, from the
+        question_counts table. Unknown categories and difficulties show as
+        null.
+        """
+        categories = {
+            category["id"]: dict(category, total_questions=0, difficulties={})
+            for category in self.category_repository.all()
+        }
+        difficulties = {}
+        total = 0
+        for category_id, difficulty, count in self.question_repository.counts():
+            category = categories.get(category_id)
+            if category is None:
+                category = categories[category_id] = dict(
+                    id=category_id or None,
+                    type=None,
+                    total_questions=0,
+                    difficulties={},
+                )
+            category["total_questions"] += count
+            category["difficulties"][difficulty] = count
+            difficulties[difficulty] = difficulties.get(difficulty, 0) + count
+            total += count
+        for category in categories.values():
+            category["difficulties"] = _difficulty_counts(category["difficulties"])
+        return {
+            "total_questions": total,
+            "difficulties": _difficulty_counts(difficulties),
+            "categories": list(categories.values()),
+        }
+
+
+class QuizService(object):
+    def __init__(self, question_repository, category_repository):
+        self.question_repository = question_repository
+        self.category_repository = category_repository
+
+    @property
+    def sessions(self):
+        return current_app.quiz_sessions
+
+    def _category_id(self, category_id):
+        if category_id:
+            return self.category_repository.find(category_id)["id"]
+        return None
+
+    def next_question(
+        self,
+        category_id=None,
+        previous_questions=None,
+        difficulty=None,
+        min_difficulty=None,
+        max_difficulty=None,
+        adaptive=False,
+        score=0,
+    ):
+        category_id = self._category_id(category_id)
+        bands = difficulty_bands(
+            difficulty=difficulty,
+            min_difficulty=min_difficulty,
+            max_difficulty=max_difficulty,
+            adaptive=adaptive,
+            score=score,
+            answered=len(previous_questions or ()),
+        )
+        for difficulties in bands:
+            question = self.question_repository.random(
+                category_id=category_id,
+                exclude=previous_questions,
+                difficulties=difficulties,
+            )
+            if question:
+                return question
+        raise ApiError(message="No questions left, game is over.", status_code=404)
+
+    def round(self, category_id=None, previous_questions=None, count=5):
+        category_id = self._category_id(category_id)
+        questions = self.question_repository.sample(
+            count, category_id=category_id, exclude=previous_questions
+        )
+        if not questions:
+            raise ApiError(message="No questions left, game is over.", status_code=404)
+        return {"quiz_category": category_id, "questions": questions}
+
+    def grade(self, answers, fuzzy=False):
+        """
+        Grade (question_id, guess) pairs against the stored answer forms of
+        their questions, all loaded with one query. Questions without stored
+        forms (not backfilled yet) are graded against their answer's forms.
+        """
+        ids = sorted(set(answer["question_id"] for answer in answers))
+        forms = self.question_repository.answer_forms(ids)
+        for id in ids:
+            if id not in forms:
+                raise ApiError(
+                    message="Question not found with id {}".format(id), status_code=404
+                )
+        ratio = current_app.config.get("GRADE_FUZZY_RATIO", 0.85) if fuzzy else None
+        results = []
+        for answer in answers:
+            correct_answer, accepted = forms[answer["question_id"]]
+            if not accepted:
+                accepted = set(grading.answer_forms(correct_answer))
+            results.append(
+                {
+                    "question_id": answer["question_id"],
+                    "guess": answer["guess"],
+                    "correct": grading.grade(answer["guess"], accepted, ratio),
+                    "answer": correct_answer,
+                }
+            )
+        return {
+            "results": results,
+            "score": sum(1 for result in results if result["correct"]),
+        }
+
+    def create_session(self, category_id=None):
+        # Sessions keep at most QUIZ_SESSION_DECK_SIZE ids, not the whole bank
+        category_id = self._category_id(category_id)
+        question_ids = self.question_repository.sample_ids(
+            current_app.config.get("QUIZ_SESSION_DECK_SIZE", 100),
+            category_id=category_id,
+        )
+        return {
+            "session_id": self.sessions.create(question_ids),
+            "quiz_category": category_id,
+            "total_questions": len(question_ids),
+        }
+
+    def session_question(self, session_id):
+        while True:
+            try:
+                question_id = self.sessions.pop(session_id)
+            except KeyError:
+                raise ApiError(
+                    message="Quiz session not found with id {}".format(session_id),
+                    status_code=404,
+                )
+            if question_id is None:
+                raise ApiError(
+                    message="No questions left, game is over.", status_code=404
+                )
+            # Questions deleted since the deck was dealt are skipped
+            question = self.question_repository.filter().get(question_id)
+            if question:
+                return question
+
+    def delete_session(self, session_id):
+        self.sessions.delete(session_id)
+
+
+class ResultService(object):
+    def __init__(self, result_repository, category_repository):
+        self.result_repository = result_repository
+        self.category_repository = category_repository
+
+    @property
+    def buffer(self):
+        return current_app.quiz_results
+
+    def _category_id(self, category_id):
+        if category_id:
+            self.category_repository.find(category_id)
+            return category_id
+        return None
+
+    def submit(self, entity):
+        """Queue a quiz result, it is written by the next buffer flush."""
+        result = {
+            "player": entity["player"],
+            "category_id": self._category_id(entity.get("quiz_category")),
+            "score": entity["score"],
+            "total": entity["total"],
+            "created_at": datetime.datetime.utcnow(),
+        }
+        if not self.buffer.add(result):
+            raise ApiError(
+                message="Too many results pending, try again later.", status_code=503
+            )
+        return result
+
+    def save(self, results):
+        """Write a batch of buffered results with one statement and one commit."""
+        return self.result_repository.bulk_insert(results)
+
+    def leaderboard(self, category_id=None, limit=None):
+        category_id = self._category_id(category_id)
+        return {
+            "quiz_category": category_id,
+            "results": self.result_repository.top(category_id, limit),
+        }
+
+
+class Services(object):
+    def __init__(self, category_repository, question_repository, result_repository):
+        self.categories = CategoryService(category_repository)
+        self.questions = QuestionService(question_repository, category_repository)
+        self.quizzes = QuizService(question_repository, category_repository)
+        self.results = ResultService(result_repository, category_repository)
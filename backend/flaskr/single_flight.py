@@ -0,0 +1,96 @@
+import threading
+import time
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    In-process request coalescing.
+
+    Concurrent do() calls with the same key run fn once: the first caller
+    runs it, the others wait and get its result (or its exception).
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class RedisSingleFlight(object):
+    """
+    Request coalescing across processes through a Redis compatible client.
+
+    Calls are first coalesced in process. Across processes the first one
+    takes a lock with `set nx`, runs fn and publishes its bytes for
+    result_ttl seconds; the others poll for them, and run fn themselves if
+    the lock is released without a result or lock_ttl runs out. Only get,
+    set (with nx and px) and delete are used.
+    """
+
+    prefix = "trivia:flight"
+
+    def __init__(self, client, lock_ttl=5, result_ttl=1, poll_interval=0.01):
+        self.client = client
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.local = SingleFlight()
+
+    @property
+    def shared(self):
+        return self.local.shared
+
+    def do(self, key, fn):
+        return self.local.do(key, lambda: self._do(key, fn))
+
+    def _do(self, key, fn):
+        base = "{}:{}".format(self.prefix, key)
+        lock_key, result_key = base + ":lock", base + ":result"
+        deadline = time.monotonic() + self.lock_ttl
+        while True:
+            result = self.client.get(result_key)
+            if result is not None:
+                self.local.shared += 1
+                return result
+            if self.client.set(lock_key, "1", nx=True, px=int(self.lock_ttl * 1000)):
+                break
+            if time.monotonic() > deadline:
+                return fn()
+            time.sleep(self.poll_interval)
+        try:
+            result = fn()
+            self.client.set(result_key, result, px=int(self.result_ttl * 1000))
+            return result
+        finally:
+            self.client.delete(lock_key)
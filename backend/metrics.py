@@ -0,0 +1,248 @@
+import logging
+import threading
+import time
+import weakref
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+
+"""
+Minimal Prometheus style metrics, rendered in the text exposition format.
+
+REGISTRY holds the process wide metrics (database pool and queries), apps
+keep their own Registry for metrics tied to their state.
+"""
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger("trivia.sql")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(
+                name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+            )
+            for name, value in labels
+        )
+    )
+
+
+class Metric(object):
+    type = "untyped"
+
+    def __init__(self, name, help, callback=None):
+        self.name = name
+        self.help = help
+        # callback returns a list of (labels dict, value) read at scrape time
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        if self.callback is not None:
+            return [
+                (self.name, tuple(sorted(labels.items())), value)
+                for labels, value in self.callback()
+            ]
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+    def render(self):
+        lines = [
+            "# HELP {} {}".format(self.name, self.help),
+            "# TYPE {} {}".format(self.name, self.type),
+        ]
+        for name, labels, value in self.samples():
+            lines.append("{}{} {}".format(name, _format_labels(labels), repr(float(value))))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, (counts, count, total) in self._values.items():
+                for bound, bucket in zip(self.buckets, counts):
+                    samples.append(
+                        (self.name + "_bucket", labels + (("le", repr(float(bound))),), bucket)
+                    )
+                samples.append((self.name + "_bucket", labels + (("le", "+Inf"),), count))
+                samples.append((self.name + "_count", labels, count))
+                samples.append((self.name + "_sum", labels, total))
+        return samples
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "".join(metric.render() + "\n" for metric in self.metrics)
+
+
+REGISTRY = Registry()
+
+POOL_CHECKOUT_SECONDS = REGISTRY.register(
+    Histogram(
+        "trivia_db_pool_checkout_seconds",
+        "Time spent waiting for a connection from the pool.",
+    )
+)
+CONNECTIONS_ACTIVE = REGISTRY.register(
+    Gauge("trivia_db_connections_active", "Connections checked out of the pool.")
+)
+CONNECTIONS_CREATED = REGISTRY.register(
+    Counter("trivia_db_connections_created_total", "New DBAPI connections opened.")
+)
+QUERY_SECONDS = REGISTRY.register(
+    Histogram("trivia_db_query_seconds", "Time spent executing SQL statements.")
+)
+SLOW_QUERIES = REGISTRY.register(
+    Counter(
+        "trivia_db_slow_queries_total",
+        "Statements slower than DB_SLOW_QUERY_MS.",
+    )
+)
+
+_engines = weakref.WeakSet()
+
+
+def _pool_samples(method):
+    def callback():
+        return [
+            ({"database": repr(engine.url)}, getattr(engine.pool, method)())
+            for engine in list(_engines)
+            if hasattr(engine.pool, method)
+        ]
+
+    return callback
+
+
+REGISTRY.register(
+    Gauge("trivia_db_pool_size", "Configured pool size.", _pool_samples("size"))
+)
+REGISTRY.register(
+    Gauge(
+        "trivia_db_pool_overflow",
+        "Connections opened beyond the pool size.",
+        _pool_samples("overflow"),
+    )
+)
+
+
+def slow_query_threshold():
+    if has_app_context():
+        return current_app.config.get("DB_SLOW_QUERY_MS", 200) / 1000.0
+    return 0.2
+
+
+def _time_checkouts(engine, database):
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start, database=database)
+
+    pool.connect = timed_connect
+
+
+def instrument_engine(engine):
+    """
+    Record pool checkouts, connections and statement timings of engine,
+    logging statements slower than DB_SLOW_QUERY_MS with their SQL text.
+    """
+    database = repr(engine.url)
+    _engines.add(engine)
+    _time_checkouts(engine, database)
+
+    @event.listens_for(engine, "engine_disposed")
+    def engine_disposed(engine):
+        # dispose() replaces the pool, time the new one as well
+        _time_checkouts(engine, database)
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        CONNECTIONS_CREATED.inc(database=database)
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        CONNECTIONS_ACTIVE.inc(database=database)
+
+    @event.listens_for(engine, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        CONNECTIONS_ACTIVE.dec(database=database)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        QUERY_SECONDS.observe(elapsed, database=database)
+        if elapsed >= slow_query_threshold():
+            SLOW_QUERIES.inc(database=database)
+            logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start")
+        if starts:
+            starts.pop()
+
+    return engine
@@ -0,0 +1,189 @@
+import datetime
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    select,
+    text,
+)
+from sqlalchemy import func
+from flaskr import grading, search
+
+
+"""
+Versioned schema migrations.
+
+Every migration runs once, in its own transaction, and is recorded in the
+schema_migrations table. They are applied with `flask migrate_db` as a
+deployment step instead of on every app start.
+
+Migrations declare the tables they touch as they were at their version
+instead of importing the models, so later model changes never alter what
+an old migration does: fresh and upgraded databases go through the same
+steps. A schema change is a new migration, along with the model change.
+"""
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String),
+    Column("applied_at", DateTime),
+)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        return f
+
+    return decorator
+
+
+@migration(1, "Create categories, questions and table_versions")
+def create_tables(connection):
+    metadata = MetaData()
+    Table(
+        "categories",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("type", String),
+    )
+    Table(
+        "questions",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("question", String),
+        Column("answer", String),
+        Column("category_id", Integer, ForeignKey("categories.id")),
+        Column("difficulty", Integer),
+    )
+    Table(
+        "table_versions",
+        metadata,
+        Column("name", String, primary_key=True),
+        Column("version", Integer, nullable=False, default=0),
+    )
+    metadata.create_all(connection)
+
+
+@migration(2, "Index questions by (category_id, id) and (category_id, difficulty)")
+def create_question_indexes(connection):
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_questions_category_id_id "
+            "ON questions (category_id, id)"
+        )
+    )
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_questions_category_id_difficulty "
+            "ON questions (category_id, difficulty)"
+        )
+    )
+
+
+@migration(3, "Full text search index on question and answer")
+def create_search_index(connection):
+    search.install(connection)
+
+
+@migration(4, "Question counts per (category_id, difficulty)")
+def create_question_counts(connection):
+    metadata = MetaData()
+    questions = Table(
+        "questions",
+        metadata,
+        Column("category_id", Integer),
+        Column("difficulty", Integer),
+    )
+    question_counts = Table(
+        "question_counts",
+        metadata,
+        Column("category_id", Integer, primary_key=True, autoincrement=False),
+        Column("difficulty", Integer, primary_key=True, autoincrement=False),
+        Column("count", Integer, nullable=False, default=0),
+    )
+    question_counts.create(connection, checkfirst=True)
+    category_id = func.coalesce(questions.c.category_id, 0)
+    difficulty = func.coalesce(questions.c.difficulty, 0)
+    connection.execute(
+        question_counts.insert().from_select(
+            ["category_id", "difficulty", "count"],
+            select([category_id, difficulty, func.count()]).group_by(
+                category_id, difficulty
+            ),
+        )
+    )
+
+
+@migration(5, "Create quiz_results")
+def create_quiz_results(connection):
+    metadata = MetaData()
+    Table("categories", metadata, Column("id", Integer, primary_key=True))
+    quiz_results = Table(
+        "quiz_results",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("player", String, nullable=False),
+        Column("category_id", Integer, ForeignKey("categories.id")),
+        Column("score", Integer, nullable=False),
+        Column("total", Integer, nullable=False),
+        Column("created_at", DateTime, nullable=False),
+        Index("ix_quiz_results_category_id_score", "category_id", "score"),
+    )
+    quiz_results.create(connection, checkfirst=True)
+
+
+@migration(6, "Normalized answer forms of the questions")
+def create_answer_forms(connection):
+    metadata = MetaData()
+    Table("questions", metadata, Column("id", Integer, primary_key=True))
+    answer_forms = Table(
+        "answer_forms",
+        metadata,
+        Column(
+            "question_id",
+            Integer,
+            ForeignKey("questions.id", ondelete="CASCADE"),
+            primary_key=True,
+            autoincrement=False,
+        ),
+        Column("form", String, primary_key=True),
+    )
+    answer_forms.create(connection, checkfirst=True)
+    grading.backfill(connection)
+
+
+def applied(engine):
+    with engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+        rows = connection.execute(select([schema_migrations.c.version]))
+        return set(version for (version,) in rows)
+
+
+def pending(engine):
+    done = applied(engine)
+    return [entry for entry in sorted(MIGRATIONS) if entry[0] not in done]
+
+
+def upgrade(engine):
+    """Apply the pending migrations in order, yielding each one once applied."""
+    for version, description, function in pending(engine):
+        with engine.begin() as connection:
+            function(connection)
+            connection.execute(
+                schema_migrations.insert().values(
+                    version=version,
+                    description=description,
+                    applied_at=datetime.datetime.utcnow(),
+                )
+            )
+        yield version, description
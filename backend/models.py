@@ -1,26 +1,77 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine, ForeignKey
+from sqlalchemy import Column, DateTime, String, Integer, ForeignKey, Index
+from sqlalchemy import create_engine, func, select, text
 from sqlalchemy.orm import relationship
 from flask_sqlalchemy import SQLAlchemy
 import json
+import metrics
 
 database_name = "trivia"
-database_path = "postgres://{}/{}".format("postgres:root@localhost:5432", database_name)
+database_path = os.environ.get(
+    "DATABASE_URL",
+    "postgres://{}/{}".format("postgres:root@localhost:5432", database_name),
+)
+
+
+class InstrumentedSQLAlchemy(SQLAlchemy):
+    def create_engine(self, sa_url, engine_opts):
+        engine = SQLAlchemy.create_engine(self, sa_url, engine_opts)
+        return metrics.instrument_engine(engine)
+
+
+db = InstrumentedSQLAlchemy()
+
+# Largest value of the Integer id columns (a Postgres integer)
+MAX_ID = 2 ** 31 - 1
+
+
+def get_setting(app, name, default, type=str):
+    """Read a setting from the app config, then the environment."""
+    value = app.config.get(name, os.environ.get(name))
+    if value is None:
+        return default
+    if type is bool and isinstance(value, str):
+        return value.lower() in ("1", "true", "yes", "on")
+    return type(value)
+
+
+def engine_options(app, database_path):
+    """
+    Pool and connection settings of the engine, from DB_POOL_SIZE,
+    DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING and
+    DB_STATEMENT_TIMEOUT_MS. DB_ENGINE_OPTIONS can override any of them.
+    """
+    options = {
+        "pool_recycle": get_setting(app, "DB_POOL_RECYCLE", 1800, int),
+        "pool_pre_ping": get_setting(app, "DB_POOL_PRE_PING", True, bool),
+    }
+    if not database_path.startswith("sqlite"):
+        options["pool_size"] = get_setting(app, "DB_POOL_SIZE", 5, int)
+        options["max_overflow"] = get_setting(app, "DB_MAX_OVERFLOW", 10, int)
+        options["pool_timeout"] = get_setting(app, "DB_POOL_TIMEOUT", 30, int)
+    statement_timeout = get_setting(app, "DB_STATEMENT_TIMEOUT_MS", 0, int)
+    if statement_timeout and database_path.startswith("postgres"):
+        options["connect_args"] = {
+            "options": "-c statement_timeout={}".format(statement_timeout)
+        }
+    options.update(app.config.get("DB_ENGINE_OPTIONS", {}))
+    return options
 
-db = SQLAlchemy()
 
 """
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service.
+    The schema is managed by the migrations, see `flask migrate_db`
 """
 
 
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app, database_path)
+    app.config["DB_SLOW_QUERY_MS"] = get_setting(app, "DB_SLOW_QUERY_MS", 200, int)
     db.app = app
     db.init_app(app)
-    db.create_all()
 
     return db
 
@@ -53,6 +104,10 @@ Question
 
 class Question(db.Model):
     __tablename__ = "questions"
+    __table_args__ = (
+        Index("ix_questions_category_id_id", "category_id", "id"),
+        Index("ix_questions_category_id_difficulty", "category_id", "difficulty"),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
@@ -86,3 +141,171 @@ class Question(db.Model):
             "category": self.category,
             "difficulty": self.difficulty,
         }
+
+
+def increment(session, table, keys, column, amount):
+    """
+    Add amount to column of the row of table identified by keys, a
+    {primary key column: value} mapping, inserting the row with amount when
+    it is missing. Runs as a single INSERT ... ON CONFLICT DO UPDATE
+    (PostgreSQL 9.5+, SQLite 3.24+), so concurrent transactions creating
+    the same row add up instead of failing on its primary key.
+    """
+    names = list(keys)
+    session.execute(
+        text(
+            "INSERT INTO {table} ({columns}) VALUES ({values}) "
+            "ON CONFLICT ({keys}) DO UPDATE "
+            "SET {column} = {table}.{column} + excluded.{column}".format(
+                table=table.name,
+                columns=", ".join(names + [column]),
+                values=", ".join(":" + name for name in names + [column]),
+                keys=", ".join(names),
+                column=column,
+            )
+        ),
+        dict(keys, **{column: amount}),
+    )
+
+
+"""
+TableVersion
+    a counter per table, bumped in the same transaction as every write made
+    through the repositories. Used to build cheap ETags for read endpoints.
+"""
+
+
+class TableVersion(db.Model):
+    __tablename__ = "table_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+    @staticmethod
+    def bump(session, name):
+        increment(session, TableVersion.__table__, {"name": name}, "version", 1)
+
+    @staticmethod
+    def current(session, names):
+        rows = session.query(TableVersion.name, TableVersion.version).filter(
+            TableVersion.name.in_(names)
+        )
+        versions = dict(rows)
+        return [versions.get(name, 0) for name in names]
+
+
+"""
+QuestionCount
+    number of questions per (category, difficulty), kept up to date in the
+    transaction of every question write made through QuestionRepository.
+    Questions without a category or difficulty are counted under 0.
+"""
+
+
+class QuestionCount(db.Model):
+    __tablename__ = "question_counts"
+
+    category_id = Column(Integer, primary_key=True, autoincrement=False)
+    difficulty = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    @staticmethod
+    def key(category_id, difficulty):
+        return category_id or 0, difficulty or 0
+
+    @staticmethod
+    def apply(session, deltas):
+        """Add deltas, a {(category_id, difficulty): change} mapping, to the counts."""
+        # Sorted, so concurrent writers lock the rows in the same order
+        for (category_id, difficulty), delta in sorted(deltas.items()):
+            if not delta:
+                continue
+            increment(
+                session,
+                QuestionCount.__table__,
+                {"category_id": category_id, "difficulty": difficulty},
+                "count",
+                delta,
+            )
+
+    @staticmethod
+    def total(session, category_id=None):
+        query = session.query(func.coalesce(func.sum(QuestionCount.count), 0))
+        if category_id:
+            query = query.filter(QuestionCount.category_id == category_id)
+        return query.scalar()
+
+    @staticmethod
+    def rows(session):
+        return session.query(
+            QuestionCount.category_id, QuestionCount.difficulty, QuestionCount.count
+        ).filter(QuestionCount.count != 0)
+
+    @staticmethod
+    def reconcile(session):
+        """
+        Recount the questions table and correct the counters that drifted,
+        return them as {(category_id, difficulty): (counted, stored)}.
+        """
+        table = Question.__table__
+        counted = {}
+        for category_id, difficulty, count in session.execute(
+            select([table.c.category_id, table.c.difficulty, func.count()]).group_by(
+                table.c.category_id, table.c.difficulty
+            )
+        ):
+            key = QuestionCount.key(category_id, difficulty)
+            counted[key] = counted.get(key, 0) + count
+        stored = {
+            (category_id, difficulty): count
+            for category_id, difficulty, count in QuestionCount.rows(session)
+        }
+        drift = {
+            key: (counted.get(key, 0), stored.get(key, 0))
+            for key in set(counted) | set(stored)
+            if counted.get(key, 0) != stored.get(key, 0)
+        }
+        QuestionCount.apply(
+            session, {key: counted - stored for key, (counted, stored) in drift.items()}
+        )
+        return drift
+
+
+"""
+QuizResult
+    the score of a finished quiz. category_id is null for quizzes played
+    over every category.
+"""
+
+
+class QuizResult(db.Model):
+    __tablename__ = "quiz_results"
+    __table_args__ = (
+        Index("ix_quiz_results_category_id_score", "category_id", "score"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    player = Column(String, nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"))
+    score = Column(Integer, nullable=False)
+    total = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+
+"""
+AnswerForm
+    a normalized answer accepted for a question, see flaskr.grading. Stored
+    with the question by QuestionRepository and deleted along with it.
+"""
+
+
+class AnswerForm(db.Model):
+    __tablename__ = "answer_forms"
+
+    question_id = Column(
+        Integer,
+        ForeignKey("questions.id", ondelete="CASCADE"),
+        primary_key=True,
+        autoincrement=False,
+    )
+    form = Column(String, primary_key=True)
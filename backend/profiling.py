@@ -0,0 +1,159 @@
+import cProfile
+import glob
+import os
+import pstats
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import get_setting
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+
+"""
+Opt-in request profiling.
+
+SERVER_TIMING adds a Server-Timing header splitting every response into
+parse, db, serialize and total time. PROFILE_SAMPLE_RATE profiles that
+fraction of the requests with cProfile (or pyinstrument when PROFILER is
+"pyinstrument"), writing one capture per request to PROFILE_DIR.
+`flask profile_report` aggregates the cProfile captures per route.
+"""
+
+STAGES = ("parse", "db", "serialize")
+
+
+def record(stage, seconds):
+    if has_request_context() and "timings" in g:
+        g.timings[stage] += seconds
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+# Statement start times are kept on g rather than on the pooled connection,
+# so the start of a statement that failed goes away with its request.
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "timings" in g:
+        g.setdefault("profile_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stop_statement()
+
+
+@event.listens_for(Engine, "handle_error")
+def handle_error(context):
+    stop_statement()
+
+
+def stop_statement():
+    starts = g.get("profile_start") if has_request_context() else None
+    if starts:
+        record("db", time.perf_counter() - starts.pop())
+
+
+def capture_path(directory, extension):
+    return os.path.join(
+        directory,
+        "{}-{}-{}-{}.{}".format(
+            request.endpoint,
+            request.method,
+            int(time.time() * 1000),
+            os.getpid(),
+            extension,
+        ),
+    )
+
+
+def init_app(app):
+    @app.before_request
+    def start_profiling():
+        if get_setting(app, "SERVER_TIMING", False, bool):
+            g.request_start = time.perf_counter()
+            g.timings = defaultdict(float)
+        rate = get_setting(app, "PROFILE_SAMPLE_RATE", 0.0, float)
+        if rate and random.random() < rate:
+            if get_setting(app, "PROFILER", "cprofile") == "pyinstrument" and pyinstrument:
+                g.profiler = pyinstrument.Profiler()
+                g.profiler.start()
+            else:
+                g.profiler = cProfile.Profile()
+                g.profiler.enable()
+
+    @app.after_request
+    def stop_profiling(response):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            directory = get_setting(app, "PROFILE_DIR", "profiles")
+            os.makedirs(directory, exist_ok=True)
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+                profiler.dump_stats(capture_path(directory, "prof"))
+            else:
+                profiler.stop()
+                with open(capture_path(directory, "html"), "w") as file:
+                    file.write(profiler.output_html())
+        if "timings" in g:
+            timings = g.pop("timings")
+            total = time.perf_counter() - g.pop("request_start")
+            response.headers["Server-Timing"] = ", ".join(
+                ["{};dur={:.2f}".format(stage, timings[stage] * 1000) for stage in STAGES]
+                + ["total;dur={:.2f}".format(total * 1000)]
+            )
+        return response
+
+    @app.teardown_request
+    def discard_profiler(exception=None):
+        g.pop("profile_start", None)
+        profiler = g.pop("profiler", None)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        elif profiler is not None:
+            profiler.stop()
+
+
+def report(directory, top=20, sort="tottime"):
+    """
+    Aggregate the cProfile captures of directory per route and return the
+    top functions of each as text lines.
+    """
+    routes = defaultdict(list)
+    for path in glob.glob(os.path.join(directory, "*.prof")):
+        endpoint, method = os.path.basename(path).split("-")[:2]
+        routes["{} {}".format(method, endpoint)].append(path)
+    lines = []
+    for route in sorted(routes):
+        stats = pstats.Stats(*routes[route])
+        rows = sorted(
+            stats.stats.items(),
+            key=lambda item: item[1][2] if sort == "tottime" else item[1][3],
+            reverse=True,
+        )
+        lines.append("{} ({} captures)".format(route, len(routes[route])))
+        lines.append(
+            "{:>10} {:>12} {:>12}  {}".format("ncalls", "tottime (s)", "cumtime (s)", "function")
+        )
+        for (filename, line, function), (cc, ncalls, tottime, cumtime, callers) in rows[:top]:
+            lines.append(
+                "{:>10} {:>12.4f} {:>12.4f}  {}:{}({})".format(
+                    ncalls, tottime, cumtime, filename, line, function
+                )
+            )
+        lines.append("")
+    return lines
@@ -1,5 +1,5 @@
 from flask_marshmallow import Marshmallow
-from marshmallow import Schema, fields
+from marshmallow import Schema, ValidationError, fields, validate, validates_schema
 
 
 class CategorySchema(Schema):
@@ -26,17 +26,166 @@ class QuestionCollectionSchema(Schema):
         fields.Nested(CategorySchema)
     )
     current_category = fields.String()
+    next_cursor = fields.String()
 
 class QuestionCreateSchema(Schema):
     question = fields.String()
     answer = fields.String()
     category_id = fields.Integer()
     difficulty = fields.Integer()
+    # Other accepted answers, stored normalized with the question
+    aliases = fields.List(fields.String(), validate=validate.Length(max=20))
+
+
+class QuestionFilterSchema(Schema):
+    category_id = fields.Integer()
+    difficulty = fields.Integer(validate=validate.Range(min=1, max=5))
+
+
+class QuestionUpdateSchema(Schema):
+    question = fields.String()
+    answer = fields.String()
+    category_id = fields.Integer()
+    difficulty = fields.Integer(validate=validate.Range(min=1, max=5))
+
+
+class QuestionBulkDeleteSchema(Schema):
+    ids = fields.List(fields.Integer(), validate=validate.Length(min=1, max=10000))
+    filter = fields.Nested(QuestionFilterSchema)
+
+    @validates_schema
+    def validate_target(self, data, **kwargs):
+        if ("ids" in data) == ("filter" in data):
+            raise ValidationError("Pass either ids or filter", "ids")
+        if "filter" in data and not data["filter"]:
+            raise ValidationError("Filter on at least one field", "filter")
+
+
+class QuestionBulkUpdateSchema(QuestionBulkDeleteSchema):
+    values = fields.Nested(
+        QuestionUpdateSchema, required=True, validate=validate.Length(min=1)
+    )
+
+
+class QuestionBulkResultSchema(Schema):
+    updated = fields.Integer()
+    deleted = fields.Integer()
+
+
+class QuestionImportSchema(Schema):
+    inserted = fields.Integer()
+    failed = fields.Integer()
+    errors = fields.List(fields.Dict())
 
 
 class QuizCreateSchema(Schema):
     previous_questions = fields.List(fields.Integer())
     quiz_category = fields.Integer(attribute="quiz_category")
+    difficulty = fields.Integer(validate=validate.Range(min=1, max=5))
+    min_difficulty = fields.Integer(validate=validate.Range(min=1, max=5))
+    max_difficulty = fields.Integer(validate=validate.Range(min=1, max=5))
+    adaptive = fields.Boolean()
+    score = fields.Integer(validate=validate.Range(min=0))
+
+    @validates_schema
+    def validate_band(self, data, **kwargs):
+        if data.get("min_difficulty", 1) > data.get("max_difficulty", 5):
+            raise ValidationError(
+                "min_difficulty can not be greater than max_difficulty",
+                "min_difficulty",
+            )
+
+
+class QuizRoundCreateSchema(Schema):
+    previous_questions = fields.List(fields.Integer())
+    quiz_category = fields.Integer()
+    count = fields.Integer(validate=validate.Range(min=1, max=50))
+
+
+class QuizRoundSchema(Schema):
+    quiz_category = fields.Integer()
+    questions = fields.List(fields.Nested(QuestionSchema))
+
+
+def quiz_schemas(include_answers=False):
+    """
+    Schemas of the questions and rounds served to players. Answers are
+    graded on the server, so they are left out unless include_answers.
+    """
+    exclude = () if include_answers else ("answer",)
+    return (
+        QuestionSchema(exclude=exclude),
+        QuizRoundSchema(exclude=["questions." + name for name in exclude]),
+    )
+
+
+class QuizResultCreateSchema(Schema):
+    player = fields.String(required=True, validate=validate.Length(min=1, max=50))
+    quiz_category = fields.Integer()
+    score = fields.Integer(required=True, validate=validate.Range(min=0))
+    total = fields.Integer(required=True, validate=validate.Range(min=1, max=1000))
+
+    @validates_schema
+    def validate_score(self, data, **kwargs):
+        if "total" in data and data.get("score", 0) > data["total"]:
+            raise ValidationError("score can not be greater than total", "score")
+
+
+class QuizResultSchema(Schema):
+    player = fields.String()
+    quiz_category = fields.Integer(attribute="category_id")
+    score = fields.Integer()
+    total = fields.Integer()
+    created_at = fields.DateTime()
+
+
+class LeaderboardSchema(Schema):
+    quiz_category = fields.Integer()
+    results = fields.List(fields.Nested(QuizResultSchema))
+
+
+class QuizAnswerSchema(Schema):
+    question_id = fields.Integer(required=True)
+    guess = fields.String(required=True)
+
+
+class QuizGradeCreateSchema(Schema):
+    question_id = fields.Integer()
+    guess = fields.String()
+    answers = fields.List(
+        fields.Nested(QuizAnswerSchema), validate=validate.Length(min=1, max=50)
+    )
+    fuzzy = fields.Boolean()
+
+    @validates_schema
+    def validate_answers(self, data, **kwargs):
+        if "answers" in data:
+            if "question_id" in data or "guess" in data:
+                raise ValidationError("Pass either answers or question_id", "answers")
+        elif "question_id" not in data or "guess" not in data:
+            raise ValidationError("Missing data for required field.", "question_id")
+
+
+class QuizGradeSchema(Schema):
+    question_id = fields.Integer()
+    guess = fields.String()
+    correct = fields.Boolean()
+    answer = fields.String()
+
+
+class QuizGradeRoundSchema(Schema):
+    results = fields.List(fields.Nested(QuizGradeSchema))
+    score = fields.Integer()
+
+
+class QuizSessionCreateSchema(Schema):
+    quiz_category = fields.Integer()
+
+
+class QuizSessionSchema(Schema):
+    session_id = fields.String()
+    quiz_category = fields.Integer()
+    total_questions = fields.Integer()
 
 
 class ErrorHandlerSchema(Schema):
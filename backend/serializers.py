@@ -0,0 +1,106 @@
+import json
+from marshmallow import fields, missing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+"""
+Compiled serializers for the flat schemas served by the list endpoints.
+
+compile_schema turns a marshmallow schema into a function building the same
+dict as schema.dump, with the field accessors resolved once instead of on
+every object. dumps encodes it exactly like Flask's jsonify does, using
+orjson when it is installed.
+"""
+
+
+class UnsupportedSchema(TypeError):
+    pass
+
+
+def _get_value(obj, key, default=missing):
+    # Same lookup as marshmallow.utils._get_value_for_key
+    if not hasattr(obj, "__getitem__"):
+        return getattr(obj, key, default)
+    try:
+        return obj[key]
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return getattr(obj, key, default)
+
+
+def _compile_value(field):
+    """Return a function serializing one value the way field._serialize does."""
+    if isinstance(field, fields.Integer) and not field.as_string:
+        return lambda value: None if value is None else int(value)
+    if isinstance(field, fields.String):
+        return lambda value: None if value is None else str(value)
+    if isinstance(field, fields.Nested) and isinstance(field.nested, type):
+        serialize = compile_schema(field.schema)
+        if field.many:
+            return lambda value: None if value is None else [serialize(v) for v in value]
+        return lambda value: None if value is None else serialize(value)
+    if isinstance(field, fields.List):
+        serialize = _compile_value(field.inner)
+        return lambda value: None if value is None else [serialize(v) for v in value]
+    if type(field) is fields.Dict and not field.key_field and not field.value_field:
+        return lambda value: None if value is None else dict(value)
+    raise UnsupportedSchema("Can not compile field {!r}".format(field))
+
+
+def compile_schema(schema):
+    """
+    Build a function returning schema.dump(obj) for a single object.
+
+    Only Integer, String, Dict, List and Nested fields without dump hooks
+    are supported, UnsupportedSchema is raised for anything else.
+    """
+    if schema.many:
+        raise UnsupportedSchema("Can not compile a many=True schema")
+    for hook in ("pre_dump", "post_dump"):
+        if schema._has_processors(hook):
+            raise UnsupportedSchema("Can not compile schemas with {} hooks".format(hook))
+    accessors = []
+    for name, field in schema.dump_fields.items():
+        if "." in (field.attribute or name):
+            raise UnsupportedSchema("Can not compile dotted attribute of {!r}".format(field))
+        default = getattr(field, "dump_default", getattr(field, "default", missing))
+        accessors.append(
+            (
+                field.data_key or name,
+                field.attribute or name,
+                default,
+                _compile_value(field),
+            )
+        )
+
+    def serialize(obj):
+        data = {}
+        for key, attribute, default, serialize_value in accessors:
+            value = _get_value(obj, attribute)
+            if value is missing:
+                if default is missing:
+                    continue
+                value = default() if callable(default) else default
+            data[key] = serialize_value(value)
+        return data
+
+    return serialize
+
+
+def dumps(data):
+    """
+    Encode data as compact, key sorted, ASCII only JSON: the bytes jsonify
+    produces with the default Flask settings, minus the trailing newline.
+    """
+    if orjson is not None:
+        try:
+            body = orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            body = None
+        # orjson writes non ASCII characters and DEL unescaped, json does not
+        if body is not None and body.isascii() and b"\x7f" not in body:
+            return body
+    return json.dumps(data, separators=(",", ":"), sort_keys=True).encode("ascii")
@@ -1,10 +1,30 @@
+import asyncio
+import gzip
 import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 import json
+from contextlib import contextmanager
+from flask import g, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event, inspect
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.asgi import create_asgi_app
+from flaskr.quiz_sessions import RedisSessionStore
+from flaskr.single_flight import SingleFlight, RedisSingleFlight
+from flaskr.rate_limit import TokenBucketLimiter, RedisTokenBucketLimiter
+from flaskr.replicas import ReplicaRouter
+from flaskr.repositories.category_repository import CategoryRepository
+from flaskr.repositories.question_repository import QuestionRepository
+from models import setup_db, db, Question, Category, TableVersion
+import migrations
+from schemas import QuestionCollectionSchema
+from serializers import compile_schema
+from decorators import json_response
 
 CATEGORIES_MOCK = [
     Category(type="category 1"),
@@ -23,6 +43,86 @@ QUESTIONS_MOCK = [
 ]
 
 
+class FakeRedis(object):
+    """Minimal in-memory stand-in for the redis commands used by the app"""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def _expire(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.data.pop(key, None)
+            del self.expires[key]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        self._expire(key)
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value)
+        self.expires.pop(key, None)
+        if px is not None:
+            self.expires[key] = time.monotonic() + px / 1000.0
+        return True
+
+    def get(self, key):
+        self._expire(key)
+        return self.data.get(key)
+
+    def exists(self, key):
+        self._expire(key)
+        return int(key in self.data)
+
+    def expire(self, key, seconds):
+        return int(key in self.data)
+
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(str(value) for value in values)
+        return len(self.data[key])
+
+    def lpop(self, key):
+        values = self.data.get(key)
+        if not values:
+            return None
+        value = values.pop(0)
+        if not values:
+            del self.data[key]
+        return value
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        # Commands of one process can not interleave, there is nothing to watch
+        pipe = FakePipeline(self)
+        result = func(pipe)
+        results = pipe.execute()
+        return result if value_from_callable else results
+
+
+class FakePipeline(object):
+    """Pipeline of FakeRedis, reads run at once and writes queue after multi()"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.queued = None
+
+    def get(self, key):
+        return self.redis.get(key)
+
+    def multi(self):
+        self.queued = []
+
+    def set(self, key, value, **kwargs):
+        self.queued.append((key, value, kwargs))
+
+    def execute(self):
+        return [
+            self.redis.set(key, value, **kwargs)
+            for key, value, kwargs in self.queued or ()
+        ]
+
+
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
@@ -39,7 +139,7 @@ class TriviaTestCase(unittest.TestCase):
             self.db = SQLAlchemy()
             self.db.init_app(self.app)
             # create all tables
-            self.db.create_all()
+            list(migrations.upgrade(db.engine))
 
     def tearDown(self):
         """Executed after reach test"""
@@ -52,6 +152,25 @@ class TriviaTestCase(unittest.TestCase):
     def request(self):
         return self.client()
 
+    @contextmanager
+    def assertNumQueries(self, count):
+        """Fail unless exactly count SQL statements run inside the block"""
+        with self.app.app_context():
+            engine = db.engine
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        self.assertEqual(
+            len(statements), count, "\n\n".join(["Queries issued:"] + statements)
+        )
+
     def _create_category(self, type):
         res = self.request.post("/api/categories", json=dict(type=type))
         data = json.loads(res.data)
@@ -122,6 +241,281 @@ class TriviaTestCase(unittest.TestCase):
         data = self._get_categories()
         self.assertEqual(len(data), 2)
 
+    def test_category_cache(self):
+        with self.app.app_context():
+            repository = CategoryRepository()
+            repository.insert(type="Places")
+            self.assertEqual(len(repository.all()), 1)
+            self.assertEqual(repository.find(1)["type"], "Places")
+            self.assertEqual((repository.cache.hits, repository.cache.misses), (1, 1))
+
+            # Writes drop the cached list
+            repository.insert(type="Animals")
+            self.assertEqual(len(repository.all()), 2)
+            self.assertEqual(repository.cache.misses, 2)
+
+    def test_writes_of_other_workers(self):
+        # A second app on the same database stands for another worker
+        other = create_app()
+        setup_db(other, self.database_path)
+        other_client = other.test_client()
+        self._create_category(type="Places")
+        res = other_client.get("/api/categories")
+        etag = res.headers["ETag"]
+        self.assertEqual(len(json.loads(res.data)), 1)
+        with other.app_context():
+            self.assertEqual(len(other.services.categories.list()), 1)
+
+        # Its caches follow the table versions the ETags are built from
+        self._create_category(type="Animals")
+        res = other_client.get("/api/categories", headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(json.loads(res.data)), 2)
+        res = other_client.post(
+            "/api/questions",
+            json=dict(question="q", answer="a", difficulty=1, category_id=2),
+        )
+        self.assertEqual(res.status_code, 201)
+        self._create_question(QUESTIONS_MOCK[0])
+        res = other_client.get("/api/questions")
+        self.assertEqual(json.loads(res.data)["total_questions"], 2)
+
+    def test_get_metrics(self):
+        self._get_categories()
+        res = self.request.get("/api/_metrics")
+        self.assertEqual(res.status_code, 200)
+        body = res.data.decode()
+        self.assertIn("# TYPE trivia_db_query_seconds histogram", body)
+        self.assertIn('trivia_db_query_seconds_bucket{database="sqlite:///', body)
+        self.assertIn("trivia_db_connections_active", body)
+        self.assertIn("trivia_category_cache_misses_total 1.0", body)
+
+    def test_slow_query_logging(self):
+        self.app.config["DB_SLOW_QUERY_MS"] = 0
+        with self.assertLogs("trivia.sql", level="WARNING") as logs:
+            self._get_categories()
+        self.assertIn("FROM categories", "\n".join(logs.output))
+
+    def test_response_compression(self):
+        self._create_mock_questions()
+        plain = self.request.get("/api/questions")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertIn("Accept-Encoding", plain.headers["Vary"])
+
+        self.app.config["COMPRESS_MIN_SIZE"] = 100
+        res = self.request.get("/api/questions", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+        self.assertLess(len(res.data), len(plain.data))
+
+        # Small bodies are not worth compressing
+        res = self.request.get("/api/categories/1", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", res.headers)
+
+    def test_get_questions_field_selection(self):
+        self._create_mock_questions()
+        res = self.request.get("/api/questions?fields=id,question&exclude=categories")
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertNotIn("categories", data)
+        self.assertEqual(data["total_questions"], len(QUESTIONS_MOCK))
+        self.assertEqual(
+            data["questions"][0], {"id": 1, "question": QUESTIONS_MOCK[0].question}
+        )
+
+        res = self.request.get("/api/questions?fields=id,secret")
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.data)["message"], "Unknown field secret")
+
+    def test_single_flight(self):
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(5)
+            return b"result"
+
+        flight = SingleFlight()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("key", slow)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        while flight.shared < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, [b"result"] * 5))
+
+        # Processes sharing a backend wait for the one holding the lock
+        client = FakeRedis()
+        release.clear()
+        leader = threading.Thread(target=RedisSingleFlight(client).do, args=("key", slow))
+        leader.start()
+        while "trivia:flight:key:lock" not in client.data:
+            time.sleep(0.001)
+        follower = RedisSingleFlight(client, poll_interval=0.001)
+        threading.Timer(0.05, release.set).start()
+        self.assertEqual(follower.do("key", lambda: b"own"), b"result")
+        leader.join()
+        self.assertEqual(len(calls), 2)
+
+    def test_get_questions_coalesced(self):
+        self._create_mock_questions()
+        self.app.single_flight = RedisSingleFlight(FakeRedis(), result_ttl=60)
+        res = self.request.get("/api/questions?limit=3&page=1")
+        self.assertEqual(res.status_code, 200)
+
+        # Same arguments in another order, served from the shared result
+        with self.assertNumQueries(1):
+            shared = self.request.get("/api/questions?page=1&limit=3")
+        self.assertEqual(shared.data, res.data)
+        self.assertEqual(shared.mimetype, "application/json")
+        self.assertEqual(self.app.single_flight.shared, 1)
+
+        # A write changes the versions, so the key
+        self._create_question(QUESTIONS_MOCK[0])
+        res = self.request.get("/api/questions?page=1&limit=3")
+        self.assertEqual(json.loads(res.data)["total_questions"], 7)
+
+    def test_quiz_rate_limit(self):
+        self._create_mock_questions()
+        for limiter in (
+            TokenBucketLimiter(rate=1, burst=2),
+            RedisTokenBucketLimiter(FakeRedis(), rate=1, burst=2),
+        ):
+            self.app.rate_limiter = limiter
+            self.assertEqual(self._create_quiz().status_code, 201)
+            self.assertEqual(self._create_quiz().status_code, 201)
+            res = self._create_quiz()
+            self.assertEqual(res.status_code, 429)
+            self.assertEqual(res.headers["Retry-After"], "1")
+            self.assertEqual(limiter.rejected, 1)
+
+            # Other clients have their own bucket
+            res = self.request.post(
+                "/api/quizzes", json={}, environ_base={"REMOTE_ADDR": "10.0.0.2"}
+            )
+            self.assertEqual(res.status_code, 201)
+
+        # The ASGI quiz routes share the limiter
+        status, headers, body = self._asgi_request(
+            create_asgi_app(self.app, max_workers=1), "POST", "/api/quizzes", {}
+        )
+        self.assertEqual(status, 429)
+        self.assertEqual(headers[b"retry-after"], b"1")
+
+        # Sessions load the whole deck, they have a bucket of their own
+        self.app.rate_limiter = TokenBucketLimiter(rate=1, burst=1)
+        for status_code in (201, 429):
+            res = self.request.post("/api/quizzes/sessions", json={})
+            self.assertEqual(res.status_code, status_code)
+        self.assertEqual(self._create_quiz().status_code, 201)
+
+        # Without an answer from Redis requests are denied
+        class BrokenRedis(FakeRedis):
+            def transaction(self, func, *watches, **kwargs):
+                raise ConnectionError("Redis is down")
+
+        limiter = RedisTokenBucketLimiter(BrokenRedis(), rate=1, burst=2)
+        self.app.rate_limiter = limiter
+        self.assertEqual(self._create_quiz().status_code, 429)
+        self.assertEqual(limiter.errors, 1)
+
+        # Behind a trusted proxy the entry it appended is the client address,
+        # the ones before it are chosen by the client
+        self.app.config["RATE_LIMIT_TRUST_PROXY"] = True
+        self.app.rate_limiter = TokenBucketLimiter(rate=1, burst=1)
+
+        def quiz(forwarded_for):
+            return self.request.post(
+                "/api/quizzes",
+                json={},
+                headers={"X-Forwarded-For": forwarded_for},
+            ).status_code
+
+        self.assertEqual(quiz("1.1.1.1, 10.0.0.3"), 201)
+        self.assertEqual(quiz("2.2.2.2, 10.0.0.3"), 429)
+        self.assertEqual(quiz("10.0.0.4"), 201)
+        self.app.config["RATE_LIMIT_TRUST_PROXY"] = 2
+        self.assertEqual(quiz("1.1.1.1, 10.0.0.3"), 201)
+        self.assertEqual(quiz("1.1.1.1, 10.0.0.5"), 429)
+
+    def test_read_replica_routing(self):
+        self._create_mock_questions()
+        with self.app.app_context():
+            primary_path = db.engine.url.database
+        directory = tempfile.mkdtemp()
+        replica_path = os.path.join(directory, "replica.db")
+        shutil.copy(primary_path, replica_path)
+        try:
+            # The second replica can not be opened and leaves the rotation
+            self.app.replicas = ReplicaRouter(
+                db,
+                [
+                    create_engine("sqlite:///{}".format(replica_path)),
+                    create_engine("sqlite:///{}/missing/replica.db".format(directory)),
+                ],
+            )
+            writer = self.client()
+            res = writer.post(
+                "/api/questions",
+                json=dict(
+                    question="question 7", answer="answer 7", difficulty=1, category_id=1
+                ),
+            )
+            self.assertEqual(res.status_code, 201)
+            self.assertIn("trivia_primary=", res.headers["Set-Cookie"])
+            # The writer reads its own write from the primary
+            data = json.loads(writer.get("/api/questions").data)
+            self.assertEqual(data["total_questions"], len(QUESTIONS_MOCK) + 1)
+            # Other clients read the replica, which did not get it
+            for _ in range(3):
+                data = self._get_questions()
+                self.assertEqual(data["total_questions"], len(QUESTIONS_MOCK))
+            self.assertEqual(
+                [replica["up"] for replica in self.app.replicas.status()],
+                [True, False],
+            )
+        finally:
+            shutil.rmtree(directory)
+
+    def test_server_timing(self):
+        self.app.config["SERVER_TIMING"] = True
+        self._create_mock_questions()
+        res = self.request.get("/api/questions")
+        timing = res.headers["Server-Timing"]
+        for stage in ("parse", "db", "serialize", "total"):
+            self.assertIn("{};dur=".format(stage), timing)
+
+        # Statements that fail are timed too, and leave no start behind
+        with self.app.test_request_context():
+            self.app.preprocess_request()
+            with self.assertRaises(Exception):
+                db.session.execute("SELECT * FROM missing_table")
+            self.assertEqual(g.profile_start, [])
+            self.assertGreater(g.timings["db"], 0)
+
+    def test_sampled_profiles_report(self):
+        directory = tempfile.mkdtemp()
+        self.app.config["PROFILE_SAMPLE_RATE"] = 1
+        self.app.config["PROFILE_DIR"] = directory
+        try:
+            self._get_categories()
+            self._get_questions()
+            self.assertEqual(len(os.listdir(directory)), 2)
+            result = self.app.test_cli_runner().invoke(
+                args=["profile_report", "--top", "5"]
+            )
+        finally:
+            shutil.rmtree(directory)
+        self.assertIn("GET get_questions (1 captures)", result.output)
+        self.assertIn("GET get_categories (1 captures)", result.output)
+
     """
     Test questions
     """
@@ -133,6 +527,354 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data.get("total_questions"), 0)
         self.assertEqual(data.get("current_category"), None)
 
+    def _create_mock_questions(self):
+        for category in CATEGORIES_MOCK:
+            self._create_category(type=category.type)
+        for question in QUESTIONS_MOCK:
+            self._create_question(question)
+
+    def test_get_questions_query_count(self):
+        self._create_mock_questions()
+        # Warm up the category cache
+        self._get_questions()
+        # The ETag versions, the page (categories of the listed questions
+        # are loaded by the same query) and the question_counts total
+        with self.assertNumQueries(3):
+            data = self._get_questions()
+        self.assertEqual(data["questions"][0]["category"]["id"], 1)
+
+        with self.assertNumQueries(3):
+            self.request.get("/api/questions?pagination=cursor&include_count=1")
+
+    def test_compiled_serializer_matches_marshmallow(self):
+        schema = QuestionCollectionSchema()
+        serializer = compile_schema(schema)
+        for type, answer in (("Geography", 'said "hi\x7f"'), ("Géographie", "Ça")):
+            category = Category(type=type)
+            category.id = 1
+            question = Question(
+                question="question", answer=answer, difficulty=2, category_id=1
+            )
+            question.id = 1
+            question.category = category
+            data = {
+                "questions": [question, Question("q", None, 1, None)],
+                "total_questions": 2,
+                "categories": [category.format()],
+                "current_category": 1,
+            }
+            with self.app.test_request_context():
+                fast = json_response(serializer(data)).get_data()
+                slow = jsonify(schema.dump(data)).get_data()
+            self.assertEqual(fast, slow)
+
+    def test_get_questions_etag(self):
+        self._create_mock_questions()
+        res = self.request.get("/api/questions")
+        etag = res.headers["ETag"]
+        self.assertIn("s-maxage=", res.headers["Cache-Control"])
+
+        # Only the table versions are read to answer a conditional request
+        with self.assertNumQueries(1):
+            res = self.request.get("/api/questions", headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b"")
+
+        res = self.request.get("/api/questions?page=2", headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 200)
+
+        # Writes change the ETag
+        self._create_question(QUESTIONS_MOCK[0])
+        res = self.request.get("/api/questions", headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers["ETag"], etag)
+        self.assertEqual(json.loads(res.data)["total_questions"], len(QUESTIONS_MOCK) + 1)
+
+    def test_get_categories_etag(self):
+        self._create_category(type="Places")
+        res = self.request.get("/api/categories")
+        etag = res.headers["ETag"]
+        res = self.request.get("/api/categories", headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 304)
+        self._create_category(type="Animals")
+        res = self.request.get("/api/categories", headers={"If-None-Match": etag})
+        self.assertEqual(len(json.loads(res.data)), 2)
+
+    def test_get_questions_second_page(self):
+        self._create_mock_questions()
+        res = self.request.get("/api/questions?page=2&limit=4")
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual([q["id"] for q in data["questions"]], [5, 6])
+        self.assertEqual(data["total_questions"], len(QUESTIONS_MOCK))
+
+    def test_get_questions_cursor(self):
+        self._create_mock_questions()
+        res = self.request.get("/api/questions?pagination=cursor&limit=4")
+        data = json.loads(res.data)
+        self.assertEqual([q["id"] for q in data["questions"]], [1, 2, 3, 4])
+        self.assertNotIn("total_questions", data)
+
+        res = self.request.get(
+            "/api/questions?after={}&limit=4&include_count=true".format(
+                data["next_cursor"]
+            )
+        )
+        data = json.loads(res.data)
+        self.assertEqual([q["id"] for q in data["questions"]], [5, 6])
+        self.assertEqual(data["total_questions"], len(QUESTIONS_MOCK))
+        self.assertIsNone(data["next_cursor"])
+
+        for limit in ("0", "-1", "101", "ten"):
+            res = self.request.get(
+                "/api/questions?pagination=cursor&limit={}".format(limit)
+            )
+            self.assertEqual(res.status_code, 400)
+        res = self.request.get("/api/questions?limit=100")
+        self.assertEqual(len(json.loads(res.data)["questions"]), 6)
+
+    def test_get_category_questions_cursor(self):
+        self._create_mock_questions()
+        res = self.request.get("/api/categories/1/questions?pagination=cursor&limit=1")
+        data = json.loads(res.data)
+        self.assertEqual([q["id"] for q in data["questions"]], [1])
+
+        cursor = data["next_cursor"]
+        res = self.request.get("/api/categories/1/questions?after={}".format(cursor))
+        data = json.loads(res.data)
+        self.assertEqual([q["id"] for q in data["questions"]], [2])
+
+        # A cursor only makes sense for the listing that issued it
+        res = self.request.get("/api/categories/2/questions?after={}".format(cursor))
+        self.assertEqual(res.status_code, 400)
+
+    def test_get_questions_invalid_cursor(self):
+        res = self.request.get("/api/questions?after=invalid")
+        self.assertEqual(res.status_code, 400)
+
+    def test_import_questions_ndjson(self):
+        self._create_category(type="Places")
+        lines = [
+            json.dumps(dict(question="q1", answer="a1", difficulty=1, category_id=1)),
+            "not json",
+            json.dumps(dict(question="q2", answer="a2", difficulty=2, category_id=9)),
+            "",
+            json.dumps(dict(question="q3", answer="a3", difficulty=3, category_id=1)),
+            json.dumps(dict(question="q4", test="test")),
+        ]
+        res = self.request.post(
+            "/api/questions/bulk?chunk_size=2",
+            data="\n".join(lines),
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(res.status_code, 201)
+        data = json.loads(res.data)
+        self.assertEqual(data["inserted"], 2)
+        self.assertEqual(data["failed"], 3)
+        self.assertEqual([error["row"] for error in data["errors"]], [2, 3, 6])
+        self.assertEqual(
+            data["errors"][1]["messages"],
+            {"category_id": ["Category not found with id 9"]},
+        )
+        self.assertEqual(data["errors"][2]["messages"]["test"], ["Unknown field."])
+        self.assertEqual(self._get_questions()["total_questions"], 2)
+
+        for chunk_size in (0, 10001):
+            res = self.request.post(
+                "/api/questions/bulk?chunk_size={}".format(chunk_size),
+                data=lines[0],
+                content_type="application/x-ndjson",
+            )
+            self.assertEqual(res.status_code, 400)
+
+    def test_import_questions_csv(self):
+        self._create_category(type="Places")
+        body = "question,answer,difficulty,category_id\nq1,a1,1,1\nq2,a2,two,1\n"
+        res = self.request.post(
+            "/api/questions/bulk", data=body, content_type="text/csv"
+        )
+        data = json.loads(res.data)
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual(data["errors"][0]["row"], 3)
+        self.assertIn("difficulty", data["errors"][0]["messages"])
+
+    def test_import_questions_aliases(self):
+        self._create_category(type="Places")
+        line = dict(
+            question="q1", answer="Paris", aliases=["Lutetia"], difficulty=1, category_id=1
+        )
+        res = self.request.post(
+            "/api/questions/bulk",
+            data=json.dumps(line),
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(json.loads(res.data)["inserted"], 1)
+        body = "question,answer,aliases,difficulty,category_id\nq2,Rome,Roma|Urbs,1,1\n"
+        res = self.request.post(
+            "/api/questions/bulk", data=body, content_type="text/csv"
+        )
+        self.assertEqual(json.loads(res.data)["inserted"], 1)
+        self.assertTrue(self._grade(1, "lutetia"))
+        self.assertTrue(self._grade(2, "roma"))
+        self.assertTrue(self._grade(2, "urbs"))
+        self.assertFalse(self._grade(1, "roma"))
+
+        # The statements of a bulk insert do not grow with its rows, rows
+        # with the same columns get their ids in order
+        rows = [
+            dict(question="q", answer="a", aliases=[alias], category_id=1, difficulty=1)
+            for alias in ("first", "second", "third")
+        ]
+        with self.app.app_context():
+            with self.assertNumQueries(5):
+                QuestionRepository().bulk_insert(rows)
+        for id, alias in enumerate(("first", "second", "third"), start=3):
+            self.assertTrue(self._grade(id, alias))
+
+    def test_bulk_insert_ids_follow_values(self):
+        # RETURNING rows may come back in any order
+        table = Question.__table__
+        keys = [table.c.question, table.c.answer]
+        rows = [dict(question="q", answer=answer) for answer in ("a", "b", "a")]
+        inserted = [(7, "q", "b"), (8, "q", "a"), (6, "q", "a")]
+        ids = QuestionRepository()._match_ids(rows, keys, inserted)
+        self.assertEqual(ids, [6, 7, 8])
+
+    def test_import_questions_cli(self):
+        self._create_category(type="Places")
+        path = os.path.join(self.app.root_path, "import_test.jsonl")
+        with open(path, "w") as file:
+            for n in range(5):
+                row = dict(question="q", answer="a", difficulty=1, category_id=1)
+                file.write(json.dumps(row) + "\n")
+        try:
+            result = self.app.test_cli_runner().invoke(
+                args=["import_questions", path, "--chunk-size", "2"]
+            )
+        finally:
+            os.remove(path)
+        self.assertIn("5 questions imported, 0 rows failed", result.output)
+
+    def test_export_questions(self):
+        self._create_mock_questions()
+        res = self.request.get("/api/questions/export?category=1")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual([row["id"] for row in rows], [1, 2])
+        self.assertEqual(rows[0]["question"], QUESTIONS_MOCK[0].question)
+        for category in ("x", "0", str(2 ** 31)):
+            res = self.request.get("/api/questions/export?category=" + category)
+            self.assertEqual(res.status_code, 400)
+
+        res = self.request.get("/api/questions/export?format=csv")
+        lines = res.data.decode().splitlines()
+        self.assertEqual(lines[0], "id,question,answer,category_id,difficulty")
+        self.assertEqual(len(lines), len(QUESTIONS_MOCK) + 1)
+
+        # Exports can be imported back
+        res = self.request.post(
+            "/api/questions/bulk", data=res.data, content_type="text/csv"
+        )
+        self.assertEqual(json.loads(res.data)["inserted"], len(QUESTIONS_MOCK))
+
+    def test_search_questions(self):
+        self._create_category(type="Places")
+        for question, answer in (
+            ("What is the tallest mountain?", "Everest"),
+            ("Which river is the longest?", "Nile"),
+            ("What is the capital of Italy?", "Rome"),
+        ):
+            self._create_question(
+                Question(question=question, answer=answer, difficulty=1, category_id=1)
+            )
+
+        res = self.request.get("/api/questions?search_term=tall")
+        data = json.loads(res.data)
+        self.assertEqual([q["answer"] for q in data["questions"]], ["Everest"])
+        self.assertEqual(data["total_questions"], 1)
+
+        # Every word must match, answers are searched too
+        res = self.request.get("/api/questions?search_term=what%20ita")
+        data = json.loads(res.data)
+        self.assertEqual([q["answer"] for q in data["questions"]], ["Rome"])
+        res = self.request.get("/api/questions?search_term=nile")
+        data = json.loads(res.data)
+        self.assertEqual([q["id"] for q in data["questions"]], [2])
+
+    def test_question_stats(self):
+        self._create_mock_questions()
+        res = self.request.delete("/api/questions/2")
+        self.assertEqual(res.status_code, 202)
+        with self.app.app_context():
+            self.app.services.questions.question_repository.bulk_insert(
+                [dict(question="q", answer="a", category_id=1, difficulty=None)]
+            )
+        res = self.request.get("/api/stats")
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertEqual(data["total_questions"], len(QUESTIONS_MOCK))
+        self.assertEqual(data["categories"][0]["total_questions"], 2)
+        self.assertEqual(
+            data["categories"][0]["difficulties"],
+            [
+                {"difficulty": None, "total_questions": 1},
+                {"difficulty": 1, "total_questions": 1},
+            ],
+        )
+        self.assertEqual(
+            data["difficulties"][:2],
+            [
+                {"difficulty": None, "total_questions": 1},
+                {"difficulty": 1, "total_questions": 2},
+            ],
+        )
+        self.assertEqual(self._get_questions()["total_questions"], len(QUESTIONS_MOCK))
+
+        # Drift from a write made outside the repositories is corrected
+        with self.app.app_context():
+            db.session.execute("UPDATE question_counts SET count = 10")
+            db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=["reconcile_question_counts"])
+        self.assertIn("7 question counts corrected", result.output)
+        data = json.loads(self.request.get("/api/stats").data)
+        self.assertEqual(data["total_questions"], len(QUESTIONS_MOCK))
+
+    def test_bulk_update_and_delete_questions(self):
+        self._create_mock_questions()
+        self.assertEqual(self._create_quiz(quiz_category=1).status_code, 201)
+        res = self.request.patch(
+            "/api/questions",
+            json={"filter": {"category_id": 1}, "values": {"category_id": 2}},
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data), {"updated": 2})
+        res = self.request.get("/api/categories/2/questions")
+        self.assertEqual(json.loads(res.data)["total_questions"], 3)
+        # The quiz id index and the counters follow the moved questions
+        self.assertEqual(self._create_quiz(quiz_category=1).status_code, 404)
+        stats = json.loads(self.request.get("/api/stats").data)
+        self.assertEqual(stats["categories"][0]["total_questions"], 0)
+
+        res = self.request.delete("/api/questions", json={"ids": [1, 3, 100]})
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(json.loads(res.data), {"deleted": 2})
+        self.assertEqual(self._get_questions()["total_questions"], 4)
+
+        with self.app.app_context():
+            repository = self.app.services.questions.question_repository
+            question = repository.update(4, answer="updated")
+            self.assertEqual(question.answer, "updated")
+            self.assertEqual(repository.get(5).answer, "answer 5")
+
+        for body in [{}, {"filter": {}}, {"ids": [1], "filter": {"category_id": 1}}]:
+            res = self.request.delete("/api/questions", json=body)
+            self.assertEqual(res.status_code, 400)
+        res = self.request.patch(
+            "/api/questions", json={"ids": [2], "values": {"category_id": 100}}
+        )
+        self.assertEqual(res.status_code, 404)
+
     def test_create_question_category_does_not_exists(self):
         INVALID_ID = 100
         res = self._create_question(
@@ -220,8 +962,340 @@ class TriviaTestCase(unittest.TestCase):
             # Validate response=
             self.assertNotIn(data["id"], previous_questions)
             self.assertEqual(data["category"]["id"], 1)
+            # Answers are graded on the server, they are not sent to players
+            self.assertNotIn("answer", data)
             previous_questions.append(data["id"])
 
+    def test_get_quiz_last_question_left(self):
+        for category in CATEGORIES_MOCK:
+            self._create_category(type=category.type)
+        for question in QUESTIONS_MOCK:
+            self._create_question(question)
+
+        # Category 1 holds questions 1 and 2, only 2 is still eligible
+        for n in range(5):
+            res = self._create_quiz(previous_questions=[1], quiz_category=1)
+            self.assertEqual(res.status_code, 201)
+            self.assertEqual(json.loads(res.data)["id"], 2)
+
+        res = self._create_quiz(previous_questions=[1, 2], quiz_category=1)
+        self.assertEqual(res.status_code, 404)
+
+    def test_quiz_question_index(self):
+        self._create_mock_questions()
+        self._create_quiz(quiz_category=1)
+
+        # Once the id index is loaded a turn is a single primary key lookup
+        with self.assertNumQueries(1):
+            res = self._create_quiz(previous_questions=[1], quiz_category=1)
+        self.assertEqual(json.loads(res.data)["id"], 2)
+
+        # Writes of this process update the index in place
+        self.request.delete("/api/questions/2")
+        index = self.app.services.questions.question_repository.id_index
+        with self.app.app_context():
+            with self.assertNumQueries(0):
+                self.assertEqual(list(index.ids(db.session, 1)), [1])
+
+            # Writes of other processes are seen once the version is checked
+            QuestionRepository().bulk_insert(
+                [dict(question="q", answer="a", difficulty=1, category_id=1)]
+            )
+            self.assertEqual(list(index.ids(db.session, 1)), [1])
+            index._checked_at = 0
+            self.assertEqual(list(index.ids(db.session, 1)), [1, 7])
+            self.assertEqual(len(index.ids(db.session)), 6)
+
+            # Ids already indexed, or without a category, are indexed once
+            version = index.version
+            index.add(7, 1, 1, version + 1)
+            index.add(8, None, 1, version + 2)
+            self.assertEqual(list(index.ids(db.session, 1)), [1, 7])
+            self.assertEqual(list(index.ids(db.session)).count(8), 1)
+
+        # A write following another process' one reloads the index
+        self.request.post(
+            "/api/questions",
+            json=dict(question="q", answer="a", difficulty=1, category_id=1),
+        )
+        self.assertIsNone(index.version)
+        with self.app.app_context():
+            self.assertEqual(list(index.ids(db.session, 1)), [1, 7, 8])
+            (version,) = TableVersion.current(db.session, ["questions"])
+            self.assertEqual(index.version, version)
+        self.request.delete("/api/questions/8")
+        self.assertEqual(index.version, version + 1)
+        with self.app.app_context():
+            with self.assertNumQueries(0):
+                self.assertEqual(list(index.ids(db.session, 1)), [1, 7])
+
+    def test_quiz_difficulty(self):
+        self._create_mock_questions()
+
+        def quiz(**body):
+            res = self.request.post("/api/quizzes", json=body)
+            return res.status_code, json.loads(res.data)
+
+        status, data = quiz(difficulty=5)
+        self.assertEqual(data["id"], 2)
+        status, data = quiz(min_difficulty=1, max_difficulty=1, previous_questions=[1])
+        self.assertEqual(data["id"], 5)
+        status, data = quiz(difficulty=5, previous_questions=[2])
+        self.assertEqual(status, 404)
+        status, data = quiz(min_difficulty=4, max_difficulty=2)
+        self.assertEqual(status, 400)
+
+        # Adaptive turns follow the share of correct answers
+        status, data = quiz(adaptive=True, previous_questions=[1, 3, 4], score=3)
+        self.assertEqual(data["id"], 2)
+        status, data = quiz(adaptive=True, previous_questions=[1, 2, 3], score=0)
+        self.assertEqual(data["id"], 5)
+        # and widen around the target once its band is exhausted
+        status, data = quiz(adaptive=True, previous_questions=[2], score=1)
+        self.assertEqual(data["id"], 4)
+
+    def test_quiz_round(self):
+        self._create_mock_questions()
+        # Loading the id index (version and ids), then a single IN query
+        with self.assertNumQueries(3):
+            res = self.request.post(
+                "/api/quizzes/round",
+                json=dict(quiz_category=0, previous_questions=[1, 2], count=3),
+            )
+        self.assertEqual(res.status_code, 201)
+        data = json.loads(res.data)
+        ids = [question["id"] for question in data["questions"]]
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(len(set(ids)), 3)
+        self.assertFalse(set(ids) & {1, 2})
+
+        # Only what is left is returned, then the game is over
+        res = self.request.post(
+            "/api/quizzes/round", json=dict(quiz_category=1, previous_questions=[1])
+        )
+        data = json.loads(res.data)
+        self.assertEqual([question["id"] for question in data["questions"]], [2])
+        self.assertNotIn("answer", data["questions"][0])
+        self.assertEqual(data["quiz_category"], 1)
+        res = self.request.post(
+            "/api/quizzes/round", json=dict(quiz_category=1, previous_questions=[1, 2])
+        )
+        self.assertEqual(res.status_code, 404)
+
+        res = self.request.post("/api/quizzes/round", json=dict(count=0))
+        self.assertEqual(res.status_code, 400)
+
+    def _play_quiz_session(self, quiz_category):
+        for category in CATEGORIES_MOCK:
+            self._create_category(type=category.type)
+        for question in QUESTIONS_MOCK:
+            self._create_question(question)
+
+        res = self.request.post(
+            "/api/quizzes/sessions", json=dict(quiz_category=quiz_category)
+        )
+        self.assertEqual(res.status_code, 201)
+        session = json.loads(res.data)
+        questions = []
+        for n in range(session["total_questions"]):
+            res = self.request.post(
+                "/api/quizzes/sessions/{}/next".format(session["session_id"])
+            )
+            self.assertEqual(res.status_code, 201)
+            questions.append(json.loads(res.data))
+        res = self.request.post(
+            "/api/quizzes/sessions/{}/next".format(session["session_id"])
+        )
+        self.assertEqual(res.status_code, 404)
+        data = json.loads(res.data)
+        self.assertEqual(data["message"], "No questions left, game is over.")
+        return questions
+
+    def _grade(self, question_id, guess, **kwargs):
+        res = self.request.post(
+            "/api/quizzes/grade",
+            json=dict(question_id=question_id, guess=guess, **kwargs),
+        )
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.data)["correct"]
+
+    def test_grade_answers(self):
+        self._create_mock_questions()
+        res = self.request.post(
+            "/api/questions",
+            json=dict(
+                question="Who discovered penicillin?",
+                answer="Alexander Fleming",
+                aliases=["Sir Alexander Fleming"],
+                difficulty=3,
+                category_id=1,
+            ),
+        )
+        id = json.loads(res.data)["id"]
+        for guess in ["  alexander FLEMING!", "fleming", "Sir Alexander Fleming"]:
+            self.assertTrue(self._grade(id, guess))
+        self.assertFalse(self._grade(id, "Alexandre Flemming"))
+        self.assertTrue(self._grade(id, "Alexandre Flemming", fuzzy=True))
+        self.assertFalse(self._grade(id, ""))
+
+        # A whole round is graded with one query
+        answers = [
+            {"question_id": id, "guess": "Fleming"},
+            {"question_id": 1, "guess": "Answer 1."},
+            {"question_id": 2, "guess": "wrong"},
+        ]
+        with self.assertNumQueries(1):
+            res = self.request.post("/api/quizzes/grade", json={"answers": answers})
+        data = json.loads(res.data)
+        self.assertEqual(data["score"], 2)
+        self.assertEqual(
+            [result["correct"] for result in data["results"]], [True, True, False]
+        )
+        self.assertEqual(data["results"][2]["answer"], "answer 2")
+
+        # Forms follow bulk inserts, answer updates and deletes
+        with self.app.app_context():
+            QuestionRepository().bulk_insert(
+                [dict(question="q", answer="The Liver", category_id=2, difficulty=4)]
+            )
+        self.assertTrue(self._grade(id + 1, "liver"))
+        res = self.request.patch(
+            "/api/questions", json={"ids": [id], "values": {"answer": "Blood"}}
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(self._grade(id, "blood"))
+        self.assertFalse(self._grade(id, "fleming"))
+        self.request.delete("/api/questions/{}".format(id))
+        res = self.request.post("/api/quizzes/grade", json={"answers": answers})
+        self.assertEqual(res.status_code, 404)
+        res = self.request.post("/api/quizzes/grade", json={"question_id": 1})
+        self.assertEqual(res.status_code, 400)
+
+        # Forms belong to the inserted row, even with the same question text
+        for alias in ("Paris", "Lutetia"):
+            self.request.post(
+                "/api/questions",
+                json=dict(
+                    question="Capital of France?",
+                    answer="!!!",
+                    aliases=[alias],
+                    difficulty=1,
+                    category_id=1,
+                ),
+            )
+        self.assertTrue(self._grade(id + 2, "paris"))
+        self.assertFalse(self._grade(id + 2, "lutetia"))
+        self.assertTrue(self._grade(id + 3, "lutetia"))
+
+        # Questions missing their forms are graded against their answer
+        with self.app.app_context():
+            db.session.execute("DELETE FROM answer_forms")
+            db.session.commit()
+        self.assertTrue(self._grade(1, "Answer 1"))
+        result = self.app.test_cli_runner().invoke(args=["backfill_answer_forms"])
+        self.assertIn("Answer forms stored for 9 questions", result.output)
+        self.assertTrue(self._grade(1, "answer 1"))
+
+    def _submit_result(self, player, score, total=5, quiz_category=1):
+        return self.request.post(
+            "/api/quizzes/results",
+            json=dict(
+                player=player, score=score, total=total, quiz_category=quiz_category
+            ),
+        )
+
+    def test_quiz_results_leaderboard(self):
+        self._create_mock_questions()
+        results = self.app.quiz_results
+        results.interval = 60
+        for player, score in [("ana", 3), ("bob", 5), ("cy", 4)]:
+            res = self._submit_result(player, score)
+            self.assertEqual(res.status_code, 202)
+        self.assertEqual(json.loads(res.data)["player"], "cy")
+        self.assertEqual(self._submit_result("dee", 5, quiz_category=2).status_code, 202)
+        res = self.request.get("/api/leaderboard?category=1")
+        self.assertEqual(json.loads(res.data)["results"], [])
+
+        # One insert for the whole batch, plus the table version
+        with self.assertNumQueries(2) as statements:
+            results.flush()
+        self.assertIn("ON CONFLICT", statements[1])
+        res = self.request.get("/api/leaderboard?category=1&limit=2")
+        data = json.loads(res.data)
+        self.assertEqual(data["quiz_category"], 1)
+        self.assertEqual(
+            [(result["player"], result["score"]) for result in data["results"]],
+            [("bob", 5), ("cy", 4)],
+        )
+        for limit in (0, 11):
+            res = self.request.get("/api/leaderboard?limit={}".format(limit))
+            self.assertEqual(res.status_code, 400)
+
+        # Full batches are flushed by the background thread
+        results.max_size = 2
+        self._submit_result("eve", 6, total=10)
+        self._submit_result("fay", 1)
+        deadline = time.monotonic() + 5
+        while results.flushed < 6 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(results.flushed, 6)
+        res = self.request.get("/api/leaderboard?category=1")
+        data = json.loads(res.data)
+        self.assertEqual(
+            [result["player"] for result in data["results"]],
+            ["eve", "bob", "cy", "ana", "fay"],
+        )
+
+        self.assertEqual(self._submit_result("gus", 6).status_code, 400)
+        self.assertEqual(self._submit_result("gus", 1, quiz_category=100).status_code, 404)
+        results.max_pending = 0
+        self.assertEqual(self._submit_result("gus", 1).status_code, 503)
+
+    def test_quiz_session_category_1(self):
+        questions = self._play_quiz_session(quiz_category=1)
+        self.assertEqual(sorted(q["id"] for q in questions), [1, 2])
+
+    def test_quiz_session_redis_store(self):
+        self.app.quiz_sessions = RedisSessionStore(FakeRedis())
+        questions = self._play_quiz_session(quiz_category=0)
+        self.assertEqual(
+            sorted(q["id"] for q in questions), list(range(1, len(QUESTIONS_MOCK) + 1))
+        )
+
+    def test_migrations_build_the_models(self):
+        with self.app.app_context():
+            inspector = inspect(db.engine)
+            for table in db.Model.metadata.sorted_tables:
+                columns = inspector.get_columns(table.name)
+                self.assertEqual(
+                    set(column["name"] for column in columns), set(table.c.keys())
+                )
+                indexes = inspector.get_indexes(table.name)
+                self.assertEqual(
+                    set(index["name"] for index in indexes),
+                    set(index.name for index in table.indexes),
+                )
+
+        # Migrations keep the schema of their version, whatever the models
+        engine = create_engine("sqlite://")
+        with engine.begin() as connection:
+            migrations.create_tables(connection)
+        self.assertEqual(inspect(engine).get_indexes("questions"), [])
+
+    def test_quiz_session_deck_size(self):
+        # Decks hold QUIZ_SESSION_DECK_SIZE distinct random questions at most
+        self.app.config["QUIZ_SESSION_DECK_SIZE"] = 4
+        questions = self._play_quiz_session(quiz_category=0)
+        ids = [q["id"] for q in questions]
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(len(set(ids)), 4)
+
+    def test_quiz_session_does_not_exist(self):
+        res = self.request.post("/api/quizzes/sessions/unknown/next")
+        self.assertEqual(res.status_code, 404)
+        data = json.loads(res.data)
+        self.assertEqual(data["message"], "Quiz session not found with id unknown")
+
     def test_get_quiz_category_does_not_exist(self):
         INVALID_ID = 100
         res = self._create_quiz(quiz_category=INVALID_ID)
@@ -230,7 +1304,107 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(
             data["message"], "Category not found with id {}".format(INVALID_ID)
         )
-        
+
+    def _asgi_request(self, asgi_app, method, path, body=None, query_string=b""):
+        """Drive asgi_app through one request, return (status, headers, body)"""
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "query_string": query_string,
+            "headers": [],
+            "client": ("127.0.0.1", 50000),
+        }
+        messages = [
+            {
+                "type": "http.request",
+                "body": json.dumps(body).encode() if body is not None else b"",
+            }
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(asgi_app(scope, receive, send))
+        return sent[0]["status"], dict(sent[0]["headers"]), sent[1]["body"]
+
+    def test_asgi_matches_flask_responses(self):
+        self._create_mock_questions()
+        asgi_app = create_asgi_app(self.app, max_workers=2)
+        for path, query_string in [
+            ("/api/categories", b""),
+            ("/api/categories/2", b""),
+            ("/api/questions", b"page=1&limit=4"),
+            ("/api/questions", b"pagination=cursor&limit=2"),
+            ("/api/questions", b"pagination=cursor&limit=0"),
+            ("/api/categories/1/questions", b""),
+        ]:
+            status, headers, body = self._asgi_request(
+                asgi_app, "GET", path, query_string=query_string
+            )
+            res = self.request.get(path, query_string=query_string)
+            self.assertEqual(status, res.status_code)
+            self.assertEqual(headers[b"content-type"], b"application/json")
+            self.assertEqual(body, res.data)
+
+    def test_asgi_create_question_and_quiz(self):
+        for category in CATEGORIES_MOCK:
+            self._create_category(type=category.type)
+        asgi_app = create_asgi_app(self.app, max_workers=2)
+        status, headers, body = self._asgi_request(
+            asgi_app,
+            "POST",
+            "/api/questions",
+            dict(question="question 1", answer="answer 1", difficulty=1, category_id=2),
+        )
+        self.assertEqual(status, 201)
+        question = json.loads(body)
+        self.assertEqual(question["category"]["id"], 2)
+
+        status, headers, body = self._asgi_request(
+            asgi_app, "POST", "/api/quizzes", dict(quiz_category=2)
+        )
+        self.assertEqual(status, 201)
+        answer = question.pop("answer")
+        self.assertEqual(json.loads(body), question)
+
+        # Legacy clients grading in the browser can opt in to the answers
+        self.app.config["QUIZ_INCLUDE_ANSWERS"] = True
+        status, headers, body = self._asgi_request(
+            create_asgi_app(self.app, max_workers=1),
+            "POST",
+            "/api/quizzes",
+            dict(quiz_category=2),
+        )
+        self.assertEqual(json.loads(body)["answer"], answer)
+
+        status, headers, body = self._asgi_request(
+            asgi_app,
+            "POST",
+            "/api/quizzes",
+            dict(quiz_category=2, previous_questions=[question["id"]]),
+        )
+        self.assertEqual(status, 404)
+        self.assertEqual(json.loads(body)["message"], "No questions left, game is over.")
+
+    def test_asgi_errors(self):
+        asgi_app = create_asgi_app(self.app, max_workers=2)
+        status, headers, body = self._asgi_request(asgi_app, "GET", "/api/unknown")
+        self.assertEqual(status, 404)
+        status, headers, body = self._asgi_request(asgi_app, "DELETE", "/api/categories")
+        self.assertEqual(status, 405)
+        status, headers, body = self._asgi_request(
+            asgi_app, "POST", "/api/questions", dict(test="test")
+        )
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body)["messages"]["test"], ["Unknown field."])
+        status, headers, body = self._asgi_request(asgi_app, "GET", "/api/categories/100")
+        self.assertEqual(status, 404)
+        self.assertEqual(json.loads(body)["message"], "Category not found with id 100")
 
 
 # Make the tests conveniently executable
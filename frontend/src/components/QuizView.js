@@ -11,12 +11,17 @@ class QuizView extends Component {
     this.state = {
       quizCategory: null,
       previousQuestions: [],
+      questions: [],
       showAnswer: false,
       categories: {},
       numCorrect: 0,
       currentQuestion: {},
       guess: '',
-      forceEnd: false
+      correct: false,
+      correctAnswer: '',
+      forceEnd: false,
+      player: '',
+      scoreSaved: false
     }
   }
 
@@ -36,25 +41,64 @@ class QuizView extends Component {
   }
 
   selectCategory = ({ id = 0 }) => {
-    this.setState({ quizCategory: id }, this.getNextQuestion)
+    this.setState({ quizCategory: id }, this.getRound)
   }
 
   handleChange = (event) => {
     this.setState({ [event.target.name]: event.target.value })
   }
 
+  getRound = () => {
+    $.ajax({
+      url: '/api/quizzes/round',
+      type: "POST",
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({
+        previous_questions: this.state.previousQuestions,
+        quiz_category: this.state.quizCategory,
+        count: questionsPerPlay
+      }),
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true,
+      success: (result) => {
+        this.setState({ questions: result.questions }, this.getNextQuestion)
+        return;
+      },
+      error: (error) => {
+        alert('Unable to load questions. Please try your request again')
+        return;
+      }
+    })
+  }
+
   getNextQuestion = () => {
     const previousQuestions = [...this.state.previousQuestions]
     if (this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
+    const [currentQuestion = {}, ...questions] = this.state.questions
 
+    this.setState({
+      showAnswer: false,
+      previousQuestions: previousQuestions,
+      questions: questions,
+      currentQuestion: currentQuestion,
+      guess: '',
+      forceEnd: currentQuestion.question ? false : true
+    })
+  }
+
+  submitGuess = (event) => {
+    event.preventDefault();
     $.ajax({
-      url: '/api/quizzes',
+      url: '/api/quizzes/grade',
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
       data: JSON.stringify({
-        previous_questions: previousQuestions,
-        quiz_category: this.state.quizCategory
+        question_id: this.state.currentQuestion.id,
+        guess: this.state.guess
       }),
       xhrFields: {
         withCredentials: true
@@ -62,28 +106,45 @@ class QuizView extends Component {
       crossDomain: true,
       success: (result) => {
         this.setState({
-          showAnswer: false,
-          previousQuestions: previousQuestions,
-          currentQuestion: result,
-          guess: '',
-          forceEnd: result.question ? false : true
+          numCorrect: !result.correct ? this.state.numCorrect : this.state.numCorrect + 1,
+          correct: result.correct,
+          correctAnswer: result.answer,
+          showAnswer: true,
         })
         return;
       },
       error: (error) => {
-        alert('Unable to load question. Please try your request again')
+        alert('Unable to check your answer. Please try your request again')
         return;
       }
     })
   }
 
-  submitGuess = (event) => {
+  saveScore = (event) => {
     event.preventDefault();
-    const formatGuess = this.state.guess.replace(/[.,\/#!$%\^&\*;:{}=\-_`~()]/g, "").toLowerCase()
-    let evaluate = this.evaluateAnswer()
-    this.setState({
-      numCorrect: !evaluate ? this.state.numCorrect : this.state.numCorrect + 1,
-      showAnswer: true,
+    $.ajax({
+      url: '/api/quizzes/results',
+      type: "POST",
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({
+        player: this.state.player,
+        quiz_category: this.state.quizCategory,
+        score: this.state.numCorrect,
+        total: this.state.previousQuestions.length
+      }),
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true,
+      success: (result) => {
+        this.setState({ scoreSaved: true })
+        return;
+      },
+      error: (error) => {
+        alert('Unable to save your score. Please try your request again')
+        return;
+      }
     })
   }
 
@@ -91,11 +152,13 @@ class QuizView extends Component {
     this.setState({
       quizCategory: null,
       previousQuestions: [],
+      questions: [],
       showAnswer: false,
       numCorrect: 0,
       currentQuestion: {},
       guess: '',
-      forceEnd: false
+      forceEnd: false,
+      scoreSaved: false
     })
   }
 
@@ -125,25 +188,24 @@ class QuizView extends Component {
     return (
       <div className="quiz-play-holder">
         <div className="final-header"> Your Final Score is {this.state.numCorrect}</div>
+        {this.state.previousQuestions.length > 0 && !this.state.scoreSaved ? (
+          <form onSubmit={this.saveScore}>
+            <input type="text" name="player" value={this.state.player} onChange={this.handleChange} />
+            <input className="submit-guess button" type="submit" value="Save Score" />
+          </form>
+        ) : null}
         <div className="play-again button" onClick={this.restartGame}> Play Again? </div>
       </div>
     )
   }
 
-  evaluateAnswer = () => {
-    const formatGuess = this.state.guess.replace(/[.,\/#!$%\^&\*;:{}=\-_`~()]/g, "").toLowerCase()
-    const answerArray = this.state.currentQuestion.answer.toLowerCase().split(' ');
-    return answerArray.includes(formatGuess)
-  }
-
   renderCorrectAnswer() {
-    const formatGuess = this.state.guess.replace(/[.,\/#!$%\^&\*;:{}=\-_`~()]/g, "").toLowerCase()
-    let evaluate = this.evaluateAnswer()
+    let evaluate = this.state.correct
     return (
       <div className="quiz-play-holder">
         <div className="quiz-question">{this.state.currentQuestion.question}</div>
         <div className={`${evaluate ? 'correct' : 'wrong'}`}>{evaluate ? "You were correct!" : "You were incorrect"}</div>
-        <div className="quiz-answer">{this.state.currentQuestion.answer}</div>
+        <div className="quiz-answer">{this.state.correctAnswer}</div>
         <div className="next-question button" onClick={this.getNextQuestion}> Next Question </div>
       </div>
     )